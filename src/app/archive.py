@@ -0,0 +1,28 @@
+import os
+
+
+class CommentArchive:
+    # where archived comments live and which ones the archiver moves there
+    def __init__(
+            self,
+            path: str | os.PathLike | None,
+            rejected: bool,
+            after_days: int | None,
+            batch_size: int,
+    ):
+        self.configure(path, rejected, after_days, batch_size)
+
+    def configure(
+            self,
+            path: str | os.PathLike | None,
+            rejected: bool,
+            after_days: int | None,
+            batch_size: int,
+    ) -> None:
+        self.path = path
+        self.rejected = rejected
+        self.after_days = after_days
+        self.batch_size = batch_size
+
+
+comment_archive = CommentArchive(path=None, rejected=True, after_days=None, batch_size=500)
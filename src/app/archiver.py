@@ -0,0 +1,25 @@
+import asyncio
+import time
+
+from .archive import comment_archive
+from .db import prepare_db
+from .repositories import SqliteArchiveRepository
+from .settings import Settings
+
+ARCHIVE_INTERVAL = 60 * 60
+
+
+async def comment_archiver(settings: Settings):
+    archive_repo = SqliteArchiveRepository(db=prepare_db(settings))
+    while True:
+        older_than = None
+        if comment_archive.after_days is not None:
+            older_than = int(time.time()) - comment_archive.after_days * 24 * 60 * 60
+        while True:
+            # one transaction per batch, writers get the lock in between
+            moved = archive_repo.archive_comments(older_than, comment_archive.rejected, comment_archive.batch_size)
+            # logger.info(f'{len(moved)} comments archived')
+            if len(moved) < comment_archive.batch_size:
+                break
+            await asyncio.sleep(0)
+        await asyncio.sleep(ARCHIVE_INTERVAL)
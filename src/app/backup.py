@@ -0,0 +1,174 @@
+import asyncio
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock
+
+from .db import database_paths, sqlite_cm
+from .exceptions import NotConfiguredError
+from .schemas import BackupStatus
+from .settings import Settings
+
+
+# stepped copies restarted by writes in between, then the rest goes in one step
+MAX_RESTARTS = 3
+
+
+class BackupRunning(Exception): ...
+
+
+class BackupRestarted(Exception): ...
+
+
+class BackupJob:
+    # progress of one backup over the main database and its shards, read by the status endpoint
+    def __init__(self, paths: list[str | os.PathLike]):
+        self.paths = paths
+        self.stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        self.state = 'running'
+        self.started_at = time.time()
+        self.finished_at: float | None = None
+        self.current: str | None = None
+        self.pages_done = 0
+        self.pages_total = 0
+        self.bytes_copied = 0
+        self.files: list[str] = []
+        self.error: str | None = None
+
+    def status(self) -> BackupStatus:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return BackupStatus(
+            state=self.state,
+            started_at=int(self.started_at),
+            finished_at=None if self.finished_at is None else int(self.finished_at),
+            current=self.current,
+            pages_done=self.pages_done,
+            pages_total=self.pages_total,
+            bytes_copied=self.bytes_copied,
+            bytes_per_second=self.bytes_copied / elapsed if elapsed > 0 else None,
+            files=self.files,
+            error=self.error,
+        )
+
+
+class Backups:
+    # Online copies with the backup API. Pages go over in small steps with a pause after each,
+    # the source is locked only while a step runs, so writers get in between.
+    def __init__(
+            self,
+            directory: str | os.PathLike | None,
+            step_pages: int,
+            step_sleep: float,
+            compress: bool,
+            keep: int,
+    ):
+        self.lock = Lock()
+        self.job: BackupJob | None = None
+        self.configure(directory, step_pages, step_sleep, compress, keep)
+
+    def configure(
+            self,
+            directory: str | os.PathLike | None,
+            step_pages: int,
+            step_sleep: float,
+            compress: bool,
+            keep: int,
+    ) -> None:
+        self.directory = directory
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self.compress = compress
+        self.keep = keep
+
+    def begin(self, paths: list[str | os.PathLike]) -> BackupJob:
+        # one backup at a time, run() does the copying
+        if self.directory is None:
+            raise NotConfiguredError('Missing backup_dir in settings')
+        with self.lock:
+            if self.job is not None and self.job.state == 'running':
+                raise BackupRunning()
+            self.job = BackupJob(paths)
+            return self.job
+
+    def run(self, job: BackupJob) -> BackupJob:
+        try:
+            Path(self.directory).mkdir(parents=True, exist_ok=True)
+            for path in job.paths:
+                job.files.append(str(self._copy(job, path)))
+                self._prune(Path(path).stem)
+            job.state = 'done'
+        except Exception as err:
+            # logger.error(f'Backup failed. Says:\n{err}')
+            job.state = 'failed'
+            job.error = str(err)
+        job.current = None
+        job.finished_at = time.time()
+        return job
+
+    def _copy(self, job: BackupJob, path: str | os.PathLike) -> Path:
+        target = Path(self.directory) / f'{Path(path).stem}-{job.stamp}.sqlite'
+        # half written copies never carry the final name
+        unfinished = target.with_name(target.name + '.part')
+        job.current = str(path)
+        pages_before = job.pages_done
+        pages = self.step_pages
+        restarts = 0
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal restarts
+            done = pages_before + total - remaining
+            if status == sqlite3.SQLITE_OK and done <= job.pages_done:
+                # a write from another connection sent the copy back to the first page
+                restarts += 1
+                if restarts > MAX_RESTARTS and pages > 0:
+                    raise BackupRestarted()
+            job.pages_total = pages_before + total
+            job.pages_done = done
+            job.bytes_copied = done * page_size
+            if remaining:
+                # the backup API pauses on busy steps only
+                time.sleep(self.step_sleep)
+
+        with sqlite_cm(path) as source, sqlite_cm(unfinished) as copy:
+            page_size, = source.execute("PRAGMA page_size;").fetchone()
+            try:
+                source.backup(copy, pages=pages, progress=progress)
+            except BackupRestarted:
+                # writers would keep it from ever finishing, the rest locks them out once
+                pages = -1
+                source.backup(copy, pages=pages, progress=progress)
+        if self.compress:
+            target = target.with_name(target.name + '.gz')
+            packing = target.with_name(target.name + '.part')
+            with open(unfinished, 'rb') as raw, gzip.open(packing, 'wb', compresslevel=6) as packed:
+                shutil.copyfileobj(raw, packed)
+            unfinished.unlink()
+            unfinished = packing
+        os.replace(unfinished, target)
+        return target
+
+    def _prune(self, stem: str) -> None:
+        # timestamps in the names sort in time order
+        name = re.compile(rf'{re.escape(stem)}-\d{{8}}T\d{{6}}Z\.sqlite(\.gz)?')
+        copies = sorted(path for path in Path(self.directory).iterdir() if name.fullmatch(path.name))
+        for path in copies[:-self.keep]:
+            path.unlink()
+
+
+async def backup_scheduler(settings: Settings):
+    while True:
+        await asyncio.sleep(settings.backup_interval_hours * 60 * 60)
+        try:
+            job = backups.begin(database_paths(settings))
+        except BackupRunning:
+            # one started from the admin endpoint is still going
+            continue
+        await asyncio.to_thread(backups.run, job)
+
+
+backups = Backups(directory=None, step_pages=256, step_sleep=0.05, compress=False, keep=7)
@@ -0,0 +1,91 @@
+from threading import Event, Lock
+from typing import Any, Callable, Hashable
+
+from cachetools import TTLCache
+
+
+class _Flight:
+    def __init__(self):
+        self.done = Event()
+        self.stale = False
+        self.value: bytes | None = None
+        self.error: BaseException | None = None
+
+
+# LRU + TTL cache of serialized response bodies, bounded by their total size in bytes
+class ResponseCache:
+    def __init__(self, max_bytes: int, ttl: float):
+        self._lock = Lock()
+        self._entries = self._make_entries(max_bytes, ttl)
+        self._flights: dict[tuple[tuple[Hashable, Hashable], Any], _Flight] = {}
+        # representations cached per key, invalidating the key drops all of them
+        self._variants: dict[Hashable, set[Hashable]] = {}
+
+    @staticmethod
+    def _make_entries(max_bytes: int, ttl: float) -> TTLCache:
+        return TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=lambda entry: len(entry[1]))
+
+    def configure(self, max_bytes: int, ttl: float) -> None:
+        with self._lock:
+            self._entries = self._make_entries(max_bytes, ttl)
+            self._variants.clear()
+
+    def get_or_load(
+            self,
+            key: Hashable,
+            version: Any,
+            loader: Callable[[], bytes],
+            variant: Hashable = None,
+    ) -> bytes:
+        # entries keep the version they were built from, a mismatch counts as a miss
+        entry_key = (key, variant)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            # concurrent misses for the same key and version share one load
+            flight = self._flights.get((entry_key, version))
+            leader = flight is None
+            if leader:
+                flight = self._flights[entry_key, version] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[entry_key, version]
+                if flight.error is None and not flight.stale and len(flight.value) <= self._entries.maxsize:
+                    self._entries[entry_key] = (version, flight.value)
+                    self._variants.setdefault(key, set()).add(variant)
+            flight.done.set()
+        return flight.value
+
+    def peek(self, key: Hashable, version: Any, variant: Hashable = None) -> bytes | None:
+        # never waits for a load, a miss is for the caller to handle
+        with self._lock:
+            entry = self._entries.get((key, variant))
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        return None
+
+    def invalidate(self, *keys: Hashable) -> None:
+        with self._lock:
+            for key in keys:
+                for variant in self._variants.pop(key, ()):
+                    self._entries.pop((key, variant), None)
+            for ((key, _), _), flight in self._flights.items():
+                if key in keys:
+                    flight.stale = True
+
+
+POST = 'post'
+POST_COMMENTS = 'post_comments'
+
+response_cache = ResponseCache(max_bytes=32 * 1024 * 1024, ttl=60)
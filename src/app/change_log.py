@@ -0,0 +1,16 @@
+import asyncio
+import time
+
+from .db import prepare_db
+from .repositories import SqliteChangeRepository
+from .settings import Settings
+
+PRUNE_INTERVAL = 60 * 60
+
+
+async def change_log_pruner(settings: Settings):
+    change_repo = SqliteChangeRepository(db=prepare_db(settings))
+    while True:
+        pruned = change_repo.prune(int(time.time()) - settings.change_log_retention_days * 24 * 60 * 60)
+        # logger.info(f'{pruned} change log entries pruned')
+        await asyncio.sleep(PRUNE_INTERVAL)
@@ -1,46 +1,192 @@
 import os
-from queue import SimpleQueue
+import time
+from operator import itemgetter
+from queue import SimpleQueue, Empty
 from typing import Callable
 
 from transformers import pipeline
 
+from .cache import response_cache, POST, POST_COMMENTS
 from .db import sqlite_cm
+from .repositories.caching import comment_cache, post_cache
+from .repositories.shards import shards
+from .moderation import ModerationPipeline, ModerationTask
 from .schemas import CommentStatus
+from .verdicts import comment_verdicts
+
+
+def update_status(comment_id: int, status: CommentStatus, db_path: str | os.PathLike) -> int | None:
+    # returns the post of the comment, None when there is no such comment
+    with sqlite_cm(shards.route(comment_id, db_path)) as db:
+        row = db.execute(
+            "UPDATE comments "
+            "SET status = ? "
+            "WHERE rowid = ? "
+            "RETURNING post_id;",
+            (int(status), comment_id)
+        ).fetchone()
+        db.commit()
+    return None if row is None else row[0]
 
 
 def comment_modifier(
         comment_id: int,
         approve: bool,
         db_path: str | os.PathLike,
+        on_approved: Callable[[int, int], None] | None = None,
+        set_status: Callable[[int, CommentStatus], int | None] | None = None,
 ) -> None:
+    # set_status replaces the sqlite update for other storage backends
     new_status = CommentStatus.APPROVED if approve else CommentStatus.REJECTED
-    with sqlite_cm(db_path) as db:
-        db.execute(
-            "UPDATE comments "
-            "SET status = ? "
-            "WHERE rowid = ?;",
-            (int(new_status), comment_id)
+    if set_status is None:
+        post_id = update_status(comment_id, new_status, db_path)
+    else:
+        post_id = set_status(comment_id, new_status)
+    comment_cache.invalidate(comment_id)
+    comment_verdicts.resolve(comment_id, new_status)
+    if post_id is not None:
+        # the post's approved_comment_count may have moved
+        post_cache.invalidate(post_id)
+        response_cache.invalidate((POST_COMMENTS, post_id), (POST, post_id))
+    if post_id is not None and approve and on_approved is not None:
+        on_approved(comment_id, post_id)
+
+
+def split_windows(
+        token_ids: list[int],
+        window_tokens: int,
+        overlap: int,
+        max_windows: int,
+) -> list[list[int]]:
+    if len(token_ids) <= window_tokens:
+        return [token_ids]
+    step = window_tokens - overlap
+    starts = list(range(0, len(token_ids) - window_tokens + 1, step))
+    if starts[-1] + window_tokens < len(token_ids):
+        starts.append(len(token_ids) - window_tokens)
+    if len(starts) > max_windows:
+        # keep the first and the last window and spread the rest evenly between them
+        last = len(starts) - 1
+        starts = [starts[round(i * last / (max_windows - 1))] for i in range(max_windows)] \
+            if max_windows > 1 else starts[:1]
+    return [token_ids[start:start + window_tokens] for start in starts]
+
+
+REENCODE_HEADROOM = 16
+
+
+class WindowedClassifier:
+    def __init__(
+            self,
+            hate_detector: Callable,
+            window_tokens: int,
+            overlap: int,
+            max_windows: int,
+            batch_size: int,
+    ):
+        self.hate_detector = hate_detector
+        self.tokenizer = hate_detector.tokenizer
+        # decoding a window and tokenizing it again inside the pipeline may yield a few more tokens,
+        # keep headroom below the model limit so the pipeline never truncates a window
+        model_limit = self.tokenizer.model_max_length - self.tokenizer.num_special_tokens_to_add()
+        window_tokens = min(window_tokens, model_limit - REENCODE_HEADROOM)
+        if not 0 <= overlap < window_tokens:
+            raise ValueError(f'Window overlap must be less than {window_tokens} tokens for this model')
+        self.window_tokens = window_tokens
+        self.overlap = overlap
+        self.max_windows = max_windows
+        self.batch_size = batch_size
+
+    def __call__(self, texts: list[str]) -> list[bool]:
+        windows: list[str] = []
+        owners: list[int] = []
+        for idx, text in enumerate(texts):
+            token_ids = self.tokenizer(text, add_special_tokens=False)['input_ids']
+            for window in split_windows(token_ids, self.window_tokens, self.overlap, self.max_windows):
+                windows.append(self.tokenizer.decode(window))
+                owners.append(idx)
+        model_response = self.hate_detector(
+            windows,
+            batch_size=self.batch_size,
+            truncation=True,
+            top_k=None,
         )
-        db.commit()
+        # max-score rule: one window labeled as anything but NEITHER rejects the whole comment
+        results = [True] * len(texts)
+        for owner, scores in zip(owners, model_response):
+            if max(scores, key=itemgetter('score'))['label'] != 'NEITHER':
+                results[owner] = False
+        return results
+
+
+def classify_undecided(classifier: WindowedClassifier, tasks: list[ModerationTask]) -> list[bool | None]:
+    try:
+        return classifier([task.text for task in tasks])
+    except Exception as err:
+        # logger.error(f'Batch classification failed, retrying one by one.\n{err}')
+        pass
+    results = []
+    for task in tasks:
+        try:
+            results.extend(classifier([task.text]))
+        except Exception as err:
+            # logger.error(f'Comment {task.comment_id} could not be classified.\n{err}')
+            results.append(None)
+    return results
+
+
+def next_tasks(q: SimpleQueue, batch_size: int) -> list[ModerationTask]:
+    # blocks for the first item, then takes what is already queued; bulk writes queue lists of tasks
+    tasks: list[ModerationTask] = []
+    item = q.get()
+    while True:
+        tasks.extend(item if isinstance(item, list) else [item])
+        if len(tasks) >= batch_size:
+            return tasks
+        try:
+            item = q.get_nowait()
+        except Empty:
+            return tasks
 
 
 def classifier_worker(
         callback: Callable,
         q: SimpleQueue,
         model_name: str,
+        moderation: ModerationPipeline,
+        window_tokens: int,
+        window_overlap: int,
+        max_windows: int,
+        batch_size: int,
 ) -> None:
     # logger.info("Classifier thread started")
     hate_detector = pipeline(
         'text-classification',
         model=model_name,
     )
+    classifier = WindowedClassifier(hate_detector, window_tokens, window_overlap, max_windows, batch_size)
     # logger.info("Model downloaded")
     while True:
-        comment_id, text = q.get()
-        # logger.info("Comment received")
-        model_response = hate_detector(text)
-        result = model_response[0]['label'] == 'NEITHER'
-        callback(comment_id, result)
+        tasks = next_tasks(q, batch_size)
+        # logger.info("Comments received")
+        undecided = []
+        for task in tasks:
+            result = moderation.prefilter(task)
+            if result is None:
+                undecided.append(task)
+            else:
+                callback(task.comment_id, result)
+        if not undecided:
+            continue
+        started = time.perf_counter()
+        results = classify_undecided(classifier, undecided)
+        per_comment = (time.perf_counter() - started) / len(undecided)
+        for task, result in zip(undecided, results):
+            if result is None:
+                # stays NOT_REVIEWED, the worker keeps serving the rest of the queue
+                continue
+            moderation.learn(task, result, per_comment)
+            callback(task.comment_id, result)
 
 
 comment_queue = SimpleQueue()
@@ -3,7 +3,7 @@ import aiohttp
 
 from .db import prepare_db
 from .exceptions import NotConfiguredError
-from .repositories import SqliteCommentRepository
+from .repositories import comment_repository
 from .repositories.protocols import CommentRepository
 from .settings import Settings
 
@@ -61,7 +61,7 @@ async def autoreply_procedure(
 
 
 async def replier_worker(settings: Settings):
-    comment_repo = SqliteCommentRepository(db=prepare_db(settings))
+    comment_repo = comment_repository(prepare_db(settings), settings)
     while True:
         await asyncio.sleep(30)
         # logger.info('Checking comments')
@@ -0,0 +1,33 @@
+from typing import Iterable, TypeVar
+
+from pydantic import BaseModel
+
+from .schemas import CommentInfo, CommentRow, CompactComments, CompactPosts, Post, PostRow, User
+
+Row = TypeVar('Row', bound=BaseModel)
+
+# representation name for ETags and cache variants
+COMPACT = 'compact'
+
+
+def split_authors(entities: Iterable[Post | CommentInfo], row_type: type[Row]) -> tuple[dict[int, User], list[Row]]:
+    # rows keep author_id only, every author is listed once
+    authors: dict[int, User] = {}
+    rows: list[Row] = []
+    fields = row_type.model_fields
+    for entity in entities:
+        if entity.author is not None:
+            authors.setdefault(entity.author_id, entity.author)
+        # values are validated already
+        rows.append(row_type.model_construct(**{name: getattr(entity, name) for name in fields}))
+    return authors, rows
+
+
+def compact_posts(posts: Iterable[Post]) -> CompactPosts:
+    authors, rows = split_authors(posts, PostRow)
+    return CompactPosts.model_construct(authors=authors, posts=rows)
+
+
+def compact_comments(comments: Iterable[CommentInfo]) -> CompactComments:
+    authors, rows = split_authors(comments, CommentRow)
+    return CompactComments.model_construct(authors=authors, comments=rows)
@@ -0,0 +1,142 @@
+import gzip
+from functools import partial
+from typing import Callable, Hashable
+
+from anyio import to_thread
+from fastapi import Request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .cache import response_cache
+
+# optional codecs, gzip is always there
+CODECS: dict[str, Callable[[bytes], bytes]] = {}
+try:
+    import zstandard
+    # compressor objects are not thread safe, one per call
+    CODECS['zstd'] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+except ImportError:
+    pass
+try:
+    import brotli
+    CODECS['br'] = partial(brotli.compress, quality=5)
+except ImportError:
+    pass
+CODECS['gzip'] = partial(gzip.compress, compresslevel=6, mtime=0)
+
+# server preference when the client weighs encodings equally
+PREFERENCE = ('zstd', 'br', 'gzip')
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+CACHE_ENTRY = 'response_cache_entry'
+
+
+def negotiate(accept_encoding: str, available: dict[str, Callable] = CODECS) -> str | None:
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        coding, *params = (part.strip() for part in item.split(';'))
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    wildcard = weights.get('*', 0.0)
+    candidates = [
+        (weights.get(coding, wildcard), -rank, coding)
+        for rank, coding in enumerate(PREFERENCE)
+        if coding in available
+    ]
+    weight, _, coding = max(candidates, default=(0.0, 0, None))
+    return coding if weight > 0 else None
+
+
+def mark_cached(request: Request, key: Hashable, version: Hashable, variant: Hashable = None) -> None:
+    # lets the middleware keep compressed bodies in the response cache next to the plain one
+    request.state.response_cache_entry = (key, version, variant)
+
+
+class Compression:
+    def __init__(self, min_size: int, thread_size: int):
+        self.min_size = min_size
+        self.thread_size = thread_size
+
+    def configure(self, min_size: int, thread_size: int) -> None:
+        self.min_size = min_size
+        self.thread_size = thread_size
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get('accept-encoding', ''))
+        start: Message | None = None
+        passthrough = False
+
+        async def compressing_send(message: Message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message['type'] == 'http.response.start':
+                if 'content-length' not in Headers(raw=message['headers']):
+                    # streamed responses (event feeds) go out as they are produced
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            headers = MutableHeaders(raw=start['headers'])
+            content_type = headers.get('content-type', '')
+            compressible = content_type.startswith(COMPRESSIBLE_TYPES) and 'content-encoding' not in headers
+            if compressible:
+                headers.add_vary_header('Accept-Encoding')
+            body = message.get('body', b'')
+            if message.get('more_body', False):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            if compressible and encoding is not None and start['status'] == 200 \
+                    and len(body) >= compression.min_size:
+                body = await self.compress(scope, body, encoding)
+                headers['Content-Encoding'] = encoding
+                headers['Content-Length'] = str(len(body))
+                # the encoded bytes differ, the validator stays comparable for conditional requests
+                if (etag := headers.get('etag')) and not etag.startswith('W/'):
+                    headers['ETag'] = f'W/{etag}'
+            await send(start)
+            await send({'type': 'http.response.body', 'body': body})
+
+        await self.app(scope, receive, compressing_send)
+
+    @staticmethod
+    async def compress(scope: Scope, body: bytes, encoding: str) -> bytes:
+        codec = CODECS[encoding]
+        cache_entry = scope.get('state', {}).get(CACHE_ENTRY)
+        if cache_entry is not None:
+            key, version, variant = cache_entry
+            cached = response_cache.peek(key, version, (variant, encoding))
+            if cached is not None:
+                return cached
+            return await to_thread.run_sync(
+                response_cache.get_or_load, key, version, partial(codec, body), (variant, encoding)
+            )
+        if len(body) >= compression.thread_size:
+            # large payloads would hold the event loop for milliseconds
+            return await to_thread.run_sync(codec, body)
+        return codec(body)
+
+
+compression = Compression(min_size=1024, thread_size=64 * 1024)
@@ -0,0 +1,41 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Hashable
+
+from fastapi import Request, Response
+
+from .types import ResourceVersion
+
+
+def validator_headers(version: ResourceVersion, variant: Hashable = None) -> dict[str, str]:
+    # each representation of a resource gets its own entity tag
+    tagged = version if variant is None else (version, variant)
+    digest = hashlib.blake2b(repr(tagged).encode(), digest_size=12).hexdigest()
+    headers = {'ETag': f'"{digest}"'}
+    if version.last_modified is not None:
+        modified = datetime.fromtimestamp(version.last_modified, timezone.utc)
+        headers['Last-Modified'] = format_datetime(modified, usegmt=True)
+    return headers
+
+
+def is_fresh(request: Request, headers: dict[str, str]) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or headers['ETag'] in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is None or 'Last-Modified' not in headers:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return parsedate_to_datetime(headers['Last-Modified']) <= since
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,138 @@
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+from itertools import groupby, islice
+from typing import Iterable, Iterator, TextIO
+
+from .db import initialize_db, sqlite_cm
+from .settings import Settings, get_settings
+
+# one NDJSON line per row, the id field carries the rowid; counters are left out and rebuilt
+TABLES = {
+    'user': ('users', 'user_id', ('email', 'hash', 'autoreply_timeout')),
+    'post': ('posts', 'post_id', ('author_id', 'title', 'body', 'created_at', 'updated_at')),
+    'comment': (
+        'comments',
+        'comment_id',
+        ('author_id', 'reply_to', 'post_id', 'body', 'status', 'created_at', 'updated_at', 'autoreply_at'),
+    ),
+}
+BATCH_ROWS = 100_000
+EXPORT_FETCH = 10_000
+
+# what the dropped triggers would have kept up row by row
+REBUILD = (
+    "UPDATE comments SET reply_count = replies.count "
+    "FROM (SELECT reply_to, count(*) AS count FROM comments WHERE reply_to IS NOT NULL GROUP BY reply_to) AS replies "
+    "WHERE comments.rowid = replies.reply_to;",
+    "UPDATE posts SET approved_comment_count = approved.count "
+    "FROM (SELECT post_id, count(*) AS count FROM comments WHERE status = 1 GROUP BY post_id) AS approved "
+    "WHERE posts.rowid = approved.post_id;",
+    "INSERT INTO posts_fts(posts_fts) VALUES ('rebuild');",
+    "INSERT INTO comments_fts(rowid, body) SELECT rowid, body FROM comments WHERE status = 1;",
+)
+
+
+def open_stream(path: str, mode: str) -> TextIO:
+    # '-' is stdin or stdout, .gz files are compressed on the fly
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    return open(path, mode, encoding='utf-8')
+
+
+def export_dataset(db_path: str | os.PathLike, out: TextIO) -> dict[str, int]:
+    counts = dict.fromkeys(TABLES, 0)
+    with sqlite_cm(db_path) as db:
+        # one read transaction, references between the tables stay consistent
+        db.execute("BEGIN;")
+        for kind, (table, id_name, columns) in TABLES.items():
+            names = (id_name, *columns)
+            cursor = db.execute(f"SELECT rowid, {', '.join(columns)} FROM {table} ORDER BY rowid;")
+            while rows := cursor.fetchmany(EXPORT_FETCH):
+                out.writelines(
+                    json.dumps({'type': kind, **dict(zip(names, row))}, ensure_ascii=False, separators=(',', ':'))
+                    + '\n'
+                    for row in rows
+                )
+                counts[kind] += len(rows)
+        db.rollback()
+    return counts
+
+
+def parse_lines(lines: Iterable[str]) -> Iterator[tuple[str, tuple]]:
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            table, id_name, columns = TABLES[item['type']]
+            yield item['type'], (item[id_name], *(item[name] for name in columns))
+        except (ValueError, KeyError, TypeError) as err:
+            raise ValueError(f'Line {number} is not a dataset row: {err!r}') from err
+
+
+def import_dataset(db_path: str | os.PathLike, lines: Iterable[str]) -> dict[str, int]:
+    # run with the application stopped, into a database with no users, posts or comments
+    counts = dict.fromkeys(TABLES, 0)
+    with sqlite_cm(db_path) as db:
+        if db.execute("SELECT EXISTS (SELECT 1 FROM users) OR EXISTS (SELECT 1 FROM posts) "
+                      "OR EXISTS (SELECT 1 FROM comments);").fetchone()[0]:
+            raise ValueError('Import needs a database without users, posts and comments')
+        # a failed load is started over on a fresh file, it need not survive a power cut
+        db.execute("PRAGMA synchronous = OFF;")
+        db.execute("PRAGMA cache_size = -262144;")
+        # Triggers would log, count and index every row, plain indexes are cheaper built once
+        # at the end. Unique ones stay and reject duplicate emails as they come in.
+        dropped = db.execute(
+            "SELECT type, name, sql FROM sqlite_master "
+            "WHERE tbl_name IN ('users', 'posts', 'comments') AND sql IS NOT NULL "
+            "AND (type = 'trigger' OR (type = 'index' AND sql NOT LIKE 'CREATE UNIQUE%'));"
+        ).fetchall()
+        for kind, name, _ in dropped:
+            db.execute(f'DROP {kind.upper()} "{name}";')
+        db.commit()
+        try:
+            for kind, group in groupby(parse_lines(lines), key=lambda pair: pair[0]):
+                table, _, columns = TABLES[kind]
+                marks = ', '.join('?' * (len(columns) + 1))
+                rows = (row for _, row in group)
+                while batch := list(islice(rows, BATCH_ROWS)):
+                    db.executemany(f"INSERT INTO {table}(rowid, {', '.join(columns)}) VALUES ({marks});", batch)
+                    db.commit()
+                    counts[kind] += len(batch)
+        finally:
+            # indexes first, the counter rebuild reads through them; triggers last so it does not fire them
+            db.rollback()
+            for kind, _, sql in sorted(dropped, key=lambda item: item[0] == 'trigger'):
+                db.execute(sql)
+            for statement in REBUILD:
+                db.execute(statement)
+            db.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copies users, posts and comments to and from NDJSON.')
+    parser.add_argument('command', choices=('export', 'import'))
+    parser.add_argument('path', help="NDJSON file, gzipped when it ends in .gz, '-' for stdin or stdout")
+    args = parser.parse_args()
+    settings: Settings = get_settings()
+    if settings.storage_backend != 'sqlite':
+        raise ValueError('Datasets are exported from and imported into the sqlite backend only')
+    initialize_db(settings)
+    mode = 'w' if args.command == 'export' else 'r'
+    with open_stream(args.path, mode) as stream:
+        if args.command == 'export':
+            counts = export_dataset(settings.db_path, stream)
+        else:
+            counts = import_dataset(settings.db_path, stream)
+    print(', '.join(f'{count} {kind}s' for kind, count in counts.items()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
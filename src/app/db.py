@@ -28,11 +28,93 @@ def sqlite_cm(
         conn.close()
 
 
+# One-off steps for databases created by an older init.sql, run once each after it and
+# tracked in PRAGMA user_version. Fresh databases get the current schema from init.sql
+# and skip them. init.sql must not depend on columns added here.
+MIGRATIONS = (
+    # 1: fill the full-text indexes
+    "INSERT INTO posts_fts(posts_fts) VALUES ('rebuild'); "
+    "INSERT INTO comments_fts(rowid, body) SELECT rowid, body FROM comments WHERE status = 1;",
+    # 2: reply and approved comment counters
+    "ALTER TABLE comments ADD COLUMN reply_count INTEGER NOT NULL DEFAULT 0; "
+    "ALTER TABLE posts ADD COLUMN approved_comment_count INTEGER NOT NULL DEFAULT 0; "
+    "UPDATE comments SET reply_count = (SELECT count(*) FROM comments r WHERE r.reply_to = comments.rowid); "
+    "UPDATE posts SET approved_comment_count = "
+    "   (SELECT count(*) FROM comments c WHERE c.post_id = posts.rowid AND c.status = 1);",
+    # 3: epoch second timestamps; a column type cannot change in place, so both tables are
+    # rebuilt keeping their rowids. Legacy renaming leaves the triggers of other tables alone,
+    # the tables' own indexes and triggers come back with the second init.sql run.
+    "PRAGMA legacy_alter_table = ON; "
+    "CREATE TABLE posts_epoch ("
+    "   author_id INTEGER REFERENCES users(rowid) ON DELETE SET NULL, "
+    "   title TEXT, "
+    "   body TEXT, "
+    "   created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)), "
+    "   updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)), "
+    "   approved_comment_count INTEGER NOT NULL DEFAULT 0); "
+    "INSERT INTO posts_epoch(rowid, author_id, title, body, created_at, updated_at, approved_comment_count) "
+    "SELECT rowid, author_id, title, body, "
+    "   CAST(strftime('%s', created_at) AS INTEGER), CAST(strftime('%s', updated_at) AS INTEGER), "
+    "   approved_comment_count "
+    "FROM posts; "
+    "DROP TABLE posts; "
+    "ALTER TABLE posts_epoch RENAME TO posts; "
+    "CREATE TABLE comments_epoch("
+    "   author_id INTEGER REFERENCES users(rowid) ON DELETE SET NULL, "
+    "   reply_to INTEGER REFERENCES comments(rowid) ON DELETE SET NULL, "
+    "   post_id INTEGER REFERENCES posts(rowid) ON DELETE SET NULL, "
+    "   body TEXT NOT NULL, "
+    "   status INTEGER NOT NULL DEFAULT 0, "
+    "   created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)), "
+    "   updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)), "
+    "   autoreply_at INTEGER, "
+    "   reply_count INTEGER NOT NULL DEFAULT 0); "
+    "INSERT INTO comments_epoch(rowid, author_id, reply_to, post_id, body, status, "
+    "   created_at, updated_at, autoreply_at, reply_count) "
+    "SELECT rowid, author_id, reply_to, post_id, body, status, "
+    "   CAST(strftime('%s', created_at) AS INTEGER), CAST(strftime('%s', updated_at) AS INTEGER), "
+    "   autoreply_at, reply_count "
+    "FROM comments; "
+    "DROP TABLE comments; "
+    "ALTER TABLE comments_epoch RENAME TO comments; "
+    "PRAGMA legacy_alter_table = OFF;",
+)
+
+
 def initialize_db(settings: Settings):
-    with sqlite_cm(settings.db_path, None) as db:
-        with open(settings.sql_init, 'r') as f:
-            db.executescript(f.read())
-        db.commit()
+    with open(settings.sql_init, 'r') as f:
+        init_script = f.read()
+    migrate_db(settings.db_path, init_script)
+    if settings.storage_backend == 'sharded':
+        for shard_path in settings.shard_paths:
+            migrate_db(shard_path, init_script)
+            with sqlite_cm(shard_path) as db:
+                # shards read users from the main database they attach
+                db.execute("DROP TABLE IF EXISTS users;")
+
+
+def database_paths(settings: Settings) -> list[str | os.PathLike]:
+    # the main database first, then the shards holding posts and comments
+    if settings.storage_backend == 'sharded':
+        return [settings.db_path, *settings.shard_paths]
+    return [settings.db_path]
+
+
+def migrate_db(db_path: str | os.PathLike, init_script: str):
+    with sqlite_cm(db_path, None) as db:
+        version, = db.execute("PRAGMA user_version;").fetchone()
+        fresh = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'posts';").fetchone() is None
+        db.executescript(init_script)
+        if fresh:
+            version = len(MIGRATIONS)
+            db.execute(f"PRAGMA user_version = {version};")
+            db.commit()
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            # a step and its version bump commit together
+            db.executescript(f"BEGIN; {script} PRAGMA user_version = {number}; COMMIT;")
+        if version < len(MIGRATIONS):
+            # rebuilt tables lose their indexes and triggers
+            db.executescript(init_script)
 
 
 def prepare_db(settings: Annotated[Settings, Depends(get_settings)]):
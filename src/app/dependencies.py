@@ -7,7 +7,7 @@ from fastapi.security import OAuth2PasswordBearer
 
 from .repositories.protocols import UserRepository
 from .repositories.exceptions import NoEntry
-from .repositories import SqliteUserRepository
+from .repositories import user_repository
 from .schemas import User
 from .settings import Settings, get_settings
 
@@ -20,7 +20,7 @@ oauth_flow = OAuth2PasswordBearer(
 def requesting_user(
         settings: Annotated[Settings, Depends(get_settings)],
         token: Annotated[str, Depends(oauth_flow)],
-        user_repo: Annotated[UserRepository, Depends(SqliteUserRepository)],
+        user_repo: Annotated[UserRepository, Depends(user_repository)],
 ) -> User:
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=['HS256'])
@@ -16,6 +16,10 @@ not_found = HTTPException(
     status_code=404,
     detail='Not found'
 )
+fields_with_compact = HTTPException(
+    status_code=400,
+    detail='fields and compact cannot be combined',
+)
 internal_error = HTTPException(
     status_code=500,
     detail="Internal server error",
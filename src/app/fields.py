@@ -0,0 +1,52 @@
+from functools import lru_cache
+from typing import Annotated
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel, TypeAdapter, create_model
+
+# requestable fields in response order, "author" is the embedded user
+POST_FIELDS = (
+    'post_id', 'author_id', 'title', 'body', 'created_at', 'updated_at', 'approved_comment_count', 'author',
+)
+COMMENT_FIELDS = (
+    'comment_id', 'reply_to', 'author_id', 'post_id', 'body', 'status', 'created_at', 'updated_at', 'reply_count',
+    'author',
+)
+
+
+def requested_fields(value: str | None, allowed: tuple[str, ...]) -> tuple[str, ...] | None:
+    if value is None:
+        return None
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names.difference(allowed)
+    if not names or unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f'Unknown fields: {", ".join(sorted(unknown)) or "none requested"}. '
+                   f'Allowed: {", ".join(allowed)}',
+        )
+    # the id is always sent, the order is fixed so equal requests share ETags and cache entries
+    names.add(allowed[0])
+    return tuple(name for name in allowed if name in names)
+
+
+def post_fields(fields: Annotated[str | None, Query()] = None) -> tuple[str, ...] | None:
+    return requested_fields(fields, POST_FIELDS)
+
+
+def comment_fields(fields: Annotated[str | None, Query()] = None) -> tuple[str, ...] | None:
+    return requested_fields(fields, COMMENT_FIELDS)
+
+
+@lru_cache(maxsize=256)
+def partial_list(model: type[BaseModel], fields: tuple[str, ...]) -> TypeAdapter:
+    partial = create_model(
+        f'Partial{model.__name__}',
+        **{name: (model.model_fields[name].annotation, model.model_fields[name]) for name in fields},
+    )
+    return TypeAdapter(list[partial])
+
+
+def dump_partial(model: type[BaseModel], fields: tuple[str, ...], rows: list[dict]) -> bytes:
+    adapter = partial_list(model, fields)
+    return adapter.dump_json(adapter.validate_python(rows))
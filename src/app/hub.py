@@ -0,0 +1,68 @@
+import asyncio
+from collections import defaultdict
+from threading import Lock
+
+
+def format_event(event: str, data: str, event_id: int | None = None) -> str:
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines.append(f'event: {event}')
+    lines.extend(f'data: {line}' for line in data.splitlines() or [''])
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    def __init__(self, topic: int, buffer_size: int):
+        self.topic = topic
+        self.loop = asyncio.get_running_loop()
+        # None in the queue tells the consumer it has been evicted
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(buffer_size + 1)
+        self.buffer_size = buffer_size
+        self.evicted = False
+
+    def deliver(self, message: str) -> bool:
+        if self.evicted:
+            return False
+        if self.queue.qsize() >= self.buffer_size:
+            self.evicted = True
+            self.queue.put_nowait(None)
+            return False
+        self.queue.put_nowait(message)
+        return True
+
+
+class CommentHub:
+    def __init__(self, buffer_size: int = 64):
+        self.buffer_size = buffer_size
+        self._lock = Lock()
+        self._subscribers: defaultdict[int, set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, post_id: int) -> Subscription:
+        subscription = Subscription(post_id, self.buffer_size)
+        with self._lock:
+            self._subscribers[post_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.topic]
+
+    def has_subscribers(self, post_id: int) -> bool:
+        return post_id in self._subscribers
+
+    def publish(self, post_id: int, message: str) -> None:
+        # safe to call from any thread, delivery happens on each subscriber's loop
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(post_id, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(self._deliver, subscription, message)
+
+    def _deliver(self, subscription: Subscription, message: str) -> None:
+        if not subscription.deliver(message):
+            self.unsubscribe(subscription)
+
+
+comment_hub = CommentHub()
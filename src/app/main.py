@@ -5,11 +5,25 @@ from threading import Thread
 
 from fastapi import FastAPI
 
+from .archive import comment_archive
+from .archiver import comment_archiver
+from .backup import backup_scheduler, backups
+from .cache import response_cache
+from .change_log import change_log_pruner
 from .comment_classifier import comment_modifier, classifier_worker, comment_queue
 from .comment_replier import replier_worker
-from .routes import auth_router, users_router, comments_router, posts_router
-from .db import initialize_db
+from .compression import CompressionMiddleware, compression
+from .routes import auth_router, users_router, comments_router, posts_router, changes_router, search_router
+from .db import initialize_db, prepare_db
+from .maintenance import maintenance_scheduler
+from .moderation import build_pipeline
+from .replica import replica, replica_sync
+from .repositories import comment_repository
+from .repositories.caching import user_cache, post_cache, comment_cache
+from .repositories.memory.store import memory_store
+from .repositories.shards import shards
 from .routes.admin import admin_router
+from .routes.comments import publish_approved_comment
 from .settings import get_settings
 
 
@@ -17,7 +31,38 @@ from .settings import get_settings
 async def app_setup(app: FastAPI):
     settings = get_settings()
     initialize_db(settings)
-    callback = partial(comment_modifier, db_path=settings.db_path)
+    if settings.storage_backend == 'sharded':
+        shards.configure(settings.db_path, settings.shard_paths, settings.shard_buckets)
+    response_cache.configure(settings.response_cache_bytes, settings.response_cache_ttl)
+    for entity_cache in (user_cache, post_cache, comment_cache):
+        entity_cache.configure(settings.entity_cache_size, settings.entity_cache_ttl)
+    if settings.replica_enabled:
+        replica.configure(settings.db_path, settings.replica_max_lag)
+        replica.seed()
+    compression.configure(settings.compression_min_bytes, settings.compression_thread_bytes)
+    comment_archive.configure(
+        settings.archive_db_path,
+        settings.archive_rejected,
+        settings.archive_after_days,
+        settings.archive_batch_size,
+    )
+    backups.configure(
+        settings.backup_dir,
+        settings.backup_step_pages,
+        settings.backup_step_sleep,
+        settings.backup_compress,
+        settings.backup_keep,
+    )
+    in_memory = settings.storage_backend == 'memory'
+    callback = partial(
+        comment_modifier,
+        db_path=settings.db_path,
+        set_status=memory_store.set_comment_status if in_memory else None,
+        on_approved=partial(
+            publish_approved_comment,
+            comment_repo=comment_repository(prepare_db(settings), settings),
+        ),
+    )
     Thread(
         target=classifier_worker,
         daemon=True,
@@ -25,15 +70,32 @@ async def app_setup(app: FastAPI):
             'callback': callback,
             'q': comment_queue,
             'model_name': "badmatr11x/distilroberta-base-offensive-hateful-speech-text-multiclassification",
+            'moderation': build_pipeline(settings, memory_store.post_author if in_memory else None),
+            'window_tokens': settings.classifier_window_tokens,
+            'window_overlap': settings.classifier_window_overlap,
+            'max_windows': settings.classifier_max_windows,
+            'batch_size': settings.classifier_batch_size,
         }
     ).start()
     asyncio.create_task(replier_worker(settings))
+    asyncio.create_task(change_log_pruner(settings))
+    if settings.archive_db_path is not None:
+        asyncio.create_task(comment_archiver(settings))
+    if settings.replica_enabled:
+        asyncio.create_task(replica_sync(settings))
+    if settings.maintenance_hour is not None:
+        asyncio.create_task(maintenance_scheduler(settings))
+    if settings.backup_interval_hours is not None:
+        asyncio.create_task(backup_scheduler(settings))
     yield
 
 
 app = FastAPI(lifespan=app_setup)
+app.add_middleware(CompressionMiddleware)
 app.include_router(auth_router)
 app.include_router(admin_router)
 app.include_router(users_router)
 app.include_router(posts_router)
 app.include_router(comments_router)
+app.include_router(changes_router)
+app.include_router(search_router)
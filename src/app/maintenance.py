@@ -0,0 +1,27 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from .db import database_paths, sqlite_cm
+from .repositories import SqliteMaintenanceRepository
+from .settings import Settings
+
+
+def seconds_until(hour: int, now: datetime | None = None) -> float:
+    # to the next start of the given UTC hour
+    now = now or datetime.now(timezone.utc)
+    start = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if start <= now:
+        start += timedelta(days=1)
+    return (start - now).total_seconds()
+
+
+async def maintenance_scheduler(settings: Settings):
+    # once a day in the quiet hour, the main database first and then every shard
+    repos = [SqliteMaintenanceRepository(db=partial(sqlite_cm, db_path=path)) for path in database_paths(settings)]
+    while True:
+        await asyncio.sleep(seconds_until(settings.maintenance_hour))
+        for repo in repos:
+            # a first run rebuilds the whole file, kept off the event loop
+            run = await asyncio.to_thread(repo.run, settings.maintenance_analysis_limit)
+            # logger.info(f'Maintenance took {run.duration:.1f}s, {run.pages_reclaimed} pages reclaimed')
@@ -0,0 +1,211 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from functools import partial
+from threading import Lock
+from typing import NamedTuple, Iterable, Protocol, Callable
+
+from .db import sqlite_cm
+from .repositories.shards import shards
+from .settings import Settings
+
+
+class ModerationTask(NamedTuple):
+    comment_id: int
+    text: str
+    author_id: int
+    post_id: int
+    post_author_id: int | None = None
+    # generated replies never qualify for the author allowlist
+    autoreply: bool = False
+
+
+class ModerationStage(Protocol):
+    name: str
+
+    # True approves, False rejects, None passes the comment to the next stage
+    def __call__(self, task: ModerationTask) -> bool | None: ...
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'hits': self.hits,
+            'avg_ms': round(self.seconds / self.calls * 1000, 3) if self.calls else None,
+        }
+
+
+class ModerationStats:
+    def __init__(self):
+        self._lock = Lock()
+        self._stages: dict[str, StageStats] = {}
+
+    def record(self, stage_name: str, hit: bool, seconds: float) -> None:
+        with self._lock:
+            stats = self._stages.setdefault(stage_name, StageStats())
+            stats.calls += 1
+            stats.hits += hit
+            stats.seconds += seconds
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self._stages.items()}
+
+
+class AuthorAllowlistStage:
+    name = 'author_allowlist'
+
+    def __init__(
+            self,
+            trusted_authors: Iterable[int],
+            post_author_lookup: Callable[[int], int | None] | None = None,
+    ):
+        self.trusted_authors = frozenset(trusted_authors)
+        self.post_author_lookup = post_author_lookup
+
+    def __call__(self, task: ModerationTask) -> bool | None:
+        if task.autoreply:
+            return None
+        if task.author_id in self.trusted_authors:
+            return True
+        post_author_id = task.post_author_id
+        if post_author_id is None and self.post_author_lookup is not None:
+            post_author_id = self.post_author_lookup(task.post_id)
+        if post_author_id == task.author_id:
+            return True
+        return None
+
+
+class BlocklistStage:
+    name = 'blocklist'
+
+    def __init__(self, words: Iterable[str]):
+        words = sorted({w.strip().lower() for w in words if w.strip()}, key=len, reverse=True)
+        self.pattern = re.compile(
+            r'\b(?:' + '|'.join(map(re.escape, words)) + r')\b',
+            re.IGNORECASE,
+        ) if words else None
+
+    def __call__(self, task: ModerationTask) -> bool | None:
+        if self.pattern is not None and self.pattern.search(task.text):
+            return False
+        return None
+
+
+class ShortTextStage:
+    # approves only known safe phrases ("thanks!", "+1") and punctuation-only bodies
+    name = 'short_text'
+    punctuation = re.compile(r"[\s.,!?:;()+-]{1,10}")
+
+    def __init__(self, safe_phrases: Iterable[str]):
+        self.safe_phrases = frozenset(self._normalize(phrase) for phrase in safe_phrases)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return ' '.join(text.lower().split()).strip('.,!?:; ')
+
+    def __call__(self, task: ModerationTask) -> bool | None:
+        text = task.text.strip()
+        if self.punctuation.fullmatch(text) or self._normalize(text) in self.safe_phrases:
+            return True
+        return None
+
+
+class RepeatStage:
+    name = 'repeat'
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._verdicts: OrderedDict[str, bool] = OrderedDict()
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return ' '.join(text.lower().split())
+
+    def __call__(self, task: ModerationTask) -> bool | None:
+        key = self._key(task.text)
+        with self._lock:
+            if key in self._verdicts:
+                self._verdicts.move_to_end(key)
+                return self._verdicts[key]
+        return None
+
+    def learn(self, task: ModerationTask, verdict: bool) -> None:
+        key = self._key(task.text)
+        with self._lock:
+            self._verdicts[key] = verdict
+            self._verdicts.move_to_end(key)
+            if len(self._verdicts) > self.max_entries:
+                self._verdicts.popitem(last=False)
+
+
+class ModerationPipeline:
+    model_stage_name = 'model'
+
+    def __init__(self, stages: list[ModerationStage], stats: ModerationStats):
+        self.stages = stages
+        self.stats = stats
+
+    def prefilter(self, task: ModerationTask) -> bool | None:
+        for stage in self.stages:
+            started = time.perf_counter()
+            verdict = stage(task)
+            self.stats.record(stage.name, verdict is not None, time.perf_counter() - started)
+            if verdict is not None:
+                return verdict
+        return None
+
+    def learn(self, task: ModerationTask, verdict: bool, seconds: float) -> None:
+        self.stats.record(self.model_stage_name, True, seconds)
+        for stage in self.stages:
+            if hasattr(stage, 'learn'):
+                stage.learn(task, verdict)
+
+
+def post_author_lookup(post_id: int, db_path: str | os.PathLike) -> int | None:
+    with sqlite_cm(shards.route(post_id, db_path)) as db:
+        row = db.execute(
+            "SELECT author_id FROM posts WHERE rowid = ?;",
+            (post_id, )
+        ).fetchone()
+    return row[0] if row else None
+
+
+def read_blocklist(path: str | os.PathLike | None) -> list[str]:
+    if path is None:
+        return []
+    with open(path, 'r') as f:
+        return [line for line in f.read().splitlines() if line and not line.startswith('#')]
+
+
+def build_pipeline(
+        settings: Settings,
+        author_lookup: Callable[[int], int | None] | None = None,
+) -> ModerationPipeline:
+    # author_lookup replaces the sqlite lookup for other storage backends
+    if author_lookup is None:
+        author_lookup = partial(post_author_lookup, db_path=settings.db_path)
+    return ModerationPipeline(
+        # cheapest first, the allowlist may need a database lookup
+        stages=[
+            BlocklistStage(read_blocklist(settings.moderation_blocklist)),
+            ShortTextStage(settings.moderation_safe_phrases),
+            RepeatStage(),
+            AuthorAllowlistStage(
+                settings.moderation_trusted_authors,
+                author_lookup,
+            ),
+        ],
+        stats=moderation_stats,
+    )
+
+
+moderation_stats = ModerationStats()
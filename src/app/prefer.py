@@ -0,0 +1,26 @@
+from fastapi import Request, Response
+from pydantic import BaseModel
+from starlette.responses import RedirectResponse
+
+RETURN_REPRESENTATION = 'return=representation'
+
+
+def preferences(request: Request) -> set[str]:
+    # Prefer header (RFC 7240), parameters of a preference are not used
+    return {
+        item.split(';', 1)[0].replace(' ', '').lower()
+        for header in request.headers.getlist('prefer')
+        for item in header.split(',')
+    }
+
+
+def written(request: Request, entity: BaseModel, location: str, created: bool = False) -> Response:
+    # clients asking for the representation skip the redirect round trip
+    if RETURN_REPRESENTATION not in preferences(request):
+        return RedirectResponse(url=location, status_code=303)
+    return Response(
+        content=entity.model_dump_json(),
+        status_code=201 if created else 200,
+        media_type='application/json',
+        headers={'Location': location, 'Preference-Applied': RETURN_REPRESENTATION},
+    )
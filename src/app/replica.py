@@ -0,0 +1,176 @@
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from .db import sqlite_cm
+from .settings import Settings
+from .types import RowFactoryType, SQLiteContextManager
+
+# tables copied row by row as their changes come in, by change log entity
+TABLES = {'user': 'users', 'post': 'posts', 'comment': 'comments'}
+CHANGE_COLUMNS = 'seq, entity, entity_id, op, status, changed_at'
+REPLAY_BATCH = 1000
+IN_CHUNK_SIZE = 500
+
+
+class ReplicaStale(Exception): ...
+
+
+def chunks(ids: set[int]):
+    ordered = sorted(ids)
+    for start in range(0, len(ordered), IN_CHUNK_SIZE):
+        yield ordered[start:start + IN_CHUNK_SIZE]
+
+
+class Replica:
+    # In-memory copy of the primary for hot reads. It is seeded with the backup API and
+    # follows the change log: every logged entity is copied over again as a whole row.
+    def __init__(self, db_path: str | os.PathLike | None, max_lag: float):
+        self.configure(db_path, max_lag)
+
+    def configure(self, db_path: str | os.PathLike | None, max_lag: float) -> None:
+        self.db_path = db_path
+        self.max_lag = max_lag
+        self.conn: sqlite3.Connection | None = None
+        self.columns: dict[str, str] = {}
+        self.seq = 0
+        self.synced = 0.0
+        self.stale = True
+        # one connection serves every thread, a read or a replay at a time
+        self.lock = Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.conn is not None
+
+    def seed(self) -> None:
+        with self.lock, sqlite_cm(self.db_path) as primary:
+            self._reseed(primary)
+
+    def mark_stale(self) -> None:
+        # a write went to the primary, the next read catches up first
+        self.stale = True
+
+    @contextmanager
+    def connect(self, row_factory: RowFactoryType | None = None) -> SQLiteContextManager:
+        # raises ReplicaStale when the replica is behind by more than max_lag and cannot catch up
+        with self.lock:
+            if self.conn is None:
+                raise ReplicaStale()
+            if self.stale or time.monotonic() - self.synced > self.max_lag:
+                try:
+                    self._catch_up()
+                except sqlite3.Error as err:
+                    raise ReplicaStale() from err
+            self.conn.row_factory = row_factory
+            try:
+                yield self.conn
+            finally:
+                self.conn.row_factory = None
+
+    def catch_up(self) -> int:
+        with self.lock:
+            if self.conn is None:
+                return 0
+            return self._catch_up()
+
+    def _catch_up(self) -> int:
+        # The primary is read in one transaction, so rows and log entries agree.
+        # Rows may be newer than the last entry read, the next replay copies them again.
+        replayed = 0
+        started = time.monotonic()
+        while True:
+            with sqlite_cm(self.db_path) as primary:
+                primary.execute("BEGIN;")
+                oldest, = primary.execute("SELECT min(seq) FROM changes;").fetchone()
+                if oldest is not None and oldest > self.seq + 1:
+                    # entries we have not seen were pruned
+                    primary.rollback()
+                    self._reseed(primary)
+                    return replayed
+                changes = primary.execute(
+                    f"SELECT {CHANGE_COLUMNS} FROM changes WHERE seq > ? ORDER BY seq LIMIT ?;",
+                    (self.seq, REPLAY_BATCH)
+                ).fetchall()
+                if changes:
+                    self._replay(primary, changes)
+                    if oldest is not None:
+                        self.conn.execute("DELETE FROM changes WHERE seq < ?;", (oldest, ))
+                    self.conn.commit()
+                    self.seq = changes[-1][0]
+                    replayed += len(changes)
+            if len(changes) < REPLAY_BATCH:
+                break
+        self.synced = started
+        self.stale = False
+        return replayed
+
+    def _reseed(self, primary: sqlite3.Connection) -> None:
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        primary.backup(conn)
+        # rows arrive complete, counters and log entries included
+        for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger';").fetchall():
+            conn.execute(f'DROP TRIGGER "{name}";')
+        self.columns = {
+            table: ', '.join(column[1] for column in conn.execute(f"PRAGMA table_info({table});"))
+            for table in TABLES.values()
+        }
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = conn
+        self.seq, = conn.execute("SELECT ifnull(max(seq), 0) FROM changes;").fetchone()
+        self.synced = time.monotonic()
+        self.stale = False
+
+    def _replay(self, primary: sqlite3.Connection, changes: list[tuple]) -> None:
+        ids: dict[str, set[int]] = {entity: set() for entity in TABLES}
+        for _, entity, entity_id, *_ in changes:
+            if entity in ids:
+                ids[entity].add(entity_id)
+        # counters of the posts and parents of changed comments moved with them,
+        # before and after the change
+        comment_ids = ids['comment']
+        for db in (self.conn, primary):
+            for chunk in chunks(comment_ids):
+                for post_id, reply_to in db.execute(
+                    "SELECT post_id, reply_to FROM comments "
+                    f"WHERE rowid IN ({', '.join('?' * len(chunk))});",
+                    chunk
+                ):
+                    if post_id is not None:
+                        ids['post'].add(post_id)
+                    if reply_to is not None:
+                        ids['comment'].add(reply_to)
+        for entity, table in TABLES.items():
+            self._copy(primary, table, ids[entity])
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO changes({CHANGE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?);",
+            changes
+        )
+
+    def _copy(self, primary: sqlite3.Connection, table: str, ids: set[int]) -> None:
+        # deleted rows are gone from the primary and get dropped here
+        columns = self.columns[table]
+        values = ', '.join('?' * (columns.count(',') + 2))
+        for chunk in chunks(ids):
+            marks = ', '.join('?' * len(chunk))
+            rows = primary.execute(f"SELECT rowid, {columns} FROM {table} WHERE rowid IN ({marks});", chunk).fetchall()
+            self.conn.execute(f"DELETE FROM {table} WHERE rowid IN ({marks});", chunk)
+            self.conn.executemany(f"INSERT INTO {table}(rowid, {columns}) VALUES ({values});", rows)
+
+
+async def replica_sync(settings: Settings):
+    # replays in the background, so reads rarely pay for catching up
+    while True:
+        await asyncio.sleep(settings.replica_max_lag / 2)
+        try:
+            replica.catch_up()
+        except sqlite3.Error:
+            # logger.warning('Replica is behind the primary')
+            pass
+
+
+replica = Replica(db_path=None, max_lag=1.0)
@@ -1,4 +1,14 @@
 from .sqlite.auth import SqliteAuthRepository
 from .sqlite.user import SqliteUserRepository
 from .sqlite.post import SqlitePostRepository
-from .sqlite.comment import SqliteCommentRepository
\ No newline at end of file
+from .sqlite.comment import SqliteCommentRepository
+from .sqlite.change import SqliteChangeRepository
+from .sqlite.search import SqliteSearchRepository
+from .sqlite.archive import SqliteArchiveRepository
+from .sqlite.maintenance import SqliteMaintenanceRepository
+from .memory.auth import MemoryAuthRepository
+from .memory.user import MemoryUserRepository
+from .memory.post import MemoryPostRepository
+from .memory.comment import MemoryCommentRepository
+from .sharded import ShardedPostRepository, ShardedCommentRepository
+from .factories import auth_repository, user_repository, post_repository, comment_repository
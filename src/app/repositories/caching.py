@@ -0,0 +1,96 @@
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+from cachetools import TTLCache
+from pydantic import BaseModel
+
+
+class EntityCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self._lock = Lock()
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def configure(self, maxsize: int, ttl: float) -> None:
+        with self._lock:
+            self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: Hashable) -> BaseModel | None:
+        with self._lock:
+            entity = self._entries.get(key)
+        # callers are free to mutate what they get, the cache keeps its own copy
+        return entity.model_copy() if entity is not None else None
+
+    def put(self, key: Hashable, entity: BaseModel) -> None:
+        # saved entities get raw column values assigned after validation, validate them once here
+        entity = entity.model_validate(entity.model_dump(warnings=False))
+        with self._lock:
+            self._entries[key] = entity
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class CachingRepository:
+    # Write-through wrapper for any User/Post/Comment repository: get is served from memory,
+    # save and the other listed writes refresh the entry, delete drops it,
+    # every other method goes to the wrapped repository.
+    def __init__(
+            self,
+            repo: Any,
+            cache: EntityCache,
+            key_of: Callable[[Any], Hashable],
+            dependents: tuple[EntityCache, ...] = (),
+            writes: tuple[str, ...] = (),
+    ):
+        self.repo = repo
+        self.cache = cache
+        self.key_of = key_of
+        # caches embedding entities of this repository, e.g. posts embed their author
+        self.dependents = dependents
+        # methods returning the written entity, like save does
+        self.writes = writes
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.repo, name)
+        if name in self.writes:
+            return partial(self._write_through, attr)
+        return attr
+
+    def _write_through(self, method: Callable, *args, **kwargs):
+        saved = method(*args, **kwargs)
+        self._store(saved)
+        return saved
+
+    def _store(self, saved) -> None:
+        self.cache.put(self.key_of(saved), saved)
+        for cache in self.dependents:
+            cache.clear()
+
+    def get(self, entity_id: int):
+        if (entity := self.cache.get(entity_id)) is not None:
+            return entity
+        entity = self.repo.get(entity_id)
+        self.cache.put(entity_id, entity)
+        return entity
+
+    def save(self, entity):
+        saved = self.repo.save(entity)
+        self._store(saved)
+        return saved
+
+    def delete(self, entity_id: int):
+        self.cache.invalidate(entity_id)
+        for cache in self.dependents:
+            cache.clear()
+        return self.repo.delete(entity_id)
+
+
+user_cache = EntityCache(maxsize=10_000, ttl=60)
+post_cache = EntityCache(maxsize=10_000, ttl=60)
+comment_cache = EntityCache(maxsize=10_000, ttl=60)
@@ -1,3 +1,6 @@
 class NoEntry(Exception): ...
 class AlreadyExists(Exception): ...
-class FetchingError(Exception): ...
\ No newline at end of file
+class FetchingError(Exception): ...
+class CursorExpired(Exception): ...
+class NotOwner(Exception): ...
+class Conflict(Exception): ...
@@ -0,0 +1,97 @@
+from operator import attrgetter
+from typing import Annotated, Any
+
+from fastapi import Depends
+
+from ..db import prepare_db
+from ..replica import replica
+from ..settings import Settings, get_settings
+from .caching import CachingRepository, user_cache, post_cache, comment_cache
+from .memory.auth import MemoryAuthRepository
+from .memory.comment import MemoryCommentRepository
+from .memory.post import MemoryPostRepository
+from .memory.store import memory_store
+from .memory.user import MemoryUserRepository
+from .protocols import AuthRepository, UserRepository, PostRepository, CommentRepository
+from .replica import ReplicaRepository
+from .sharded import ShardedCommentRepository, ShardedPostRepository
+from .shards import shards
+from .sqlite.auth import SqliteAuthRepository
+from .sqlite.comment import SqliteCommentRepository
+from .sqlite.post import SqlitePostRepository
+from .sqlite.user import SqliteUserRepository
+
+
+POST_READS = ('all', 'all_fields', 'all_version', 'get', 'get_version')
+POST_WRITES = ('save', 'add_many', 'edit', 'delete')
+COMMENT_READS = ('get_by_post', 'get_by_post_fields', 'get_by_post_version')
+COMMENT_WRITES = ('save', 'add_to_post', 'add_many', 'add_reply', 'edit_body', 'delete', 'post_autoreply')
+
+
+def auth_repository(
+        db: Annotated[Any, Depends(prepare_db)],
+        settings: Annotated[Settings, Depends(get_settings)],
+) -> AuthRepository:
+    if settings.storage_backend == 'memory':
+        return MemoryAuthRepository(memory_store)
+    return SqliteAuthRepository(db)
+
+
+# the memory backend is its own cache, its repositories go unwrapped
+def user_repository(
+        db: Annotated[Any, Depends(prepare_db)],
+        settings: Annotated[Settings, Depends(get_settings)],
+) -> UserRepository:
+    if settings.storage_backend == 'memory':
+        return MemoryUserRepository(memory_store)
+    return CachingRepository(
+        SqliteUserRepository(db),
+        user_cache,
+        attrgetter('user_id'),
+        dependents=(post_cache, comment_cache),
+    )
+
+
+def post_repository(
+        db: Annotated[Any, Depends(prepare_db)],
+        settings: Annotated[Settings, Depends(get_settings)],
+) -> PostRepository:
+    if settings.storage_backend == 'memory':
+        return MemoryPostRepository(memory_store)
+    if settings.storage_backend == 'sharded':
+        repo = ShardedPostRepository(shards)
+    elif settings.replica_enabled:
+        repo = ReplicaRepository(
+            SqlitePostRepository(db), SqlitePostRepository(replica.connect), replica, POST_READS, POST_WRITES
+        )
+    else:
+        repo = SqlitePostRepository(db)
+    return CachingRepository(
+        repo,
+        post_cache,
+        attrgetter('post_id'),
+        writes=('edit', ),
+    )
+
+
+def comment_repository(
+        db: Annotated[Any, Depends(prepare_db)],
+        settings: Annotated[Settings, Depends(get_settings)],
+) -> CommentRepository:
+    if settings.storage_backend == 'memory':
+        return MemoryCommentRepository(memory_store)
+    if settings.storage_backend == 'sharded':
+        repo = ShardedCommentRepository(shards)
+    elif settings.replica_enabled:
+        repo = ReplicaRepository(
+            SqliteCommentRepository(db), SqliteCommentRepository(replica.connect), replica,
+            COMMENT_READS, COMMENT_WRITES,
+        )
+    else:
+        repo = SqliteCommentRepository(db)
+    return CachingRepository(
+        repo,
+        comment_cache,
+        attrgetter('comment_id'),
+        writes=('add_to_post', 'add_reply', 'edit_body'),
+    )
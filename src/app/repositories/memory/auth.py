@@ -0,0 +1,19 @@
+from ..exceptions import NoEntry, AlreadyExists
+from .store import MemoryRepositoryBase
+
+
+class MemoryAuthRepository(MemoryRepositoryBase):
+    def register_user(self, email: str, hashed_pass: str) -> None:
+        store = self.store
+        with store.lock:
+            if email in store.emails:
+                raise AlreadyExists('Such email has already been stored')
+            user_id = store.new_id('users')
+            store.users[user_id] = {'email': email, 'hash': hashed_pass, 'autoreply_timeout': None}
+            store.emails[email] = user_id
+
+    def get_user_credentials(self, email: str) -> tuple[int, str]:
+        with self.store.lock:
+            if (user_id := self.store.emails.get(email)) is None:
+                raise NoEntry()
+            return user_id, self.store.users[user_id]['hash']
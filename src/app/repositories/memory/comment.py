@@ -0,0 +1,231 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from ...cache import response_cache, POST_COMMENTS
+from ...comment_classifier import comment_queue
+from ...moderation import ModerationTask
+from ...schemas import Comment, CommentInfo, CommentStatus
+from ...types import CommentsAutoreplyData, ResourceVersion
+from ..caching import comment_cache
+from ..exceptions import Conflict, NoEntry, NotOwner
+from .store import MemoryRepositoryBase, now
+
+
+def epoch(day: str, days_later: int = 0) -> int:
+    # naive dates and times are UTC, like strftime('%s', ...) reads them
+    moment = datetime.fromisoformat(day)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int((moment + timedelta(days=days_later)).timestamp())
+
+
+class MemoryCommentRepository(MemoryRepositoryBase):
+    def get(self, comment_id: int) -> CommentInfo:
+        with self.store.lock:
+            if (comment := self.store.comment(comment_id)) is None:
+                raise NoEntry()
+            return comment
+
+    def get_by_author(self, user_id: int) -> list[CommentInfo]:
+        with self.store.lock:
+            return self.get_many(list(self.store.comments_by_author.get(user_id, ())))
+
+    def get_by_author_fields(self, user_id: int, fields: tuple[str, ...]) -> list[dict]:
+        with self.store.lock:
+            return self._project(self.store.comments_by_author.get(user_id, ()), fields)
+
+    def get_many(self, comment_ids: list[int]) -> list[CommentInfo]:
+        with self.store.lock:
+            comments = (self.store.comment(comment_id) for comment_id in sorted(set(comment_ids)))
+            return [comment for comment in comments if comment is not None]
+
+    def get_by_post(self, post_id: int) -> list[CommentInfo]:
+        with self.store.lock:
+            return self.get_many(self._approved(post_id))
+
+    def get_by_post_fields(self, post_id: int, fields: tuple[str, ...]) -> list[dict]:
+        with self.store.lock:
+            return self._project(self._approved(post_id), fields)
+
+    def get_version(self, comment_id: int) -> ResourceVersion:
+        with self.store.lock:
+            if (row := self.store.comments.get(comment_id)) is None:
+                raise NoEntry()
+            return ResourceVersion(row['updated_at'], (comment_id, row['seq'], row['reply_count']))
+
+    def get_by_post_version(self, post_id: int) -> ResourceVersion:
+        store = self.store
+        with store.lock:
+            comment_ids = self._approved(post_id)
+            return ResourceVersion(
+                max((store.comments[comment_id]['updated_at'] for comment_id in comment_ids), default=None),
+                (len(comment_ids), max(comment_ids, default=None), store.last_seq['comment']),
+            )
+
+    def get_stats_by_date(self, date_from: str, date_to: str):
+        start, end = epoch(date_from), epoch(date_to, days_later=1)
+        counts: dict[tuple[str, int], int] = {}
+        with self.store.lock:
+            for row in self.store.comments.values():
+                if start <= row['created_at'] < end:
+                    day = datetime.fromtimestamp(row['created_at'], timezone.utc).date().isoformat()
+                    key = (day, int(row['status']))
+                    counts[key] = counts.get(key, 0) + 1
+        return [(day, status, count) for (day, status), count in sorted(counts.items())]
+
+    def save(self, comment: Comment) -> Comment:
+        store = self.store
+        with store.lock:
+            if comment.comment_id is None:
+                comment.comment_id = store.insert_comment(
+                    comment.author_id, comment.post_id, comment.body, comment.reply_to, comment.autoreply_at
+                )
+            elif comment.comment_id in store.comments:
+                store.update_comment(
+                    comment.comment_id,
+                    body=comment.body,
+                    status=comment.status,
+                    autoreply_at=comment.autoreply_at,
+                )
+            else:
+                raise NoEntry()
+            row = store.comments[comment.comment_id]
+            comment.created_at = datetime.fromtimestamp(row['created_at'], timezone.utc)
+            comment.updated_at = datetime.fromtimestamp(row['updated_at'], timezone.utc)
+            comment.status = row['status']
+        self._submitted(comment)
+        return comment
+
+    def add_to_post(self, post_id: int, author_id: int, body: str) -> CommentInfo:
+        with self.store.lock:
+            comment = self._add_to_post(post_id, author_id, body)
+        if comment is None:
+            raise NoEntry()
+        self._submitted(comment)
+        return comment
+
+    def add_many(self, author_id: int, comments: list[tuple[int, str]]) -> list[CommentInfo | None]:
+        # comments to missing posts come back as None at their position
+        with self.store.lock:
+            results = [self._add_to_post(post_id, author_id, body) for post_id, body in comments]
+        saved_comments = [comment for comment in results if comment is not None]
+        response_cache.invalidate(*{(POST_COMMENTS, comment.post_id) for comment in saved_comments})
+        if saved_comments:
+            # one group, the classifier worker takes it apart
+            comment_queue.put([self._moderation_task(comment) for comment in saved_comments])
+        return results
+
+    def add_reply(self, comment_id: int, author_id: int, body: str) -> CommentInfo:
+        store = self.store
+        with store.lock:
+            parent = store.comments.get(comment_id)
+            if parent is None:
+                raise NoEntry()
+            if parent['reply_to'] is not None:
+                raise Conflict('Replies cannot be replied')
+            comment = store.comment(store.insert_comment(author_id, parent['post_id'], body, reply_to=comment_id))
+        self._submitted(comment)
+        # reply_count of the parent went up
+        comment_cache.invalidate(comment_id)
+        return comment
+
+    def edit_body(self, comment_id: int, author_id: int, body: str) -> CommentInfo:
+        store = self.store
+        with store.lock:
+            row = store.comments.get(comment_id)
+            if row is None:
+                raise NoEntry()
+            if row['author_id'] != author_id:
+                raise NotOwner()
+            if row['reply_count'] != 0:
+                raise Conflict('Comment is already replied')
+            store.update_comment(comment_id, body=body)
+            comment = store.comment(comment_id)
+        self._submitted(comment)
+        return comment
+
+    def delete(self, comment_id: int) -> CommentInfo:
+        store = self.store
+        with store.lock:
+            if (comment := store.comment(comment_id)) is None:
+                raise NoEntry()
+            store.delete_comment(comment_id)
+        comment_cache.invalidate(comment_id)
+        if comment.reply_to is not None:
+            comment_cache.invalidate(comment.reply_to)
+        response_cache.invalidate((POST_COMMENTS, comment.post_id))
+        return comment
+
+    def has_replies(self, comment_id: int) -> bool:
+        with self.store.lock:
+            row = self.store.comments.get(comment_id)
+            return row is not None and row['reply_count'] != 0
+
+    def get_comments_to_reply(self) -> CommentsAutoreplyData:
+        store = self.store
+        due = []
+        with store.lock:
+            for comment_id in sorted(store.autoreply_due):
+                row = store.comments[comment_id]
+                post_author_id = store.post_author(row['post_id'])
+                if row['status'] == CommentStatus.APPROVED \
+                        and row['reply_to'] is None \
+                        and post_author_id is not None \
+                        and row['author_id'] != post_author_id \
+                        and row['autoreply_at'] < time.time():
+                    due.append((comment_id, row['body'], row['post_id'], post_author_id))
+        return due
+
+    def post_autoreply(self, comment_id: int, reply_text: str, post_id, post_author_id: int) -> None:
+        store = self.store
+        with store.lock:
+            store.update_comment(comment_id, autoreply_at=None)
+            reply_id = store.insert_comment(post_author_id, post_id, reply_text, reply_to=comment_id)
+        comment_queue.put(ModerationTask(
+            reply_id,
+            reply_text,
+            post_author_id,
+            post_id,
+            post_author_id,
+            autoreply=True,
+        ))
+        comment_cache.invalidate(comment_id)
+        response_cache.invalidate((POST_COMMENTS, post_id))
+
+    def _add_to_post(self, post_id: int, author_id: int, body: str) -> CommentInfo | None:
+        # autoreply deadline comes from the post author's settings
+        store = self.store
+        if (post := store.posts.get(post_id)) is None:
+            return None
+        author = store.users.get(post['author_id'])
+        timeout = None if author is None else author['autoreply_timeout']
+        autoreply_at = None if timeout is None else now() + timeout * 60
+        return store.comment(store.insert_comment(author_id, post_id, body, autoreply_at=autoreply_at))
+
+    def _approved(self, post_id: int) -> list[int]:
+        comments = self.store.comments
+        return sorted(
+            comment_id for comment_id in self.store.comments_by_post.get(post_id, ())
+            if comments[comment_id]['status'] == CommentStatus.APPROVED
+        )
+
+    def _project(self, comment_ids, fields: tuple[str, ...]) -> list[dict]:
+        store = self.store
+        items = (
+            store.project('comment_id', comment_id, store.comments[comment_id], fields)
+            for comment_id in sorted(comment_ids)
+        )
+        return [item for item in items if item is not None]
+
+    def _submitted(self, comment: CommentInfo) -> None:
+        response_cache.invalidate((POST_COMMENTS, comment.post_id))
+        comment_queue.put(self._moderation_task(comment))
+
+    @staticmethod
+    def _moderation_task(comment: CommentInfo) -> ModerationTask:
+        return ModerationTask(
+            comment.comment_id,
+            comment.body,
+            comment.author_id,
+            comment.post_id,
+        )
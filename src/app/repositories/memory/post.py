@@ -0,0 +1,154 @@
+from datetime import datetime, timezone
+
+from ...cache import response_cache, POST
+from ...schemas import Post, PostThread, ThreadComment, CommentStatus, User
+from ...types import ResourceVersion
+from ..exceptions import NoEntry, NotOwner
+from .store import MemoryRepositoryBase
+
+
+class MemoryPostRepository(MemoryRepositoryBase):
+    def all(self) -> list[Post]:
+        with self.store.lock:
+            posts = (self.store.post(post_id) for post_id in self._newest_first())
+            return [post for post in posts if post is not None]
+
+    def all_fields(self, fields: tuple[str, ...]) -> list[dict]:
+        store = self.store
+        with store.lock:
+            posts = (
+                store.project('post_id', post_id, store.posts[post_id], fields)
+                for post_id in self._newest_first()
+            )
+            return [post for post in posts if post is not None]
+
+    def get(self, post_id: int) -> Post:
+        with self.store.lock:
+            if (post := self.store.post(post_id)) is None:
+                raise NoEntry
+            return post
+
+    def get_by_author(self, user_id: int) -> list[Post]:
+        with self.store.lock:
+            return self.get_many(list(self.store.posts_by_author.get(user_id, ())))
+
+    def get_many(self, post_ids: list[int]) -> list[Post]:
+        with self.store.lock:
+            posts = (self.store.post(post_id) for post_id in sorted(set(post_ids)))
+            return [post for post in posts if post is not None]
+
+    def all_version(self) -> ResourceVersion:
+        store = self.store
+        with store.lock:
+            return ResourceVersion(
+                max((row['updated_at'] for row in store.posts.values()), default=None),
+                (len(store.posts), max(store.posts, default=None), store.last_seq['post'], store.last_seq['comment']),
+            )
+
+    def get_version(self, post_id: int) -> ResourceVersion:
+        with self.store.lock:
+            if (row := self.store.posts.get(post_id)) is None:
+                raise NoEntry
+            return ResourceVersion(row['updated_at'], (post_id, row['seq'], row['approved_comment_count']))
+
+    def get_thread(self, post_id: int, max_depth: int, max_comments: int) -> PostThread:
+        store = self.store
+        with store.lock:
+            post = store.posts.get(post_id)
+            if post is None:
+                raise NoEntry
+            authors: dict[int, User] = {}
+            if (author := store.author(post['author_id'])) is not None:
+                authors[author.user_id] = author
+            # breadth first, so a parent is always ahead of its replies when the limit cuts the tree
+            level = sorted(
+                comment_id for comment_id in store.comments_by_post.get(post_id, ())
+                if store.comments[comment_id]['reply_to'] is None and self._approved(comment_id)
+            )
+            rows: list[tuple[int, int]] = []
+            depth = 0
+            while level and depth <= max_depth and len(rows) <= max_comments:
+                rows.extend((comment_id, depth) for comment_id in level)
+                level = sorted(
+                    reply_id for comment_id in level for reply_id in store.replies.get(comment_id, ())
+                    if self._approved(reply_id)
+                )
+                depth += 1
+            truncated = len(rows) > max_comments
+            comments: list[ThreadComment] = []
+            nodes: dict[int, ThreadComment] = {}
+            for comment_id, depth in rows[:max_comments]:
+                row = store.comments[comment_id]
+                node = ThreadComment(
+                    comment_id=comment_id,
+                    author_id=row['author_id'],
+                    body=row['body'],
+                    created_at=row['created_at'],
+                    updated_at=row['updated_at'],
+                )
+                nodes[comment_id] = node
+                (comments if row['reply_to'] is None else nodes[row['reply_to']].replies).append(node)
+                if depth == max_depth and any(map(self._approved, store.replies.get(comment_id, ()))):
+                    truncated = True
+                if row['author_id'] not in authors and (author := store.author(row['author_id'])) is not None:
+                    authors[author.user_id] = author
+            return PostThread(
+                post_id=post_id,
+                author_id=post['author_id'],
+                title=post['title'],
+                body=post['body'],
+                created_at=post['created_at'],
+                updated_at=post['updated_at'],
+                authors=authors,
+                comments=comments,
+                truncated=truncated,
+            )
+
+    def save(self, post: Post) -> Post:
+        store = self.store
+        with store.lock:
+            if post.post_id is None:
+                saved_post = store.post(store.insert_post(post.author_id, post.title, post.body))
+            else:
+                if post.post_id not in store.posts:
+                    raise NoEntry("Such post does not exist")
+                store.update_post(post.post_id, post.title, post.body)
+                post.updated_at = datetime.fromtimestamp(store.posts[post.post_id]['updated_at'], timezone.utc)
+                saved_post = post
+        response_cache.invalidate((POST, saved_post.post_id))
+        return saved_post
+
+    def add_many(self, author_id: int, posts: list[tuple[str, str]]) -> list[Post]:
+        store = self.store
+        with store.lock:
+            post_ids = [store.insert_post(author_id, title, body) for title, body in posts]
+            return [post for post in map(store.post, post_ids) if post is not None]
+
+    def edit(self, post_id: int, author_id: int, title: str, body: str) -> Post:
+        store = self.store
+        with store.lock:
+            row = store.posts.get(post_id)
+            if row is None:
+                raise NoEntry("Such post does not exist")
+            if row['author_id'] != author_id:
+                raise NotOwner()
+            store.update_post(post_id, title, body)
+            post = store.post(post_id)
+        response_cache.invalidate((POST, post_id))
+        return post
+
+    def delete(self, post_id: int) -> Post:
+        store = self.store
+        with store.lock:
+            if (post := store.post(post_id)) is None:
+                raise NoEntry("Such post does not exist")
+            store.delete_post(post_id)
+        response_cache.invalidate((POST, post_id))
+        return post
+
+    def _approved(self, comment_id: int) -> bool:
+        return self.store.comments[comment_id]['status'] == CommentStatus.APPROVED
+
+    def _newest_first(self) -> list[int]:
+        posts = self.store.posts
+        return sorted(posts, key=lambda post_id: (posts[post_id]['created_at'], post_id), reverse=True)
@@ -0,0 +1,202 @@
+import time
+from threading import RLock
+from typing import Any
+
+from ...schemas import CommentInfo, CommentStatus, Post, User
+
+# model fields read straight off the rows
+POST_ROW_FIELDS = ('author_id', 'title', 'body', 'created_at', 'updated_at', 'approved_comment_count')
+COMMENT_ROW_FIELDS = ('reply_to', 'author_id', 'post_id', 'body', 'status', 'created_at', 'updated_at', 'reply_count')
+
+
+def now() -> int:
+    # epoch seconds, as the sqlite backend stores them
+    return int(time.time())
+
+
+class MemoryStore:
+    # Rows as dicts keyed by id with the secondary indexes the queries need. Counters and
+    # change sequence numbers are kept the way the sqlite triggers keep them.
+    def __init__(self):
+        self.lock = RLock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.users: dict[int, dict[str, Any]] = {}
+            self.posts: dict[int, dict[str, Any]] = {}
+            self.comments: dict[int, dict[str, Any]] = {}
+            self.emails: dict[str, int] = {}
+            self.posts_by_author: dict[int, set[int]] = {}
+            self.comments_by_author: dict[int, set[int]] = {}
+            self.comments_by_post: dict[int, set[int]] = {}
+            self.replies: dict[int, set[int]] = {}
+            # comments waiting for an autoreply
+            self.autoreply_due: set[int] = set()
+            self.last_ids = {'users': 0, 'posts': 0, 'comments': 0}
+            self.seq = 0
+            self.last_seq = {'post': None, 'comment': None}
+
+    def new_id(self, table: str) -> int:
+        self.last_ids[table] += 1
+        return self.last_ids[table]
+
+    def log(self, entity: str, row: dict[str, Any]) -> None:
+        self.seq += 1
+        self.last_seq[entity] = row['seq'] = self.seq
+
+    # users
+
+    def author(self, user_id: int | None) -> User | None:
+        row = self.users.get(user_id)
+        if row is None:
+            return None
+        return User(user_id=user_id, email=row['email'], autoreply_timeout=row['autoreply_timeout'])
+
+    def author_fields(self, user_id: int) -> dict[str, Any] | None:
+        row = self.users.get(user_id)
+        if row is None:
+            return None
+        return {'user_id': user_id, 'email': row['email'], 'autoreply_timeout': row['autoreply_timeout']}
+
+    def project(self, id_name: str, entity_id: int, row: dict[str, Any], fields: tuple[str, ...]) -> dict | None:
+        # the requested fields only, rows of removed authors drop out when the author is asked for
+        item: dict[str, Any] = {}
+        for name in fields:
+            if name == 'author':
+                if (author := self.author_fields(row['author_id'])) is None:
+                    return None
+                item[name] = author
+            else:
+                item[name] = entity_id if name == id_name else row[name]
+        return item
+
+    # posts
+
+    def post(self, post_id: int) -> Post | None:
+        row = self.posts.get(post_id)
+        if row is None or (author := self.author(row['author_id'])) is None:
+            # the sqlite backend joins users, posts of removed authors are not listed
+            return None
+        return Post(post_id=post_id, author=author, **{name: row[name] for name in POST_ROW_FIELDS})
+
+    def post_author(self, post_id: int) -> int | None:
+        with self.lock:
+            row = self.posts.get(post_id)
+            return None if row is None else row['author_id']
+
+    def insert_post(self, author_id: int, title: str, body: str) -> int:
+        post_id = self.new_id('posts')
+        timestamp = now()
+        row = {
+            'author_id': author_id,
+            'title': title,
+            'body': body,
+            'created_at': timestamp,
+            'updated_at': timestamp,
+            'approved_comment_count': 0,
+        }
+        self.posts[post_id] = row
+        self.posts_by_author.setdefault(author_id, set()).add(post_id)
+        self.log('post', row)
+        return post_id
+
+    def update_post(self, post_id: int, title: str, body: str) -> None:
+        row = self.posts[post_id]
+        changed = (row['title'], row['body']) != (title, body)
+        row.update(title=title, body=body, updated_at=now())
+        if changed:
+            self.log('post', row)
+
+    def delete_post(self, post_id: int) -> None:
+        row = self.posts.pop(post_id)
+        self.posts_by_author.get(row['author_id'], set()).discard(post_id)
+        self.log('post', row)
+
+    # comments
+
+    def comment(self, comment_id: int) -> CommentInfo | None:
+        row = self.comments.get(comment_id)
+        if row is None or (author := self.author(row['author_id'])) is None:
+            return None
+        return CommentInfo(comment_id=comment_id, author=author, **{name: row[name] for name in COMMENT_ROW_FIELDS})
+
+    def insert_comment(
+            self,
+            author_id: int,
+            post_id: int,
+            body: str,
+            reply_to: int | None = None,
+            autoreply_at: int | None = None,
+    ) -> int:
+        comment_id = self.new_id('comments')
+        timestamp = now()
+        row = {
+            'author_id': author_id,
+            'reply_to': reply_to,
+            'post_id': post_id,
+            'body': body,
+            'status': CommentStatus.NOT_REVIEWED,
+            'created_at': timestamp,
+            'updated_at': timestamp,
+            'autoreply_at': autoreply_at,
+            'reply_count': 0,
+        }
+        self.comments[comment_id] = row
+        self.comments_by_author.setdefault(author_id, set()).add(comment_id)
+        self.comments_by_post.setdefault(post_id, set()).add(comment_id)
+        if reply_to is not None:
+            self.replies.setdefault(reply_to, set()).add(comment_id)
+            if reply_to in self.comments:
+                self.comments[reply_to]['reply_count'] += 1
+        if autoreply_at is not None:
+            self.autoreply_due.add(comment_id)
+        self.log('comment', row)
+        return comment_id
+
+    def update_comment(self, comment_id: int, **values: Any) -> None:
+        row = self.comments[comment_id]
+        logged = any(row[name] != value for name, value in values.items() if name in ('body', 'status'))
+        if 'status' in values:
+            self.count_approved(row, -1)
+        row.update(values, updated_at=now())
+        if 'status' in values:
+            self.count_approved(row, 1)
+        if row['autoreply_at'] is None:
+            self.autoreply_due.discard(comment_id)
+        else:
+            self.autoreply_due.add(comment_id)
+        if logged:
+            self.log('comment', row)
+
+    def set_comment_status(self, comment_id: int, status: CommentStatus) -> int | None:
+        # the moderation verdict, returns the comment's post_id
+        with self.lock:
+            if comment_id not in self.comments:
+                return None
+            self.update_comment(comment_id, status=status)
+            return self.comments[comment_id]['post_id']
+
+    def delete_comment(self, comment_id: int) -> None:
+        row = self.comments.pop(comment_id)
+        self.count_approved(row, -1)
+        self.comments_by_author.get(row['author_id'], set()).discard(comment_id)
+        self.comments_by_post.get(row['post_id'], set()).discard(comment_id)
+        self.autoreply_due.discard(comment_id)
+        if (reply_to := row['reply_to']) is not None:
+            self.replies.get(reply_to, set()).discard(comment_id)
+            if reply_to in self.comments:
+                self.comments[reply_to]['reply_count'] -= 1
+        self.log('comment', row)
+
+    def count_approved(self, row: dict[str, Any], step: int) -> None:
+        if row['status'] == CommentStatus.APPROVED and row['post_id'] in self.posts:
+            self.posts[row['post_id']]['approved_comment_count'] += step
+
+
+class MemoryRepositoryBase:
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+
+memory_store = MemoryStore()
@@ -0,0 +1,33 @@
+from ...schemas import User
+from ..exceptions import NoEntry, AlreadyExists
+from .store import MemoryRepositoryBase
+
+
+class MemoryUserRepository(MemoryRepositoryBase):
+    def get(self, user_id: int) -> User:
+        with self.store.lock:
+            if (user := self.store.author(user_id)) is None:
+                raise NoEntry('No such user')
+            return user
+
+    def save(self, user: User) -> User:
+        store = self.store
+        with store.lock:
+            row = store.users.get(user.user_id)
+            if row is None:
+                raise NoEntry
+            if store.emails.get(user.email, user.user_id) != user.user_id:
+                raise AlreadyExists('Such email has already been stored')
+            del store.emails[row['email']]
+            store.emails[user.email] = user.user_id
+            row.update(email=user.email, autoreply_timeout=user.autoreply_timeout)
+            return store.author(user.user_id)
+
+    def delete(self, user_id: int) -> User:
+        store = self.store
+        with store.lock:
+            if (user := store.author(user_id)) is None:
+                raise NoEntry('No such user')
+            del store.emails[user.email]
+            del store.users[user_id]
+            return user
@@ -1,12 +1,16 @@
-from typing import Protocol
+from typing import Literal, Protocol
 
 from ..schemas import (
+    Change,
     User,
     Post,
+    PostThread,
+    SearchHit,
     Comment,
     CommentInfo,
+    MaintenanceRun,
 )
-from ..types import CommentsAutoreplyData
+from ..types import CommentsAutoreplyData, ResourceVersion
 
 
 class AuthRepository(Protocol):
@@ -22,19 +26,60 @@ class UserRepository(Protocol):
 
 class PostRepository(Protocol):
     def all(self) -> list[Post]: ...
+    def all_fields(self, fields: tuple[str, ...]) -> list[dict]: ...
     def get(self, post_id: int) -> Post: ...
     def get_by_author(self, user_id: int) -> list[Post]: ...
+    def get_many(self, post_ids: list[int]) -> list[Post]: ...
+    def all_version(self) -> ResourceVersion: ...
+    def get_version(self, post_id: int) -> ResourceVersion: ...
+    def get_thread(self, post_id: int, max_depth: int, max_comments: int) -> PostThread: ...
     def save(self, post: Post) -> Post: ...
+    def add_many(self, author_id: int, posts: list[tuple[str, str]]) -> list[Post]: ...
+    def edit(self, post_id: int, author_id: int, title: str, body: str) -> Post: ...
     def delete(self, post_id: int) -> Post: ...
 
 
 class CommentRepository(Protocol):
     def get(self, comment_id: int) -> CommentInfo: ...
     def get_by_author(self, user_id: int) -> list[CommentInfo]: ...
+    def get_by_author_fields(self, user_id: int, fields: tuple[str, ...]) -> list[dict]: ...
+    def get_many(self, comment_ids: list[int]) -> list[CommentInfo]: ...
     def get_by_post(self, post_id: int) -> list[CommentInfo]: ...
+    def get_by_post_fields(self, post_id: int, fields: tuple[str, ...]) -> list[dict]: ...
+    def get_version(self, comment_id: int) -> ResourceVersion: ...
+    def get_by_post_version(self, post_id: int) -> ResourceVersion: ...
     def get_stats_by_date(self, date_from: str, date_to: str): ...
     def save(self, comment: Comment) -> Comment: ...
+    def add_to_post(self, post_id: int, author_id: int, body: str) -> CommentInfo: ...
+    def add_many(self, author_id: int, comments: list[tuple[int, str]]) -> list[CommentInfo | None]: ...
+    def add_reply(self, comment_id: int, author_id: int, body: str) -> CommentInfo: ...
+    def edit_body(self, comment_id: int, author_id: int, body: str) -> CommentInfo: ...
     def delete(self, comment_id: int) -> CommentInfo: ...
     def has_replies(self, comment_id: int) -> bool: ...
     def get_comments_to_reply(self) -> CommentsAutoreplyData: ...
     def post_autoreply(self, comment_id: int, reply_text: str, post_id, post_author_id: int) -> None: ...
+
+
+class ChangeRepository(Protocol):
+    def since(self, cursor: int, limit: int) -> list[Change]: ...
+    def prune(self, older_than: int) -> int: ...
+
+
+class ArchiveRepository(Protocol):
+    def archive_comments(self, older_than: int | None, rejected: bool, limit: int) -> list[int]: ...
+    def restore_comments(self, comment_ids: list[int]) -> list[int]: ...
+
+
+class MaintenanceRepository(Protocol):
+    def run(self, analysis_limit: int) -> MaintenanceRun: ...
+    def recent(self, limit: int) -> list[MaintenanceRun]: ...
+
+
+class SearchRepository(Protocol):
+    def search(
+            self,
+            text: str,
+            scope: Literal['all', 'posts', 'comments'],
+            limit: int,
+            offset: int,
+    ) -> list[SearchHit]: ...
@@ -0,0 +1,48 @@
+import sqlite3
+from functools import partial
+from typing import Any, Callable
+
+from ..replica import Replica, ReplicaStale
+from .exceptions import NoEntry
+
+
+class ReplicaRepository:
+    # Serves the listed reads from the in-memory replica and every other method from the
+    # primary. The listed writes mark the replica stale, so the next read here sees them;
+    # writes of other processes show up within the replica's max_lag.
+    def __init__(
+            self,
+            primary: Any,
+            replica_repo: Any,
+            replica: Replica,
+            reads: tuple[str, ...],
+            writes: tuple[str, ...],
+    ):
+        self.primary = primary
+        self.replica_repo = replica_repo
+        self.replica = replica
+        self.reads = reads
+        self.writes = writes
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.primary, name)
+        if name in self.reads:
+            return partial(self._read, name, attr)
+        if name in self.writes:
+            return partial(self._write, attr)
+        return attr
+
+    def _read(self, name: str, fallback: Callable, *args, **kwargs):
+        if self.replica.ready:
+            try:
+                return getattr(self.replica_repo, name)(*args, **kwargs)
+            # missing entries may have been created by another process since the last replay
+            except (ReplicaStale, NoEntry, sqlite3.Error):
+                pass
+        return fallback(*args, **kwargs)
+
+    def _write(self, method: Callable, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self.replica.mark_stale()
@@ -0,0 +1,162 @@
+import random
+from collections import Counter
+from heapq import merge
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Iterable
+
+from ..schemas import Comment, CommentInfo, Post, PostThread
+from ..types import CommentsAutoreplyData, ResourceVersion
+from .shards import Shards
+from .sqlite.base import SqliteRepositoryBase
+from .sqlite.comment import SqliteCommentRepository
+from .sqlite.post import SqlitePostRepository
+
+
+class ShardedRepository:
+    repo_type: type[SqliteRepositoryBase]
+
+    def __init__(self, layout: Shards):
+        self.layout = layout
+        self.repos = {path: layout.repository(self.repo_type, path) for path in layout.paths}
+
+    def shard_of(self, entity_id: int):
+        return self.repos[self.layout.path_of(entity_id)]
+
+    def any_shard(self):
+        # new posts spread over the shards by the number of buckets each one owns
+        return self.shard_of(random.randrange(self.layout.buckets))
+
+    def fan_out(self, call: Callable[[Any], list]) -> list[list]:
+        return [call(repo) for repo in self.repos.values()]
+
+    def grouped(self, ids: Iterable[int]) -> dict[str, list[int]]:
+        groups: dict[str, list[int]] = {}
+        for entity_id in ids:
+            groups.setdefault(self.layout.path_of(entity_id), []).append(entity_id)
+        return groups
+
+
+def merged_version(versions: list[ResourceVersion]) -> ResourceVersion:
+    modified = [version.last_modified for version in versions if version.last_modified is not None]
+    return ResourceVersion(max(modified, default=None), tuple(version.fingerprint for version in versions))
+
+
+class ShardedPostRepository(ShardedRepository):
+    repo_type = SqlitePostRepository
+
+    def all(self) -> list[Post]:
+        # every shard lists newest first
+        return list(merge(*self.fan_out(SqlitePostRepository.all), key=attrgetter('created_at'), reverse=True))
+
+    def all_fields(self, fields: tuple[str, ...]) -> list[dict]:
+        extended = fields if 'created_at' in fields else (*fields, 'created_at')
+        posts = merge(*self.fan_out(lambda repo: repo.all_fields(extended)), key=itemgetter('created_at'), reverse=True)
+        if extended is fields:
+            return list(posts)
+        return [{name: post[name] for name in fields} for post in posts]
+
+    def get(self, post_id: int) -> Post:
+        return self.shard_of(post_id).get(post_id)
+
+    def get_by_author(self, user_id: int) -> list[Post]:
+        return [post for posts in self.fan_out(lambda repo: repo.get_by_author(user_id)) for post in posts]
+
+    def get_many(self, post_ids: list[int]) -> list[Post]:
+        return [post for path, ids in self.grouped(post_ids).items() for post in self.repos[path].get_many(ids)]
+
+    def all_version(self) -> ResourceVersion:
+        return merged_version(self.fan_out(SqlitePostRepository.all_version))
+
+    def get_version(self, post_id: int) -> ResourceVersion:
+        return self.shard_of(post_id).get_version(post_id)
+
+    def get_thread(self, post_id: int, max_depth: int, max_comments: int) -> PostThread:
+        return self.shard_of(post_id).get_thread(post_id, max_depth, max_comments)
+
+    def save(self, post: Post) -> Post:
+        repo = self.any_shard() if post.post_id is None else self.shard_of(post.post_id)
+        return repo.save(post)
+
+    def add_many(self, author_id: int, posts: list[tuple[str, str]]) -> list[Post]:
+        return self.any_shard().add_many(author_id, posts)
+
+    def edit(self, post_id: int, author_id: int, title: str, body: str) -> Post:
+        return self.shard_of(post_id).edit(post_id, author_id, title, body)
+
+    def delete(self, post_id: int) -> Post:
+        return self.shard_of(post_id).delete(post_id)
+
+
+class ShardedCommentRepository(ShardedRepository):
+    repo_type = SqliteCommentRepository
+
+    def get(self, comment_id: int) -> CommentInfo:
+        return self.shard_of(comment_id).get(comment_id)
+
+    def get_by_author(self, user_id: int) -> list[CommentInfo]:
+        return [c for comments in self.fan_out(lambda repo: repo.get_by_author(user_id)) for c in comments]
+
+    def get_by_author_fields(self, user_id: int, fields: tuple[str, ...]) -> list[dict]:
+        return [
+            c for comments in self.fan_out(lambda repo: repo.get_by_author_fields(user_id, fields))
+            for c in comments
+        ]
+
+    def get_many(self, comment_ids: list[int]) -> list[CommentInfo]:
+        return [c for path, ids in self.grouped(comment_ids).items() for c in self.repos[path].get_many(ids)]
+
+    def get_by_post(self, post_id: int) -> list[CommentInfo]:
+        return self.shard_of(post_id).get_by_post(post_id)
+
+    def get_by_post_fields(self, post_id: int, fields: tuple[str, ...]) -> list[dict]:
+        return self.shard_of(post_id).get_by_post_fields(post_id, fields)
+
+    def get_version(self, comment_id: int) -> ResourceVersion:
+        return self.shard_of(comment_id).get_version(comment_id)
+
+    def get_by_post_version(self, post_id: int) -> ResourceVersion:
+        return self.shard_of(post_id).get_by_post_version(post_id)
+
+    def get_stats_by_date(self, date_from: str, date_to: str):
+        counts = Counter()
+        for stats in self.fan_out(lambda repo: repo.get_stats_by_date(date_from, date_to)):
+            for day, status, count in stats:
+                counts[day, status] += count
+        return [(day, status, count) for (day, status), count in sorted(counts.items())]
+
+    def save(self, comment: Comment) -> Comment:
+        repo = self.shard_of(comment.post_id if comment.comment_id is None else comment.comment_id)
+        return repo.save(comment)
+
+    def add_to_post(self, post_id: int, author_id: int, body: str) -> CommentInfo:
+        return self.shard_of(post_id).add_to_post(post_id, author_id, body)
+
+    def add_many(self, author_id: int, comments: list[tuple[int, str]]) -> list[CommentInfo | None]:
+        results: list[CommentInfo | None] = [None] * len(comments)
+        positions: dict[str, list[int]] = {}
+        for position, (post_id, _) in enumerate(comments):
+            positions.setdefault(self.layout.path_of(post_id), []).append(position)
+        for path, shard_positions in positions.items():
+            added = self.repos[path].add_many(author_id, [comments[position] for position in shard_positions])
+            for position, comment in zip(shard_positions, added):
+                results[position] = comment
+        return results
+
+    def add_reply(self, comment_id: int, author_id: int, body: str) -> CommentInfo:
+        return self.shard_of(comment_id).add_reply(comment_id, author_id, body)
+
+    def edit_body(self, comment_id: int, author_id: int, body: str) -> CommentInfo:
+        return self.shard_of(comment_id).edit_body(comment_id, author_id, body)
+
+    def delete(self, comment_id: int) -> CommentInfo:
+        return self.shard_of(comment_id).delete(comment_id)
+
+    def has_replies(self, comment_id: int) -> bool:
+        return self.shard_of(comment_id).has_replies(comment_id)
+
+    def get_comments_to_reply(self) -> CommentsAutoreplyData:
+        return [row for rows in self.fan_out(SqliteCommentRepository.get_comments_to_reply) for row in rows]
+
+    def post_autoreply(self, comment_id: int, reply_text: str, post_id, post_author_id: int) -> None:
+        return self.shard_of(comment_id).post_autoreply(comment_id, reply_text, post_id, post_author_id)
+
@@ -0,0 +1,91 @@
+import os
+from contextlib import contextmanager
+from functools import partial
+from typing import TypeVar
+
+from ..db import sqlite_cm
+from ..types import RowFactoryType, SQLiteContextManager
+from .sqlite.base import ShardSlot, SqliteRepositoryBase
+
+Repo = TypeVar('Repo', bound=SqliteRepositoryBase)
+
+# bucket -> shard file, kept in the main database next to users
+SHARD_MAP_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS shard_buckets("
+    "   bucket INTEGER PRIMARY KEY, "
+    "   shard TEXT NOT NULL"
+    ");"
+)
+
+
+@contextmanager
+def shard_cm(
+        shard_path: str | os.PathLike,
+        users_path: str | os.PathLike,
+        row_factory: RowFactoryType | None = None,
+) -> SQLiteContextManager:
+    with sqlite_cm(shard_path, row_factory) as conn:
+        # shards have no users table of their own, unqualified "users" resolves to the main one
+        conn.execute("ATTACH DATABASE ? AS users_db;", (str(users_path), ))
+        yield conn
+
+
+def read_shard_map(users_path: str | os.PathLike) -> dict[int, str]:
+    with sqlite_cm(users_path) as db:
+        db.execute(SHARD_MAP_SCHEMA)
+        return dict(db.execute("SELECT bucket, shard FROM shard_buckets;").fetchall())
+
+
+def write_shard_map(users_path: str | os.PathLike, owners: dict[int, str]) -> None:
+    with sqlite_cm(users_path) as db:
+        db.execute(SHARD_MAP_SCHEMA)
+        db.executemany(
+            "INSERT INTO shard_buckets(bucket, shard) VALUES (?, ?) "
+            "ON CONFLICT(bucket) DO UPDATE SET shard = excluded.shard;",
+            owners.items()
+        )
+        db.commit()
+
+
+class Shards:
+    # posts and their comments live in the shard owning the post's virtual bucket,
+    # post_id % buckets; comment ids carry the same bucket, so both route without lookups
+    def __init__(self):
+        self.users_path: str | os.PathLike | None = None
+        self.buckets = 0
+        self.owners: dict[int, str] = {}
+
+    def configure(self, users_path: str | os.PathLike, paths: list[str], buckets: int) -> None:
+        owners = read_shard_map(users_path)
+        if not owners:
+            owners = {bucket: str(paths[bucket % len(paths)]) for bucket in range(buckets)}
+            write_shard_map(users_path, owners)
+        if len(owners) != buckets:
+            raise ValueError(f'Shard map has {len(owners)} buckets, settings ask for {buckets}')
+        if unknown := set(owners.values()) - {str(path) for path in paths}:
+            raise ValueError(f'Buckets are kept in shards missing from settings: {sorted(unknown)}')
+        self.users_path = users_path
+        self.buckets = buckets
+        self.owners = owners
+
+    @property
+    def paths(self) -> list[str]:
+        return sorted(set(self.owners.values()))
+
+    def path_of(self, entity_id: int) -> str:
+        return self.owners[entity_id % self.buckets]
+
+    def route(self, entity_id: int, default: str | os.PathLike) -> str | os.PathLike:
+        # database file holding a post or comment, the default one when not sharded
+        return self.path_of(entity_id) if self.owners else default
+
+    def repository(self, repo_type: type[Repo], path: str) -> Repo:
+        repo = repo_type(partial(shard_cm, shard_path=path, users_path=self.users_path))
+        repo.shard = ShardSlot(
+            self.buckets,
+            tuple(bucket for bucket, owner in self.owners.items() if owner == path),
+        )
+        return repo
+
+
+shards = Shards()
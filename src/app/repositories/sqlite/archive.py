@@ -0,0 +1,117 @@
+import sqlite3
+
+from ...archive import comment_archive
+from ...cache import response_cache, POST, POST_COMMENTS
+from ...schemas import CommentStatus
+from ..caching import comment_cache, post_cache
+from .base import SqliteRepositoryBase, NOW, chunked, placeholders
+
+# comments keep their ids in the archive, so restoring puts them back under the same rowid
+ARCHIVE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS archive.comments("
+    "   comment_id INTEGER PRIMARY KEY, "
+    "   author_id INTEGER, "
+    "   reply_to INTEGER, "
+    "   post_id INTEGER, "
+    "   body TEXT NOT NULL, "
+    "   status INTEGER NOT NULL, "
+    "   created_at INTEGER NOT NULL, "
+    "   updated_at INTEGER NOT NULL, "
+    "   autoreply_at INTEGER, "
+    "   reply_count INTEGER NOT NULL DEFAULT 0, "
+    f"   archived_at INTEGER NOT NULL DEFAULT ({NOW})"
+    ");"
+)
+
+COMMENT_FIELDS = 'author_id, reply_to, post_id, body, status, created_at, updated_at, autoreply_at, reply_count'
+
+
+def attach_archive(db: sqlite3.Connection) -> bool:
+    if comment_archive.path is None:
+        return False
+    db.execute("ATTACH DATABASE ? AS archive;", (str(comment_archive.path), ))
+    db.execute(ARCHIVE_SCHEMA)
+    return True
+
+
+class SqliteArchiveRepository(SqliteRepositoryBase):
+    def archive_comments(self, older_than: int | None, rejected: bool, limit: int) -> list[int]:
+        conditions = []
+        params: list[int] = []
+        if rejected:
+            conditions.append("status = ?")
+            params.append(int(CommentStatus.REJECTED))
+        if older_than is not None:
+            conditions.append("(status = ? AND created_at < ?)")
+            params.extend((int(CommentStatus.APPROVED), older_than))
+        if not conditions:
+            return []
+        with self.db() as db:
+            if not attach_archive(db):
+                return []
+            db.execute("BEGIN IMMEDIATE;")
+            # comments with hot replies stay until the replies go, keeping threads whole;
+            # the newest comment stays so its rowid is not handed out again
+            moved = db.execute(
+                "SELECT rowid, reply_to, post_id "
+                "FROM main.comments "
+                f"WHERE ({' OR '.join(conditions)}) "
+                "   AND reply_count = 0 "
+                "   AND rowid < (SELECT max(rowid) FROM main.comments) "
+                "ORDER BY rowid "
+                "LIMIT ?;",
+                (*params, limit)
+            ).fetchall()
+            if moved:
+                self._move(db, 'main', 'archive', [row[0] for row in moved])
+            db.commit()
+        self._invalidate(moved)
+        return [row[0] for row in moved]
+
+    def restore_comments(self, comment_ids: list[int]) -> list[int]:
+        restored = []
+        with self.db() as db:
+            if not attach_archive(db):
+                return []
+            db.execute("BEGIN IMMEDIATE;")
+            for chunk in chunked(comment_ids):
+                restored.extend(db.execute(
+                    "SELECT comment_id, reply_to, post_id "
+                    "FROM archive.comments "
+                    f"WHERE comment_id IN ({placeholders(len(chunk))}) "
+                    "   AND comment_id NOT IN (SELECT rowid FROM main.comments);",
+                    chunk
+                ))
+            if restored:
+                self._move(db, 'archive', 'main', [row[0] for row in restored])
+            db.commit()
+        self._invalidate(restored)
+        return [row[0] for row in restored]
+
+    @staticmethod
+    def _move(db: sqlite3.Connection, source: str, target: str, comment_ids: list[int]) -> None:
+        # the hot table triggers see a delete and an insert: counters, change log and search follow
+        source_id, target_id = ('rowid', 'comment_id') if source == 'main' else ('comment_id', 'rowid')
+        for chunk in chunked(comment_ids):
+            db.execute(
+                f"INSERT INTO {target}.comments({target_id}, {COMMENT_FIELDS}) "
+                f"SELECT {source_id}, {COMMENT_FIELDS} "
+                f"FROM {source}.comments "
+                f"WHERE {source_id} IN ({placeholders(len(chunk))});",
+                chunk
+            )
+            db.execute(
+                f"DELETE FROM {source}.comments WHERE {source_id} IN ({placeholders(len(chunk))});",
+                chunk
+            )
+
+    @staticmethod
+    def _invalidate(moved: list[tuple[int, int | None, int | None]]) -> None:
+        # the parents' reply_count and the posts' approved_comment_count moved with them
+        for comment_id, reply_to, post_id in moved:
+            comment_cache.invalidate(comment_id)
+            if reply_to is not None:
+                comment_cache.invalidate(reply_to)
+            if post_id is not None:
+                post_cache.invalidate(post_id)
+                response_cache.invalidate((POST_COMMENTS, post_id), (POST, post_id))
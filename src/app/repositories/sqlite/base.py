@@ -1,15 +1,82 @@
-from typing import Annotated, Any
+import random
+from typing import Annotated, Any, Iterator, NamedTuple, Sequence
 
 from fastapi import Depends
 
 from ...db import prepare_db
+from ...types import SQLiteExecutable
+
+# bound parameters per "IN (...)", well below SQLITE_MAX_VARIABLE_NUMBER of old builds
+IN_CHUNK_SIZE = 500
+
+
+# current time in the epoch seconds created_at/updated_at are stored in
+NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+def chunked(items: Sequence, size: int = IN_CHUNK_SIZE) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def placeholders(count: int) -> str:
+    return ', '.join('?' * count)
+
+
+# columns of the users join when a projection asks for the embedded author
+AUTHOR_COLUMNS = {
+    'user_id': 'u.rowid',
+    'email': 'u.email',
+    'autoreply_timeout': 'u.autoreply_timeout',
+}
+
+
+def projection(fields: Sequence[str], columns: dict[str, str]) -> tuple[str, bool]:
+    # select list for the requested fields only, and whether users has to be joined
+    selected = []
+    for name in fields:
+        if name == 'author':
+            selected.extend(f'{column} as author__{key}' for key, column in AUTHOR_COLUMNS.items())
+        else:
+            selected.append(f'{columns[name]} as {name}')
+    return ', '.join(selected), 'author' in fields
+
+
+def fields_factory(cursor: SQLiteExecutable, row: tuple[Any, ...]) -> dict[str, Any]:
+    item: dict[str, Any] = {}
+    for column, value in zip(cursor.description, row):
+        outer, _, inner = column[0].partition('__')
+        if inner:
+            item.setdefault(outer, {})[inner] = value
+        else:
+            item[outer] = value
+    return item
+
+
+class ShardSlot(NamedTuple):
+    # virtual buckets across all shards and the ones kept in this shard
+    buckets: int
+    owned: tuple[int, ...]
 
 
 class SqliteRepositoryBase:
+    # set on repositories reading and writing one shard of a sharded store
+    shard: ShardSlot | None = None
+
     def __init__(self, db: Annotated[Any, Depends(prepare_db)]):
         self.db = db
         self.row_factory = None
 
+    def new_rowid(self, table: str, bucket: str | None = None) -> str:
+        # NULL lets SQLite number the row. In a shard the id modulo the bucket count is the
+        # bucket of the post the row belongs to, new posts take one of the shard's buckets.
+        if self.shard is None:
+            return 'NULL'
+        buckets = self.shard.buckets
+        if bucket is None:
+            bucket = str(random.choice(self.shard.owned))
+        return f"(SELECT (ifnull(max(rowid), 0) / {buckets} + 1) * {buckets} + ({bucket}) % {buckets} FROM {table} newest)"
+
     def __call__(self):
         self._setup()
         return self
@@ -0,0 +1,45 @@
+from typing import Any
+
+from ...schemas import Change
+from ...types import SQLiteExecutable
+from ..exceptions import CursorExpired
+from .base import SqliteRepositoryBase
+
+
+def change_factory(cursor: SQLiteExecutable, row: tuple[Any, ...]) -> Change:
+    seq, entity, entity_id, op, status = row
+    return Change(seq=seq, entity=entity, id=entity_id, op=op, status=status)
+
+
+class SqliteChangeRepository(SqliteRepositoryBase):
+    def since(self, cursor: int, limit: int) -> list[Change]:
+        with self.db() as db:
+            # pruned entries leave a gap between the cursor and the oldest retained change
+            oldest, = db.execute(
+                "SELECT coalesce("
+                "   (SELECT min(seq) FROM changes), "
+                "   (SELECT seq + 1 FROM sqlite_sequence WHERE name = 'changes'), "
+                "   1"
+                ");"
+            ).fetchone()
+            if cursor + 1 < oldest:
+                raise CursorExpired()
+            db.row_factory = change_factory
+            cursor = db.execute(
+                "SELECT seq, entity, entity_id, op, status "
+                "FROM changes "
+                "WHERE seq > ? AND entity IN ('post', 'comment') "
+                "ORDER BY seq "
+                "LIMIT ?;",
+                (cursor, limit)
+            )
+            return cursor.fetchall()
+
+    def prune(self, older_than: int) -> int:
+        with self.db() as db:
+            cursor = db.execute(
+                "DELETE FROM changes WHERE changed_at < ?;",
+                (older_than, )
+            )
+            db.commit()
+            return cursor.rowcount
@@ -1,11 +1,16 @@
 import sqlite3
 import time
+from datetime import datetime, timezone
 from typing import Any
 
-from .base import SqliteRepositoryBase
-from ..exceptions import FetchingError, NoEntry
+from .archive import attach_archive
+from .base import SqliteRepositoryBase, NOW, chunked, placeholders, projection, fields_factory
+from ..exceptions import FetchingError, NoEntry, NotOwner, Conflict
 from ...comment_classifier import comment_queue
-from ...types import SQLiteExecutable, CommentsAutoreplyData
+from ...cache import response_cache, POST_COMMENTS
+from ..caching import comment_cache
+from ...moderation import ModerationTask
+from ...types import SQLiteExecutable, CommentsAutoreplyData, ResourceVersion
 from ...schemas import Comment, CommentInfo, User
 
 
@@ -21,6 +26,37 @@ def comment_factory(cursor: SQLiteExecutable, row: tuple[Any, ...]) -> CommentIn
     return comment
 
 
+COMMENT_COLUMNS = {
+    'comment_id': 'c.rowid',
+    'reply_to': 'c.reply_to',
+    'author_id': 'c.author_id',
+    'post_id': 'c.post_id',
+    'body': 'c.body',
+    'status': 'c.status',
+    'created_at': 'c.created_at',
+    'updated_at': 'c.updated_at',
+    'reply_count': 'c.reply_count',
+}
+
+# same shape as the joined select in get, so written rows can go straight to the cache
+COMMENT_RETURNING = (
+    "RETURNING "
+    "   author_id as user_id, "
+    "   (SELECT email FROM users WHERE rowid = author_id) as email, "
+    "   (SELECT autoreply_timeout FROM users WHERE rowid = author_id) as autoreply_timeout, "
+    "   rowid as comment_id, "
+    "   reply_to, "
+    "   author_id, "
+    "   post_id, "
+    "   body, "
+    "   status, "
+    "   created_at, "
+    f"   {NOW} as updated_at, "
+    "   autoreply_at, "
+    "   reply_count;"
+)
+
+
 class SqliteCommentRepository(SqliteRepositoryBase):
     def get(self, comment_id: int) -> CommentInfo:
         with self.db(row_factory=comment_factory) as db:
@@ -37,7 +73,8 @@ class SqliteCommentRepository(SqliteRepositoryBase):
                 "   c.status, "
                 "   c.created_at, "
                 "   c.updated_at, "
-                "   c.autoreply_at "
+                "   c.autoreply_at, "
+                "   c.reply_count "
                 "FROM comments c "
                 "INNER JOIN users u "
                 "ON u.rowid = c.author_id "
@@ -47,6 +84,30 @@ class SqliteCommentRepository(SqliteRepositoryBase):
             )
             if comment := cursor.fetchone():
                 return comment
+            if attach_archive(db):
+                cursor = db.execute(
+                    "SELECT "
+                    "   u.rowid as user_id, "
+                    "   u.email, "
+                    "   u.autoreply_timeout, "
+                    "   c.comment_id, "
+                    "   c.reply_to, "
+                    "   c.author_id, "
+                    "   c.post_id, "
+                    "   c.body, "
+                    "   c.status, "
+                    "   c.created_at, "
+                    "   c.updated_at, "
+                    "   c.autoreply_at, "
+                    "   c.reply_count "
+                    "FROM archive.comments c "
+                    "INNER JOIN main.users u "
+                    "ON u.rowid = c.author_id "
+                    "WHERE c.comment_id = ?;",
+                    (comment_id, )
+                )
+                if comment := cursor.fetchone():
+                    return comment
             raise NoEntry()
 
     def get_by_author(self, user_id) -> list[CommentInfo]:
@@ -64,7 +125,8 @@ class SqliteCommentRepository(SqliteRepositoryBase):
                 "   c.status, "
                 "   c.created_at, "
                 "   c.updated_at, "
-                "   c.autoreply_at "
+                "   c.autoreply_at, "
+                "   c.reply_count "
                 "FROM comments c "
                 "INNER JOIN users u "
                 "ON u.rowid = c.author_id "
@@ -73,6 +135,40 @@ class SqliteCommentRepository(SqliteRepositoryBase):
             )
             return cursor.fetchall()
 
+    def get_by_author_fields(self, user_id: int, fields: tuple[str, ...]) -> list[dict]:
+        return self._select_fields("c.author_id = ?", (user_id, ), fields)
+
+    def get_by_post_fields(self, post_id: int, fields: tuple[str, ...]) -> list[dict]:
+        return self._select_fields("c.post_id = ? AND c.status = 1", (post_id, ), fields)
+
+    def get_many(self, comment_ids: list[int]) -> list[CommentInfo]:
+        comments = []
+        with self.db(row_factory=comment_factory) as db:
+            for chunk in chunked(comment_ids):
+                cursor = db.execute(
+                    "SELECT "
+                    "   u.rowid as user_id, "
+                    "   u.email, "
+                    "   u.autoreply_timeout, "
+                    "   c.rowid as comment_id, "
+                    "   c.reply_to, "
+                    "   c.author_id, "
+                    "   c.post_id, "
+                    "   c.body, "
+                    "   c.status, "
+                    "   c.created_at, "
+                    "   c.updated_at, "
+                    "   c.autoreply_at, "
+                    "   c.reply_count "
+                    "FROM comments c "
+                    "INNER JOIN users u "
+                    "ON u.rowid = c.author_id "
+                    f"WHERE c.rowid IN ({placeholders(len(chunk))});",
+                    chunk
+                )
+                comments.extend(cursor.fetchall())
+        return comments
+
     def get_by_post(self, post_id: int) -> list[CommentInfo]:
         with self.db(row_factory=comment_factory) as db:
             cursor = db.execute(
@@ -88,7 +184,8 @@ class SqliteCommentRepository(SqliteRepositoryBase):
                 "   c.status, "
                 "   c.created_at, "
                 "   c.updated_at, "
-                "   c.autoreply_at "
+                "   c.autoreply_at, "
+                "   c.reply_count "
                 "FROM comments c "
                 "INNER JOIN users u "
                 "ON u.rowid = c.author_id "
@@ -97,12 +194,55 @@ class SqliteCommentRepository(SqliteRepositoryBase):
             )
             return cursor.fetchall()
 
+    def get_version(self, comment_id: int) -> ResourceVersion:
+        with self.db() as db:
+            row = db.execute(
+                "SELECT "
+                "   updated_at, "
+                "   rowid, "
+                "   (SELECT max(seq) FROM changes "
+                "    WHERE entity = 'comment' AND entity_id = comments.rowid), "
+                "   reply_count "
+                "FROM comments "
+                "WHERE rowid = ?;",
+                (comment_id, )
+            ).fetchone()
+            if row is None and attach_archive(db):
+                # archived comments do not change, their change log entries may be pruned
+                row = db.execute(
+                    "SELECT updated_at, comment_id, NULL, reply_count "
+                    "FROM archive.comments "
+                    "WHERE comment_id = ?;",
+                    (comment_id, )
+                ).fetchone()
+            if row is None:
+                raise NoEntry()
+            last_modified, *fingerprint = row
+            return ResourceVersion(last_modified, tuple(fingerprint))
+
+    def get_by_post_version(self, post_id: int) -> ResourceVersion:
+        with self.db() as db:
+            last_modified, *fingerprint = db.execute(
+                "SELECT "
+                "   max(updated_at), "
+                "   count(*), "
+                "   max(rowid), "
+                "   (SELECT seq FROM changes NOT INDEXED "
+                "    WHERE entity = 'comment' ORDER BY seq DESC LIMIT 1) "
+                "FROM comments "
+                "WHERE post_id = ? AND status = 1;",
+                (post_id, )
+            ).fetchone()
+            return ResourceVersion(last_modified, tuple(fingerprint))
+
     def get_stats_by_date(self, date_from: str, date_to: str):
         with self.db() as db:
             cursor = db.execute(
-                "SELECT date(created_at) as day, status, COUNT(*) "
+                "SELECT date(created_at, 'unixepoch') as day, status, COUNT(*) "
                 "FROM comments "
-                "WHERE day >= ? AND day <= ? "
+                # bounds on the bare column so the created_at index serves the range
+                "WHERE created_at >= CAST(strftime('%s', ?) AS INTEGER) "
+                "   AND created_at < CAST(strftime('%s', ?, '+1 day') AS INTEGER) "
                 "GROUP BY status, day "
                 "ORDER BY day;",
                 (date_from, date_to)
@@ -112,19 +252,151 @@ class SqliteCommentRepository(SqliteRepositoryBase):
     def save(self, comment: Comment) -> Comment:
         handler = self._new_comment if comment.comment_id is None else self._edit_comment
         saved_comment = handler(comment)
-        comment_queue.put((saved_comment.comment_id, saved_comment.body))
+        self._submitted(saved_comment)
         return saved_comment
 
+    def add_to_post(self, post_id: int, author_id: int, body: str) -> CommentInfo:
+        # autoreply deadline comes from the post author's settings in the same statement
+        with self.db(row_factory=comment_factory) as db:
+            cursor = db.execute(
+                "INSERT INTO comments (rowid, author_id, post_id, body, autoreply_at) "
+                "SELECT "
+                f"   {self.new_rowid('comments', 'p.rowid')}, "
+                "   ?, "
+                "   p.rowid, "
+                "   ?, "
+                f"   {NOW} + u.autoreply_timeout * 60 "
+                "FROM posts p "
+                "LEFT JOIN users u "
+                "ON u.rowid = p.author_id "
+                "WHERE p.rowid = ? " + COMMENT_RETURNING,
+                (author_id, body, post_id)
+            )
+            comment = cursor.fetchone()
+            if comment is None:
+                raise NoEntry()
+            db.commit()
+        self._submitted(comment)
+        return comment
+
+    def add_many(self, author_id: int, comments: list[tuple[int, str]]) -> list[CommentInfo | None]:
+        # comments to missing posts come back as None at their position
+        post_ids = list({post_id for post_id, _ in comments})
+        with self.db() as db:
+            # the write lock keeps the new rowids contiguous, so they can be read back by range
+            db.execute("BEGIN IMMEDIATE;")
+            existing = set()
+            for chunk in chunked(post_ids):
+                existing.update(row[0] for row in db.execute(
+                    f"SELECT rowid FROM posts WHERE rowid IN ({placeholders(len(chunk))});",
+                    chunk
+                ))
+            last_id, = db.execute("SELECT ifnull(max(rowid), 0) FROM comments;").fetchone()
+            db.executemany(
+                "INSERT INTO comments (rowid, author_id, post_id, body, autoreply_at) "
+                "SELECT "
+                f"   {self.new_rowid('comments', 'p.rowid')}, "
+                "   ?, "
+                "   p.rowid, "
+                "   ?, "
+                f"   {NOW} + u.autoreply_timeout * 60 "
+                "FROM posts p "
+                "LEFT JOIN users u "
+                "ON u.rowid = p.author_id "
+                "WHERE p.rowid = ?;",
+                ((author_id, body, post_id) for post_id, body in comments if post_id in existing),
+            )
+            db.row_factory = comment_factory
+            saved = iter(db.execute(
+                "SELECT "
+                "   u.rowid as user_id, "
+                "   u.email, "
+                "   u.autoreply_timeout, "
+                "   c.rowid as comment_id, "
+                "   c.reply_to, "
+                "   c.author_id, "
+                "   c.post_id, "
+                "   c.body, "
+                "   c.status, "
+                "   c.created_at, "
+                "   c.updated_at, "
+                "   c.autoreply_at, "
+                "   c.reply_count "
+                "FROM comments c "
+                "INNER JOIN users u "
+                "ON u.rowid = c.author_id "
+                "WHERE c.rowid > ? "
+                "ORDER BY c.rowid;",
+                (last_id, )
+            ).fetchall())
+            db.commit()
+        results = [next(saved) if post_id in existing else None for post_id, _ in comments]
+        saved_comments = [comment for comment in results if comment is not None]
+        response_cache.invalidate(*{(POST_COMMENTS, comment.post_id) for comment in saved_comments})
+        if saved_comments:
+            # one group, the classifier worker takes it apart
+            comment_queue.put([self._moderation_task(comment) for comment in saved_comments])
+        return results
+
+    def add_reply(self, comment_id: int, author_id: int, body: str) -> CommentInfo:
+        with self.db(row_factory=comment_factory) as db:
+            cursor = db.execute(
+                "INSERT INTO comments (rowid, author_id, reply_to, post_id, body) "
+                f"SELECT {self.new_rowid('comments', 'parent.post_id')}, ?, parent.rowid, parent.post_id, ? "
+                "FROM comments parent "
+                "WHERE parent.rowid = ? AND parent.reply_to IS NULL " + COMMENT_RETURNING,
+                (author_id, body, comment_id)
+            )
+            comment = cursor.fetchone()
+            if comment is None:
+                # nothing written, find out why
+                db.row_factory = None
+                if db.execute("SELECT 1 FROM comments WHERE rowid = ?;", (comment_id, )).fetchone():
+                    raise Conflict('Replies cannot be replied')
+                raise NoEntry()
+            db.commit()
+        self._submitted(comment)
+        # reply_count of the parent went up
+        comment_cache.invalidate(comment_id)
+        return comment
+
+    def edit_body(self, comment_id: int, author_id: int, body: str) -> CommentInfo:
+        with self.db(row_factory=comment_factory) as db:
+            cursor = db.execute(
+                "UPDATE comments "
+                "SET body = ? "
+                "WHERE rowid = ? "
+                "   AND author_id = ? "
+                "   AND reply_count = 0 "
+                + COMMENT_RETURNING,
+                (body, comment_id, author_id)
+            )
+            comment = cursor.fetchone()
+            if comment is None:
+                db.row_factory = None
+                row = db.execute(
+                    "SELECT author_id FROM comments WHERE rowid = ?;",
+                    (comment_id, )
+                ).fetchone()
+                if row is None:
+                    raise NoEntry()
+                if row[0] != author_id:
+                    raise NotOwner()
+                raise Conflict('Comment is already replied')
+            db.commit()
+        self._submitted(comment)
+        return comment
+
     def delete(self, comment_id: int) -> CommentInfo:
         ...
 
     def has_replies(self, comment_id: int) -> bool:
         with self.db() as db:
-            cursor = db.execute(
-                "SELECT COUNT(*) FROM comments WHERE reply_to = ?;",
+            row = db.execute(
+                "SELECT reply_count FROM comments WHERE rowid = ?;",
                 (comment_id, )
-            )
-            return True if cursor.fetchone()[0] != 0 else False
+            ).fetchone()
+            return row is not None and row[0] != 0
 
     def get_comments_to_reply(self) -> CommentsAutoreplyData:
         with self.db() as db:
@@ -154,24 +426,59 @@ class SqliteCommentRepository(SqliteRepositoryBase):
                 (comment_id, )
             )
             cursor.execute(
-                "INSERT INTO comments (author_id, reply_to, post_id, body) "
-                "VALUES (?, ?, ?, ?);",
+                "INSERT INTO comments (rowid, author_id, reply_to, post_id, body) "
+                f"VALUES ({self.new_rowid('comments', str(int(post_id)))}, ?, ?, ?, ?);",
                 (post_author_id, comment_id, post_id, reply_text)
             )
-            comment_queue.put((cursor.lastrowid, reply_text))
+            comment_queue.put(ModerationTask(
+                cursor.lastrowid,
+                reply_text,
+                post_author_id,
+                post_id,
+                post_author_id,
+                autoreply=True,
+            ))
             db.commit()
+        comment_cache.invalidate(comment_id)
+        response_cache.invalidate((POST_COMMENTS, post_id))
+
+    def _select_fields(self, where: str, params: tuple, fields: tuple[str, ...]) -> list[dict]:
+        # only the requested columns are read, users is joined for the author alone
+        columns, join_author = projection(fields, COMMENT_COLUMNS)
+        with self.db(row_factory=fields_factory) as db:
+            cursor = db.execute(
+                f"SELECT {columns} "
+                "FROM comments c "
+                + ("INNER JOIN users u ON u.rowid = c.author_id " if join_author else "")
+                + f"WHERE {where};",
+                params
+            )
+            return cursor.fetchall()
+
+    def _submitted(self, comment: CommentInfo) -> None:
+        response_cache.invalidate((POST_COMMENTS, comment.post_id))
+        comment_queue.put(self._moderation_task(comment))
+
+    @staticmethod
+    def _moderation_task(comment: CommentInfo) -> ModerationTask:
+        return ModerationTask(
+            comment.comment_id,
+            comment.body,
+            comment.author_id,
+            comment.post_id,
+        )
 
     def _new_comment(self, comment: Comment) -> Comment:
         with self.db() as db:
             cursor = db.execute(
-                "INSERT INTO comments (reply_to, author_id, post_id, body, autoreply_at) "
-                "VALUES (:reply_to, :author_id, :post_id, :body, :autoreply_at) "
-                "RETURNING current_timestamp, status",
+                "INSERT INTO comments (rowid, reply_to, author_id, post_id, body, autoreply_at) "
+                f"VALUES ({self.new_rowid('comments', ':post_id')}, :reply_to, :author_id, :post_id, :body, :autoreply_at) "
+                f"RETURNING {NOW}, status",
                 comment.model_dump()
             )
             if row := cursor.fetchone():
                 comment.comment_id = cursor.lastrowid
-                comment.created_at = comment.updated_at = row[0]
+                comment.created_at = comment.updated_at = datetime.fromtimestamp(row[0], timezone.utc)
                 comment.status = row[1]
                 db.commit()
                 return comment
@@ -186,7 +493,7 @@ class SqliteCommentRepository(SqliteRepositoryBase):
                 "   status = ?, "
                 "   autoreply_at = ? "
                 "WHERE rowid = ? "
-                "RETURNING current_timestamp, status;",
+                f"RETURNING {NOW}, status;",
                 (
                     comment.body,
                     comment.status,
@@ -195,7 +502,8 @@ class SqliteCommentRepository(SqliteRepositoryBase):
                 )
             )
             if row := cursor.fetchone():
-                comment.updated_at, comment.status = row
+                comment.updated_at = datetime.fromtimestamp(row[0], timezone.utc)
+                comment.status = row[1]
                 db.commit()
                 return comment
             raise NoEntry()
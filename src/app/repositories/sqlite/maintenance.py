@@ -0,0 +1,71 @@
+import time
+from typing import Any
+
+from ...schemas import MaintenanceRun
+from ...types import SQLiteExecutable
+from .base import SqliteRepositoryBase
+
+# PRAGMA auto_vacuum values
+INCREMENTAL = 2
+
+MAINTENANCE_RUN_COLUMNS = (
+    "run_id, started_at, duration, pages_before, pages_after, pages_reclaimed, wal_frames_checkpointed, full_vacuum"
+)
+
+
+def maintenance_run_factory(cursor: SQLiteExecutable, row: tuple[Any, ...]) -> MaintenanceRun:
+    return MaintenanceRun(**{column[0]: value for column, value in zip(cursor.description, row)})
+
+
+class SqliteMaintenanceRepository(SqliteRepositoryBase):
+    def run(self, analysis_limit: int) -> MaintenanceRun:
+        started_at = int(time.time())
+        started = time.perf_counter()
+        with self.db() as db:
+            pages_before, = db.execute("PRAGMA page_count;").fetchone()
+            full_vacuum = db.execute("PRAGMA auto_vacuum;").fetchone()[0] != INCREMENTAL
+            if full_vacuum:
+                # the mode of a database with tables changes with a rebuild only, once
+                db.execute(f"PRAGMA auto_vacuum = {INCREMENTAL};")
+                db.execute("VACUUM;")
+            else:
+                # frees a page per step and returns no rows, execute would stop after the first one
+                db.executescript("PRAGMA incremental_vacuum;")
+            # statistics from a sample of each index, a full scan would hold the lock for long
+            db.execute(f"PRAGMA analysis_limit = {int(analysis_limit)};")
+            db.execute("ANALYZE;")
+            db.execute("PRAGMA optimize;")
+            # (0, -1, -1) outside WAL mode
+            _, wal_frames, checkpointed = db.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchone()
+            pages_after, = db.execute("PRAGMA page_count;").fetchone()
+            db.row_factory = maintenance_run_factory
+            run = db.execute(
+                "INSERT INTO maintenance_runs("
+                "   started_at, duration, pages_before, pages_after, pages_reclaimed, "
+                "   wal_frames_checkpointed, full_vacuum"
+                ") "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                f"RETURNING {MAINTENANCE_RUN_COLUMNS};",
+                (
+                    started_at,
+                    time.perf_counter() - started,
+                    pages_before,
+                    pages_after,
+                    pages_before - pages_after,
+                    checkpointed if wal_frames >= 0 else None,
+                    full_vacuum,
+                )
+            ).fetchone()
+            db.commit()
+        return run
+
+    def recent(self, limit: int) -> list[MaintenanceRun]:
+        with self.db(row_factory=maintenance_run_factory) as db:
+            cursor = db.execute(
+                f"SELECT {MAINTENANCE_RUN_COLUMNS} "
+                "FROM maintenance_runs "
+                "ORDER BY run_id DESC "
+                "LIMIT ?;",
+                (limit, )
+            )
+            return cursor.fetchall()
@@ -1,10 +1,11 @@
-import sqlite3
+from datetime import datetime, timezone
 from typing import Any
 
-from ...schemas import Post, User
-from ...types import SQLiteExecutable
-from ..exceptions import NoEntry, FetchingError
-from .base import SqliteRepositoryBase
+from ...cache import response_cache, POST
+from ...schemas import Post, PostThread, ThreadComment, User
+from ...types import SQLiteExecutable, ResourceVersion
+from ..exceptions import NoEntry, FetchingError, NotOwner
+from .base import SqliteRepositoryBase, NOW, chunked, placeholders, projection, fields_factory
 
 
 def post_factory(cursor: SQLiteExecutable, row: tuple[Any, ...]) -> Post:
@@ -19,6 +20,17 @@ def post_factory(cursor: SQLiteExecutable, row: tuple[Any, ...]) -> Post:
     return post
 
 
+POST_COLUMNS = {
+    'post_id': 'p.rowid',
+    'author_id': 'p.author_id',
+    'title': 'p.title',
+    'body': 'p.body',
+    'created_at': 'p.created_at',
+    'updated_at': 'p.updated_at',
+    'approved_comment_count': 'p.approved_comment_count',
+}
+
+
 class SqlitePostRepository(SqliteRepositoryBase):
     def _setup(self):
         self.row_factory = post_factory
@@ -35,7 +47,8 @@ class SqlitePostRepository(SqliteRepositoryBase):
                 "   p.title, "
                 "   p.body, "
                 "   p.created_at, "
-                "   p.updated_at "
+                "   p.updated_at, "
+                "   p.approved_comment_count "
                 "FROM posts p "
                 "INNER JOIN users u "
                 "ON p.author_id = u.rowid "
@@ -43,6 +56,18 @@ class SqlitePostRepository(SqliteRepositoryBase):
             )
             return cursor.fetchall()
 
+    def all_fields(self, fields: tuple[str, ...]) -> list[dict]:
+        # only the requested columns are read, users is joined for the author alone
+        columns, join_author = projection(fields, POST_COLUMNS)
+        with self.db(row_factory=fields_factory) as db:
+            cursor = db.execute(
+                f"SELECT {columns} "
+                "FROM posts p "
+                + ("INNER JOIN users u ON p.author_id = u.rowid " if join_author else "")
+                + "ORDER BY p.created_at DESC;"
+            )
+            return cursor.fetchall()
+
     def get(self, post_id: int) -> Post:
         with self.db(row_factory=post_factory) as db:
             cursor = db.execute(
@@ -55,7 +80,8 @@ class SqlitePostRepository(SqliteRepositoryBase):
                 "   p.title, "
                 "   p.body, "
                 "   p.created_at, "
-                "   p.updated_at "
+                "   p.updated_at, "
+                "   p.approved_comment_count "
                 "FROM posts p "
                 "INNER JOIN users u "
                 "ON p.author_id = u.rowid "
@@ -79,7 +105,8 @@ class SqlitePostRepository(SqliteRepositoryBase):
                 "   p.title, "
                 "   p.body, "
                 "   p.created_at, "
-                "   p.updated_at "
+                "   p.updated_at, "
+                "   p.approved_comment_count "
                 "FROM posts p "
                 "INNER JOIN users u "
                 "ON p.author_id = u.rowid "
@@ -88,9 +115,219 @@ class SqlitePostRepository(SqliteRepositoryBase):
             )
             return cursor.fetchall()
 
+    def get_many(self, post_ids: list[int]) -> list[Post]:
+        posts = []
+        with self.db(row_factory=post_factory) as db:
+            for chunk in chunked(post_ids):
+                cursor = db.execute(
+                    "SELECT "
+                    "   u.rowid as user_id, "
+                    "   u.email, "
+                    "   u.autoreply_timeout, "
+                    "   p.rowid as post_id, "
+                    "   p.author_id, "
+                    "   p.title, "
+                    "   p.body, "
+                    "   p.created_at, "
+                    "   p.updated_at, "
+                    "   p.approved_comment_count "
+                    "FROM posts p "
+                    "INNER JOIN users u "
+                    "ON p.author_id = u.rowid "
+                    f"WHERE p.rowid IN ({placeholders(len(chunk))});",
+                    chunk,
+                )
+                posts.extend(cursor.fetchall())
+        return posts
+
+    def all_version(self) -> ResourceVersion:
+        with self.db() as db:
+            last_modified, *fingerprint = db.execute(
+                "SELECT "
+                "   max(updated_at), "
+                "   count(*), "
+                "   max(rowid), "
+                "   (SELECT seq FROM changes NOT INDEXED "
+                "    WHERE entity = 'post' ORDER BY seq DESC LIMIT 1), "
+                # approved comment counts are part of the list
+                "   (SELECT seq FROM changes NOT INDEXED "
+                "    WHERE entity = 'comment' ORDER BY seq DESC LIMIT 1) "
+                "FROM posts;"
+            ).fetchone()
+            return ResourceVersion(last_modified, tuple(fingerprint))
+
+    def get_version(self, post_id: int) -> ResourceVersion:
+        with self.db() as db:
+            row = db.execute(
+                "SELECT "
+                "   updated_at, "
+                "   rowid, "
+                "   (SELECT max(seq) FROM changes "
+                "    WHERE entity = 'post' AND entity_id = posts.rowid), "
+                "   approved_comment_count "
+                "FROM posts "
+                "WHERE rowid = ?;",
+                (post_id, )
+            ).fetchone()
+            if row is None:
+                raise NoEntry
+            last_modified, *fingerprint = row
+            return ResourceVersion(last_modified, tuple(fingerprint))
+
+    def get_thread(self, post_id: int, max_depth: int, max_comments: int) -> PostThread:
+        with self.db() as db:
+            # one read transaction, the post and its comments come from the same snapshot
+            db.execute("BEGIN;")
+            post = db.execute(
+                "SELECT "
+                "   p.rowid, p.author_id, p.title, p.body, p.created_at, p.updated_at, "
+                "   u.email, u.autoreply_timeout "
+                "FROM posts p "
+                "LEFT JOIN users u "
+                "ON u.rowid = p.author_id "
+                "WHERE p.rowid = ?;",
+                (post_id, )
+            ).fetchone()
+            if post is None:
+                db.rollback()
+                raise NoEntry
+            # breadth first, so a parent is always ahead of its replies when the limit cuts the tree
+            rows = db.execute(
+                "WITH RECURSIVE thread(comment_id, reply_to, author_id, body, created_at, updated_at, depth) AS ("
+                "   SELECT rowid, reply_to, author_id, body, created_at, updated_at, 0 "
+                "   FROM comments "
+                "   WHERE post_id = ? AND reply_to IS NULL AND status = 1 "
+                "   UNION ALL "
+                "   SELECT c.rowid, c.reply_to, c.author_id, c.body, c.created_at, c.updated_at, t.depth + 1 "
+                "   FROM comments c "
+                "   INNER JOIN thread t "
+                "   ON c.reply_to = t.comment_id "
+                "   WHERE c.status = 1 AND t.depth < ? "
+                ") "
+                "SELECT "
+                "   t.comment_id, t.reply_to, t.author_id, t.body, t.created_at, t.updated_at, t.depth, "
+                "   u.email, u.autoreply_timeout, "
+                "   t.depth = ? AND EXISTS ("
+                "       SELECT 1 FROM comments r WHERE r.reply_to = t.comment_id AND r.status = 1"
+                "   ) "
+                "FROM thread t "
+                "LEFT JOIN users u "
+                "ON u.rowid = t.author_id "
+                "ORDER BY t.depth, t.comment_id "
+                "LIMIT ?;",
+                (post_id, max_depth, max_depth, max_comments + 1)
+            ).fetchall()
+            db.rollback()
+
+        post_id, author_id, title, body, created_at, updated_at, email, autoreply_timeout = post
+        authors = {}
+        if email is not None:
+            authors[author_id] = User(user_id=author_id, email=email, autoreply_timeout=autoreply_timeout)
+        truncated = len(rows) > max_comments
+        comments: list[ThreadComment] = []
+        nodes: dict[int, ThreadComment] = {}
+        for (
+                comment_id, reply_to, comment_author_id, comment_body, comment_created_at, comment_updated_at,
+                depth, comment_author_email, comment_author_timeout, has_deeper_replies,
+        ) in rows[:max_comments]:
+            node = ThreadComment(
+                comment_id=comment_id,
+                author_id=comment_author_id,
+                body=comment_body,
+                created_at=comment_created_at,
+                updated_at=comment_updated_at,
+            )
+            nodes[comment_id] = node
+            (comments if reply_to is None else nodes[reply_to].replies).append(node)
+            truncated = truncated or bool(has_deeper_replies)
+            if comment_author_email is not None and comment_author_id not in authors:
+                authors[comment_author_id] = User(
+                    user_id=comment_author_id,
+                    email=comment_author_email,
+                    autoreply_timeout=comment_author_timeout,
+                )
+        return PostThread(
+            post_id=post_id,
+            author_id=author_id,
+            title=title,
+            body=body,
+            created_at=created_at,
+            updated_at=updated_at,
+            authors=authors,
+            comments=comments,
+            truncated=truncated,
+        )
+
     def save(self, post: Post) -> Post:
         handler = self._new_post if post.post_id is None else self._edit_post
-        return handler(post)
+        saved_post = handler(post)
+        response_cache.invalidate((POST, saved_post.post_id))
+        return saved_post
+
+    def add_many(self, author_id: int, posts: list[tuple[str, str]]) -> list[Post]:
+        with self.db() as db:
+            # the write lock keeps the new rowids contiguous, so they can be read back by range
+            db.execute("BEGIN IMMEDIATE;")
+            last_id, = db.execute("SELECT ifnull(max(rowid), 0) FROM posts;").fetchone()
+            db.row_factory = post_factory
+            db.executemany(
+                "INSERT INTO posts (rowid, author_id, title, body) "
+                f"VALUES({self.new_rowid('posts')}, ?, ?, ?);",
+                ((author_id, title, body) for title, body in posts),
+            )
+            cursor = db.execute(
+                "SELECT "
+                "   u.rowid as user_id, "
+                "   u.email, "
+                "   u.autoreply_timeout, "
+                "   p.rowid as post_id, "
+                "   p.author_id, "
+                "   p.title, "
+                "   p.body, "
+                "   p.created_at, "
+                "   p.updated_at, "
+                "   p.approved_comment_count "
+                "FROM posts p "
+                "INNER JOIN users u "
+                "ON p.author_id = u.rowid "
+                "WHERE p.rowid > ? "
+                "ORDER BY p.rowid;",
+                (last_id, ),
+            )
+            saved_posts = cursor.fetchall()
+            db.commit()
+        return saved_posts
+
+    def edit(self, post_id: int, author_id: int, title: str, body: str) -> Post:
+        with self.db(row_factory=post_factory) as db:
+            cursor = db.execute(
+                "UPDATE posts "
+                "SET "
+                "   title = ?, "
+                "   body = ? "
+                "WHERE rowid = ? AND author_id = ? "
+                "RETURNING "
+                "   author_id as user_id, "
+                "   (SELECT email FROM users WHERE rowid = author_id) as email, "
+                "   (SELECT autoreply_timeout FROM users WHERE rowid = author_id) as autoreply_timeout, "
+                "   rowid as post_id, "
+                "   author_id, "
+                "   title, "
+                "   body, "
+                "   created_at, "
+                f"   {NOW} as updated_at, "
+                "   approved_comment_count;",
+                (title, body, post_id, author_id),
+            )
+            post = cursor.fetchone()
+            if post is None:
+                db.row_factory = None
+                if db.execute("SELECT 1 FROM posts WHERE rowid = ?;", (post_id, )).fetchone():
+                    raise NotOwner()
+                raise NoEntry("Such post does not exist")
+            db.commit()
+        response_cache.invalidate((POST, post_id))
+        return post
 
     def delete(self, post_id: int) -> Post:
         ...
@@ -98,17 +335,26 @@ class SqlitePostRepository(SqliteRepositoryBase):
     def _new_post(self, post: Post) -> Post:
         if post.author is None:
             raise ValueError("Post object must contain author instance")
-        with self.db() as db:
-            result: sqlite3.Cursor = db.execute(
-                "INSERT INTO posts (author_id, title, body) "
-                "VALUES(?, ?, ?) "
-                "RETURNING created_at, updated_at;",
+        with self.db(row_factory=post_factory) as db:
+            cursor = db.execute(
+                "INSERT INTO posts (rowid, author_id, title, body) "
+                f"VALUES({self.new_rowid('posts')}, ?, ?, ?) "
+                "RETURNING "
+                "   author_id as user_id, "
+                "   (SELECT email FROM users WHERE rowid = author_id) as email, "
+                "   (SELECT autoreply_timeout FROM users WHERE rowid = author_id) as autoreply_timeout, "
+                "   rowid as post_id, "
+                "   author_id, "
+                "   title, "
+                "   body, "
+                "   created_at, "
+                "   updated_at, "
+                "   approved_comment_count;",
                 (post.author_id, post.title, post.body),
             )
-            post.post_id = result.lastrowid
-            post.created_at, post.updated_at = result.fetchone()
+            saved_post = cursor.fetchone()
             db.commit()
-        return post
+        return saved_post
 
     def _edit_post(self, post: Post) -> Post:
         with self.db() as db:
@@ -118,11 +364,11 @@ class SqlitePostRepository(SqliteRepositoryBase):
                 "   title = ?, "
                 "   body = ? "
                 "WHERE rowid = ? "
-                "RETURNING current_timestamp;",
+                f"RETURNING {NOW};",
                 (post.title, post.body, post.post_id),
             )
             if row := result.fetchone():
-                post.updated_at, = row
+                post.updated_at = datetime.fromtimestamp(row[0], timezone.utc)
                 db.commit()
                 return post
             raise NoEntry("Such post does not exist")
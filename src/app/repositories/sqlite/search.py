@@ -0,0 +1,75 @@
+from typing import Any, Literal
+
+from ...schemas import SearchHit
+from ...types import SQLiteExecutable
+from .base import SqliteRepositoryBase
+
+
+def search_factory(cursor: SQLiteExecutable, row: tuple[Any, ...]) -> SearchHit:
+    entity, entity_id, post_id, title, snippet, rank = row
+    return SearchHit(entity=entity, id=entity_id, post_id=post_id, title=title, snippet=snippet, rank=rank)
+
+
+def fts_query(text: str) -> str:
+    # every word is matched as a quoted string, so user input cannot form FTS5 syntax;
+    # a trailing * keeps its prefix meaning
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+    if not terms:
+        raise ValueError('Nothing to search for')
+    return ' '.join(terms)
+
+
+POSTS_SEARCH = (
+    "SELECT "
+    "   'post', "
+    "   rowid, "
+    "   rowid, "
+    "   title, "
+    "   snippet(posts_fts, -1, '<mark>', '</mark>', '…', 16), "
+    "   rank "
+    "FROM posts_fts "
+    "WHERE posts_fts MATCH :query"
+)
+
+COMMENTS_SEARCH = (
+    "SELECT "
+    "   'comment', "
+    "   f.rowid, "
+    "   c.post_id, "
+    "   NULL, "
+    "   snippet(comments_fts, 0, '<mark>', '</mark>', '…', 16), "
+    "   f.rank "
+    "FROM comments_fts f "
+    "INNER JOIN comments c "
+    "ON c.rowid = f.rowid "
+    "WHERE comments_fts MATCH :query"
+)
+
+
+class SqliteSearchRepository(SqliteRepositoryBase):
+    def search(
+            self,
+            text: str,
+            scope: Literal['all', 'posts', 'comments'],
+            limit: int,
+            offset: int,
+    ) -> list[SearchHit]:
+        selects = {
+            'all': f"{POSTS_SEARCH} UNION ALL {COMMENTS_SEARCH}",
+            'posts': POSTS_SEARCH,
+            'comments': COMMENTS_SEARCH,
+        }
+        with self.db(row_factory=search_factory) as db:
+            # bm25 rank, lower is better; both indexes score on the same scale
+            cursor = db.execute(
+                f"SELECT * FROM ({selects[scope]}) "
+                "ORDER BY rank "
+                "LIMIT :limit OFFSET :offset;",
+                {'query': fts_query(text), 'limit': limit, 'offset': offset}
+            )
+            return cursor.fetchall()
@@ -0,0 +1,98 @@
+from .db import initialize_db, sqlite_cm
+from .repositories.shards import Shards, read_shard_map, write_shard_map
+from .settings import Settings, get_settings
+
+# counters are left out, the triggers of the target rebuild them as the rows arrive
+POST_COLUMNS = 'author_id, title, body, created_at, updated_at'
+COMMENT_COLUMNS = 'author_id, reply_to, post_id, body, status, created_at, updated_at, autoreply_at'
+
+
+def plan_moves(owners: dict[int, str], paths: list[str]) -> dict[int, str]:
+    # spreads the buckets evenly over paths, moving as few of them as possible
+    quota = {path: len(owners) // len(paths) + (index < len(owners) % len(paths)) for index, path in enumerate(paths)}
+    kept = dict.fromkeys(paths, 0)
+    loose = []
+    for bucket, owner in sorted(owners.items()):
+        if kept.get(owner, 0) < quota.get(owner, 0):
+            kept[owner] += 1
+        else:
+            loose.append(bucket)
+    moves = {}
+    for path in paths:
+        while kept[path] < quota[path]:
+            moves[loose.pop()] = path
+            kept[path] += 1
+    return moves
+
+
+def move_bucket(settings: Settings, bucket: int, source: str, target: str) -> None:
+    buckets = settings.shard_buckets
+    # copy, switch the map, then delete; a rerun after a crash copies nothing twice
+    # and sweep_shard clears the leftovers
+    with sqlite_cm(target) as db:
+        db.execute("ATTACH DATABASE ? AS source;", (source, ))
+        db.execute("BEGIN IMMEDIATE;")
+        db.execute(
+            f"INSERT OR IGNORE INTO main.posts(rowid, {POST_COLUMNS}) "
+            f"SELECT rowid, {POST_COLUMNS} FROM source.posts "
+            "WHERE rowid % ? = ? "
+            "ORDER BY rowid;",
+            (buckets, bucket)
+        )
+        # replies come after the comments they answer
+        db.execute(
+            f"INSERT OR IGNORE INTO main.comments(rowid, {COMMENT_COLUMNS}) "
+            f"SELECT rowid, {COMMENT_COLUMNS} FROM source.comments "
+            "WHERE rowid % ? = ? "
+            "ORDER BY rowid;",
+            (buckets, bucket)
+        )
+        db.commit()
+    write_shard_map(settings.db_path, {bucket: target})
+    with sqlite_cm(source) as db:
+        db.execute("DELETE FROM comments WHERE rowid % ? = ?;", (buckets, bucket))
+        db.execute("DELETE FROM posts WHERE rowid % ? = ?;", (buckets, bucket))
+        db.commit()
+
+
+def sweep_shard(settings: Settings, path: str, owned: list[int]) -> None:
+    with sqlite_cm(path) as db:
+        db.execute("CREATE TEMP TABLE owned(bucket INTEGER PRIMARY KEY);")
+        db.executemany("INSERT INTO temp.owned VALUES (?);", ((bucket, ) for bucket in owned))
+        for table in ('comments', 'posts'):
+            db.execute(
+                f"DELETE FROM {table} WHERE rowid % ? NOT IN (SELECT bucket FROM temp.owned);",
+                (settings.shard_buckets, )
+            )
+        db.commit()
+
+
+def reshard(settings: Settings) -> int:
+    # run with the application stopped: shards pick ids from the buckets they owned at startup
+    initialize_db(settings)
+    paths = [str(path) for path in settings.shard_paths]
+    owners = read_shard_map(settings.db_path)
+    if not owners:
+        Shards().configure(settings.db_path, paths, settings.shard_buckets)
+        return 0
+    if len(owners) != settings.shard_buckets:
+        raise ValueError(f'Shard map has {len(owners)} buckets, the bucket count cannot change')
+    previous = set(owners.values())
+    moves = plan_moves(owners, paths)
+    for bucket, target in moves.items():
+        move_bucket(settings, bucket, owners[bucket], target)
+        owners[bucket] = target
+    # shards dropped from settings end up empty
+    for path in previous | set(paths):
+        sweep_shard(settings, path, [bucket for bucket, owner in owners.items() if owner == path])
+    return len(moves)
+
+
+def main():
+    settings = get_settings()
+    moved = reshard(settings)
+    print(f'{moved} buckets moved to new shards')
+
+
+if __name__ == '__main__':
+    main()
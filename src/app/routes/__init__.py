@@ -1,4 +1,6 @@
 from .auth import auth_router
 from .users import users_router
 from .posts import posts_router
-from .comments import comments_router
\ No newline at end of file
+from .comments import comments_router
+from .changes import changes_router
+from .search import search_router
@@ -1,12 +1,18 @@
 from typing import Annotated
 from datetime import date
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 
-from ..repositories import SqliteCommentRepository
-from ..repositories.protocols import CommentRepository
-from ..schemas import User, CommentStatus
+from ..backup import BackupRunning, backups
+from ..db import database_paths
+from ..exceptions import NotConfiguredError, not_found
+from ..repositories import comment_repository, SqliteArchiveRepository, SqliteMaintenanceRepository
+from ..repositories.exceptions import NoEntry
+from ..repositories.protocols import ArchiveRepository, CommentRepository, MaintenanceRepository
+from ..schemas import User, CommentInfo, CommentStatus, MaintenanceRun, BackupStatus
 from ..dependencies import requesting_user
+from ..moderation import moderation_stats
+from ..settings import Settings, get_settings
 
 admin_router = APIRouter(
     prefix='/admin',
@@ -18,7 +24,7 @@ def comments_statistic(
         date_from: str,
         date_to: str,
         user: Annotated[User, Depends(requesting_user)],
-        comment_repo: Annotated[CommentRepository, Depends(SqliteCommentRepository)],
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
 ):
     try:
         date.fromisoformat(date_from)
@@ -40,3 +46,60 @@ def comments_statistic(
         status = CommentStatus(stat[1])
         result[-1][status.name.lower()] = stat[2]
     return result
+
+
+@admin_router.get('/moderation-stats/')
+def moderation_statistic(
+        user: Annotated[User, Depends(requesting_user)],
+) -> dict[str, dict]:
+    return moderation_stats.snapshot()
+
+
+@admin_router.post('/comments/{comment_id}/restore')
+def restore_archived_comment(
+        comment_id: int,
+        user: Annotated[User, Depends(requesting_user)],
+        archive_repo: Annotated[ArchiveRepository, Depends(SqliteArchiveRepository)],
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
+) -> CommentInfo:
+    if not archive_repo.restore_comments([comment_id]):
+        raise not_found
+    try:
+        return comment_repo.get(comment_id)
+    except NoEntry:
+        raise not_found
+
+
+@admin_router.get('/maintenance/')
+def maintenance_runs(
+        user: Annotated[User, Depends(requesting_user)],
+        maintenance_repo: Annotated[MaintenanceRepository, Depends(SqliteMaintenanceRepository)],
+        limit: Annotated[int, Query(ge=1, le=100)] = 10,
+) -> list[MaintenanceRun]:
+    return maintenance_repo.recent(limit)
+
+
+@admin_router.post('/backups/', status_code=202)
+def start_backup(
+        user: Annotated[User, Depends(requesting_user)],
+        settings: Annotated[Settings, Depends(get_settings)],
+        background_tasks: BackgroundTasks,
+) -> BackupStatus:
+    try:
+        job = backups.begin(database_paths(settings))
+    except NotConfiguredError:
+        raise HTTPException(status_code=404, detail='Backups are not configured')
+    except BackupRunning:
+        raise HTTPException(status_code=409, detail='A backup is running already')
+    # copied after the response, progress is polled from the status endpoint
+    background_tasks.add_task(backups.run, job)
+    return job.status()
+
+
+@admin_router.get('/backups/')
+def backup_status(
+        user: Annotated[User, Depends(requesting_user)],
+) -> BackupStatus:
+    if backups.job is None:
+        raise not_found
+    return backups.job.status()
@@ -10,7 +10,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 from ..repositories.protocols import AuthRepository
 from ..repositories.exceptions import NoEntry, AlreadyExists
-from ..repositories import SqliteAuthRepository
+from ..repositories import auth_repository
 
 from ..schemas import TokenResponse, UserData
 from ..exceptions import bad_credentials, internal_error
@@ -25,7 +25,7 @@ auth_router = APIRouter(
 def get_auth_token(
         settings: Annotated[Settings, Depends(get_settings)],
         form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-        auth_repo: Annotated[AuthRepository, Depends(SqliteAuthRepository)]
+        auth_repo: Annotated[AuthRepository, Depends(auth_repository)]
 ) -> TokenResponse:
     try:
         user_id, hashed_password = auth_repo.get_user_credentials(form_data.username)
@@ -54,7 +54,7 @@ def get_auth_token(
 @auth_router.post('/register')
 def register_new_user(
         user_data: UserData,
-        auth_repo: Annotated[AuthRepository, Depends(SqliteAuthRepository)]
+        auth_repo: Annotated[AuthRepository, Depends(auth_repository)]
 ):
     ph = PasswordHasher()
     hashed_password = ph.hash(user_data.password)
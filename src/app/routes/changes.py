@@ -0,0 +1,31 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from ..repositories import SqliteChangeRepository
+from ..repositories.exceptions import CursorExpired
+from ..repositories.protocols import ChangeRepository
+from ..schemas import ChangeFeed
+
+changes_router = APIRouter(
+    prefix='/changes',
+)
+
+
+@changes_router.get('/', response_model_exclude_none=True)
+def get_changes(
+        change_repo: Annotated[ChangeRepository, Depends(SqliteChangeRepository)],
+        since: Annotated[int, Query(ge=0)] = 0,
+        limit: Annotated[int, Query(ge=1, le=1000)] = 500,
+) -> ChangeFeed:
+    try:
+        changes = change_repo.since(since, limit)
+    except CursorExpired:
+        raise HTTPException(
+            status_code=410,
+            detail='Cursor is older than the retained change log, start over with a full sync',
+        )
+    return ChangeFeed(
+        changes=changes,
+        next=changes[-1].seq if changes else since,
+    )
@@ -1,133 +1,270 @@
-import time
+import asyncio
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
-from starlette.responses import RedirectResponse
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
 
-from ..exceptions import not_found, unauthorized, forbidden
-from ..repositories import SqliteCommentRepository, SqlitePostRepository
-from ..repositories.exceptions import NoEntry
+from ..cache import response_cache, POST_COMMENTS
+from ..compact import COMPACT, compact_comments
+from ..compression import mark_cached
+from ..conditional import validator_headers, is_fresh, not_modified
+from ..exceptions import fields_with_compact, not_found, unauthorized, forbidden
+from ..fields import comment_fields, dump_partial
+from ..repositories import comment_repository, post_repository
+from ..repositories.exceptions import NoEntry, NotOwner, Conflict
 from ..repositories.protocols import CommentRepository, PostRepository
-from ..schemas import CommentData, Comment, User, CommentInfo
+from ..schemas import (
+    BATCH_MAX_ITEMS,
+    BatchCommentData,
+    BatchItem,
+    CommentData,
+    CommentInfo,
+    CommentStatus,
+    CommentVerdict,
+    CompactComments,
+    User,
+)
 from ..dependencies import requesting_user
+from ..hub import comment_hub, format_event, Subscription
+from ..prefer import written
+from ..verdicts import comment_verdicts
 
 
 comments_router = APIRouter(
     prefix='/comments',
 )
 
+FEED_HEARTBEAT = 15
+
+comment_list = TypeAdapter(list[CommentInfo])
+
+
+def publish_approved_comment(comment_id: int, post_id: int, comment_repo: CommentRepository) -> None:
+    # called by comment_modifier, comments are fetched only when someone is listening
+    if not comment_hub.has_subscribers(post_id):
+        return
+    try:
+        comment = comment_repo.get(comment_id)
+    except NoEntry:
+        return
+    comment_hub.publish(post_id, format_event('comment', comment.model_dump_json(), comment_id))
+
+
+async def comment_events(subscription: Subscription, heartbeat: float = FEED_HEARTBEAT):
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if message is None:
+                yield format_event('evicted', 'Subscriber is too slow, reconnect to resume')
+                return
+            yield message
+    finally:
+        comment_hub.unsubscribe(subscription)
+
+
+@comments_router.get('/batch')
+def get_comments_batch(
+        ids: Annotated[list[int], Query(min_length=1, max_length=BATCH_MAX_ITEMS)],
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
+) -> list[BatchItem[CommentInfo]]:
+    found = {comment.comment_id: comment for comment in comment_repo.get_many(list(set(ids)))}
+    return [
+        BatchItem(id=comment_id, status=200, entity=found[comment_id]) if comment_id in found
+        else BatchItem(id=comment_id, status=404, detail=not_found.detail)
+        for comment_id in ids
+    ]
+
+
+@comments_router.post('/batch')
+def add_comments_batch(
+        user: Annotated[User, Depends(requesting_user)],
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
+        comments_data: Annotated[list[BatchCommentData], Body(min_length=1, max_length=BATCH_MAX_ITEMS)],
+) -> list[BatchItem[CommentInfo]]:
+    saved_comments = comment_repo.add_many(
+        user.user_id,
+        [(comment.post_id, comment.body) for comment in comments_data],
+    )
+    return [
+        BatchItem(id=comment.comment_id, status=201, entity=comment) if comment is not None
+        else BatchItem(status=404, detail=not_found.detail)
+        for comment in saved_comments
+    ]
+
 
 @comments_router.get('/by_post/{post_id}')
 def get_comments_to_post(
         post_id: int,
-        comment_repo: Annotated[CommentRepository, Depends(SqliteCommentRepository)],
-) -> list[CommentInfo]:
-    return comment_repo.get_by_post(post_id)
+        request: Request,
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
+        fields: Annotated[tuple[str, ...] | None, Depends(comment_fields)],
+        compact: bool = False,
+) -> list[CommentInfo] | CompactComments:
+    if fields is not None and compact:
+        raise fields_with_compact
+    variant = fields or (COMPACT if compact else None)
+    headers = validator_headers(comment_repo.get_by_post_version(post_id), variant)
+    if is_fresh(request, headers):
+        return not_modified(headers)
+
+    def load() -> bytes:
+        if fields is not None:
+            return dump_partial(CommentInfo, fields, comment_repo.get_by_post_fields(post_id, fields))
+        comments = comment_repo.get_by_post(post_id)
+        if compact:
+            return compact_comments(comments).model_dump_json().encode()
+        return comment_list.dump_json(comments)
+
+    body = response_cache.get_or_load((POST_COMMENTS, post_id), headers['ETag'], load, variant)
+    mark_cached(request, (POST_COMMENTS, post_id), headers['ETag'], variant)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+@comments_router.get('/by_post/{post_id}/stream')
+async def stream_comments_to_post(
+        post_id: int,
+        post_repo: Annotated[PostRepository, Depends(post_repository)],
+) -> StreamingResponse:
+    try:
+        await run_in_threadpool(post_repo.get, post_id)
+    except NoEntry:
+        raise not_found
+    return StreamingResponse(
+        comment_events(comment_hub.subscribe(post_id)),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 
 @comments_router.post('/by_post/{post_id}')
 def add_comment_to_post(
-        comment_repo: Annotated[CommentRepository, Depends(SqliteCommentRepository)],
-        post_repo: Annotated[PostRepository, Depends(SqlitePostRepository)],
+        request: Request,
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
         user: Annotated[User, Depends(requesting_user)],
         post_id: int,
         comment_data: CommentData
-) -> RedirectResponse:
+) -> Response:
     try:
-        post = post_repo.get(post_id)
+        saved_comment = comment_repo.add_to_post(post_id, user.user_id, comment_data.body)
     except NoEntry:
         raise not_found
-    if post.author.autoreply_timeout is not None:
-        autoreply_at = int(time.time()) + post.author.autoreply_timeout * 60
-    else:
-        autoreply_at = None
-    new_comment = Comment(
-        author=user,
-        author_id=user.user_id,
-        post_id=post_id,
-        body=comment_data.body,
-        autoreply_at=autoreply_at,
-    )
-    saved_comment = comment_repo.save(new_comment)
-    return RedirectResponse(
-        url=comments_router.url_path_for('get_comment', comment_id=saved_comment.comment_id),
-        status_code=303,
+    return written(
+        request,
+        saved_comment,
+        comments_router.url_path_for('get_comment', comment_id=saved_comment.comment_id),
+        created=True,
     )
 
 
 @comments_router.get('/by_author/{author_id}')
 def get_comments_by_author(
         author_id: int,
-        comment_repo: Annotated[CommentRepository, Depends(SqliteCommentRepository)],
-) -> list[CommentInfo]:
-    return comment_repo.get_by_author(author_id)
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
+        fields: Annotated[tuple[str, ...] | None, Depends(comment_fields)],
+        compact: bool = False,
+) -> list[CommentInfo] | CompactComments:
+    if fields is not None and compact:
+        raise fields_with_compact
+    if fields is not None:
+        body = dump_partial(CommentInfo, fields, comment_repo.get_by_author_fields(author_id, fields))
+        return Response(content=body, media_type='application/json')
+    comments = comment_repo.get_by_author(author_id)
+    return compact_comments(comments) if compact else comments
 
 
 @comments_router.get('/{comment_id}')
 def get_comment(
         comment_id: int,
-        comment_repo: Annotated[CommentRepository, Depends(SqliteCommentRepository)]
+        request: Request,
+        response: Response,
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)]
 ) -> CommentInfo:
     try:
+        headers = validator_headers(comment_repo.get_version(comment_id))
+        if is_fresh(request, headers):
+            return not_modified(headers)
+        response.headers.update(headers)
         return comment_repo.get(comment_id)
     except NoEntry:
         raise not_found
 
 
+@comments_router.get('/{comment_id}/verdict')
+async def get_comment_verdict(
+        comment_id: int,
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
+        wait: Annotated[float, Query(ge=0, le=60)] = 0,
+) -> CommentVerdict:
+    # registered before reading the status so a verdict landing in between is not lost
+    waiter = comment_verdicts.register(comment_id)
+    try:
+        try:
+            comment = await run_in_threadpool(comment_repo.get, comment_id)
+        except NoEntry:
+            raise not_found
+        status = comment.status
+        if status == CommentStatus.NOT_REVIEWED and wait > 0:
+            try:
+                status = await asyncio.wait_for(waiter, wait)
+            except TimeoutError:
+                pass
+        return CommentVerdict(comment_id=comment_id, status=status)
+    finally:
+        comment_verdicts.discard(comment_id, waiter)
+
+
 @comments_router.post('/{comment_id}/reply')
 def reply_to_comment(
+        request: Request,
         user: Annotated[User, Depends(requesting_user)],
-        comment_repo: Annotated[CommentRepository, Depends(SqliteCommentRepository)],
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
         comment_id: int,
         comment_data: CommentData,
-) -> RedirectResponse:
+) -> Response:
     try:
-        original_comment = comment_repo.get(comment_id)
+        saved_comment = comment_repo.add_reply(comment_id, user.user_id, comment_data.body)
     except NoEntry:
         raise not_found
-    if original_comment.reply_to is not None:
+    except Conflict:
         raise HTTPException(
             status_code=400,
             detail='This comment cannot be replied'
         )
-    new_comment = Comment(
-        reply_to=original_comment.comment_id,
-        author=user,
-        author_id=user.user_id,
-        post_id=original_comment.post_id,
-        body=comment_data.body,
-    )
-    saved_comment = comment_repo.save(new_comment)
-    return RedirectResponse(
-        url=comments_router.url_path_for('get_comment', comment_id=saved_comment.comment_id),
-        status_code=303,
+    return written(
+        request,
+        saved_comment,
+        comments_router.url_path_for('get_comment', comment_id=saved_comment.comment_id),
+        created=True,
     )
 
 
 @comments_router.patch('/{comment_id}/')
 def edit_comment(
+        request: Request,
         user: Annotated[User, Depends(requesting_user)],
-        comment_repo: Annotated[CommentRepository, Depends(SqliteCommentRepository)],
+        comment_repo: Annotated[CommentRepository, Depends(comment_repository)],
         comment_id: int,
         comment_data: CommentData,
-) -> RedirectResponse:
+) -> Response:
     try:
-        original_comment = Comment(**comment_repo.get(comment_id).model_dump())
+        saved_comment = comment_repo.edit_body(comment_id, user.user_id, comment_data.body)
     except NoEntry:
         raise not_found
-    if user.user_id != original_comment.author_id:
+    except NotOwner:
         raise forbidden
-    if comment_repo.has_replies(comment_id):
+    except Conflict:
         raise HTTPException(
             status_code=418,
             detail="Comment is already replied"
         )
-    edited_comment = original_comment.model_copy(update=comment_data.model_dump())
-    try:
-        saved_comment = comment_repo.save(edited_comment)
-        return RedirectResponse(
-            url=comments_router.url_path_for('get_comment', comment_id=saved_comment.comment_id),
-            status_code=303,
-        )
-    except NoEntry:
-        raise not_found
+    return written(
+        request,
+        saved_comment,
+        comments_router.url_path_for('get_comment', comment_id=saved_comment.comment_id),
+    )
@@ -1,34 +1,57 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
-from starlette.responses import RedirectResponse
+from fastapi import APIRouter, Body, Depends, Query, Request, Response
 
-from ..repositories import SqlitePostRepository
-from ..repositories.exceptions import NoEntry
+from ..repositories import post_repository
+from ..repositories.exceptions import NoEntry, NotOwner
 from ..repositories.protocols import PostRepository
 
-from ..exceptions import internal_error, not_found, unauthorized, forbidden
-from ..schemas import PostData, Post, User
+from ..cache import response_cache, POST
+from ..compact import COMPACT, compact_posts
+from ..compression import mark_cached
+from ..conditional import validator_headers, is_fresh, not_modified
+from ..exceptions import fields_with_compact, internal_error, not_found, unauthorized, forbidden
+from ..fields import dump_partial, post_fields
+from ..schemas import BATCH_MAX_ITEMS, BatchItem, CompactPosts, PostData, Post, PostThread, User
 from ..dependencies import requesting_user
+from ..prefer import written
 
 posts_router = APIRouter(
     prefix='/posts',
 )
 
+THREAD_MAX_DEPTH = 8
+THREAD_MAX_COMMENTS = 1000
+
 
 @posts_router.get('/')
 def all_posts(
-        post_repo: Annotated[PostRepository, Depends(SqlitePostRepository)],
-) -> list[Post]:
-    return post_repo.all()
+        request: Request,
+        response: Response,
+        post_repo: Annotated[PostRepository, Depends(post_repository)],
+        fields: Annotated[tuple[str, ...] | None, Depends(post_fields)],
+        compact: bool = False,
+) -> list[Post] | CompactPosts:
+    if fields is not None and compact:
+        raise fields_with_compact
+    headers = validator_headers(post_repo.all_version(), fields or (COMPACT if compact else None))
+    if is_fresh(request, headers):
+        return not_modified(headers)
+    if fields is not None:
+        body = dump_partial(Post, fields, post_repo.all_fields(fields))
+        return Response(content=body, media_type='application/json', headers=headers)
+    response.headers.update(headers)
+    posts = post_repo.all()
+    return compact_posts(posts) if compact else posts
 
 
 @posts_router.post('/')
 def new_post(
+        request: Request,
         user: Annotated[User, Depends(requesting_user)],
-        post_repo: Annotated[PostRepository, Depends(SqlitePostRepository)],
+        post_repo: Annotated[PostRepository, Depends(post_repository)],
         post_data: PostData,
-) -> RedirectResponse:
+) -> Response:
     post = Post(
         author=user,
         author_id=user.user_id,
@@ -37,42 +60,84 @@ def new_post(
     )
     try:
         saved_post = post_repo.save(post)
-        return RedirectResponse(
-            url=posts_router.url_path_for('get_post', post_id=saved_post.post_id),
-            status_code=303,
+        return written(
+            request,
+            saved_post,
+            posts_router.url_path_for('get_post', post_id=saved_post.post_id),
+            created=True,
         )
     except ValueError:
         raise internal_error
 
+@posts_router.get('/batch')
+def get_posts_batch(
+        ids: Annotated[list[int], Query(min_length=1, max_length=BATCH_MAX_ITEMS)],
+        post_repo: Annotated[PostRepository, Depends(post_repository)],
+) -> list[BatchItem[Post]]:
+    found = {post.post_id: post for post in post_repo.get_many(list(set(ids)))}
+    return [
+        BatchItem(id=post_id, status=200, entity=found[post_id]) if post_id in found
+        else BatchItem(id=post_id, status=404, detail=not_found.detail)
+        for post_id in ids
+    ]
+
+@posts_router.post('/batch')
+def new_posts_batch(
+        user: Annotated[User, Depends(requesting_user)],
+        post_repo: Annotated[PostRepository, Depends(post_repository)],
+        posts_data: Annotated[list[PostData], Body(min_length=1, max_length=BATCH_MAX_ITEMS)],
+) -> list[BatchItem[Post]]:
+    saved_posts = post_repo.add_many(user.user_id, [(post.title, post.body) for post in posts_data])
+    return [BatchItem(id=post.post_id, status=201, entity=post) for post in saved_posts]
+
 @posts_router.get('/{post_id}/')
 def get_post(
         post_id: int,
-        post_repo: Annotated[PostRepository, Depends(SqlitePostRepository)],
+        request: Request,
+        post_repo: Annotated[PostRepository, Depends(post_repository)],
 ) -> Post:
     try:
-        return post_repo.get(post_id)
+        headers = validator_headers(post_repo.get_version(post_id))
+        if is_fresh(request, headers):
+            return not_modified(headers)
+        body = response_cache.get_or_load(
+            (POST, post_id),
+            headers['ETag'],
+            lambda: post_repo.get(post_id).model_dump_json().encode(),
+        )
+        mark_cached(request, (POST, post_id), headers['ETag'])
+        return Response(content=body, media_type='application/json', headers=headers)
+    except NoEntry:
+        raise not_found
+
+@posts_router.get('/{post_id}/thread')
+def get_post_thread(
+        post_id: int,
+        post_repo: Annotated[PostRepository, Depends(post_repository)],
+        depth: Annotated[int, Query(ge=0, le=THREAD_MAX_DEPTH)] = THREAD_MAX_DEPTH,
+        limit: Annotated[int, Query(ge=1, le=THREAD_MAX_COMMENTS)] = 200,
+) -> PostThread:
+    try:
+        return post_repo.get_thread(post_id, depth, limit)
     except NoEntry:
         raise not_found
 
 @posts_router.patch('/{post_id}/')
 def edit_post(
+        request: Request,
         user: Annotated[User, Depends(requesting_user)],
-        post_repo: Annotated[PostRepository, Depends(SqlitePostRepository)],
+        post_repo: Annotated[PostRepository, Depends(post_repository)],
         post_id: int,
         post_data: PostData,
-) -> RedirectResponse:
+) -> Response:
     try:
-        original_post = post_repo.get(post_id)
+        saved_post = post_repo.edit(post_id, user.user_id, post_data.title, post_data.body)
     except NoEntry:
         raise not_found
-    if user.user_id != original_post.author_id:
+    except NotOwner:
         raise forbidden
-    edited_post = original_post.model_copy(update=post_data.model_dump())
-    try:
-        saved_post = post_repo.save(edited_post)
-        return RedirectResponse(
-            url=posts_router.url_path_for('get_post', post_id=saved_post.post_id),
-            status_code=303,
-        )
-    except NoEntry:
-        raise not_found
+    return written(
+        request,
+        saved_post,
+        posts_router.url_path_for('get_post', post_id=saved_post.post_id),
+    )
@@ -0,0 +1,33 @@
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from ..repositories import SqliteSearchRepository
+from ..repositories.protocols import SearchRepository
+from ..schemas import SearchResults
+
+search_router = APIRouter(
+    prefix='/search',
+)
+
+
+@search_router.get('/', response_model_exclude_none=True)
+def search(
+        search_repo: Annotated[SearchRepository, Depends(SqliteSearchRepository)],
+        q: Annotated[str, Query(min_length=1, max_length=256)],
+        scope: Literal['all', 'posts', 'comments'] = 'all',
+        limit: Annotated[int, Query(ge=1, le=100)] = 20,
+        offset: Annotated[int, Query(ge=0)] = 0,
+) -> SearchResults:
+    try:
+        # one extra row tells whether there is a next page
+        hits = search_repo.search(q, scope, limit + 1, offset)
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail='Search query has no words',
+        )
+    return SearchResults(
+        hits=hits[:limit],
+        next_offset=offset + limit if len(hits) > limit else None,
+    )
@@ -8,7 +8,7 @@ from ..dependencies import requesting_user
 
 from ..repositories.protocols import UserRepository
 from ..repositories.exceptions import NoEntry
-from ..repositories import SqliteUserRepository
+from ..repositories import user_repository
 
 
 users_router = APIRouter(
@@ -27,7 +27,7 @@ def user_space(
 def update_my_settings(
         user: Annotated[User, Depends(requesting_user)],
         user_settings: UserSettings,
-        user_repo: Annotated[UserRepository, Depends(SqliteUserRepository)]
+        user_repo: Annotated[UserRepository, Depends(user_repository)]
 ) -> User:
     user = user.model_copy(update=user_settings.model_dump(exclude_unset=True))
     try:
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 from enum import IntEnum
-from typing import Annotated
+from typing import Annotated, Generic, Literal, TypeVar
 
 from pydantic import BaseModel, EmailStr, SecretStr, AfterValidator, Field
 
@@ -67,14 +67,35 @@ class Post(BaseModel):
     author_id: int
     title: str
     body: str
-    created_at: Annotated[datetime, Field(default_factory=datetime.fromisoformat)] | None = None
-    updated_at: Annotated[datetime, Field(default_factory=datetime.fromisoformat)] | None = None
+    # stored as epoch seconds, decoded to aware UTC datetimes
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    approved_comment_count: int = 0
+
+
+class PostRow(BaseModel):
+    post_id: int
+    author_id: int
+    title: str
+    body: str
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    approved_comment_count: int = 0
+
+
+class CompactPosts(BaseModel):
+    authors: dict[int, User]
+    posts: list[PostRow]
 
 
 class CommentData(BaseModel):
     body: str
 
 
+class BatchCommentData(CommentData):
+    post_id: int
+
+
 class CommentStatus(IntEnum):
     NOT_REVIEWED = 0
     APPROVED = 1
@@ -90,9 +111,125 @@ class CommentInfo(BaseModel):
     post_id: int
     body: str
     status: CommentStatus = CommentStatus.NOT_REVIEWED
-    created_at: Annotated[datetime, Field(default_factory=datetime.fromisoformat)] | None = None
-    updated_at: Annotated[datetime, Field(default_factory=datetime.fromisoformat)] | None = None
+    # stored as epoch seconds, decoded to aware UTC datetimes
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    reply_count: int = 0
+
+
+class CommentRow(BaseModel):
+    comment_id: int
+    reply_to: int | None = None
+    author_id: int
+    post_id: int
+    body: str
+    status: CommentStatus
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    reply_count: int = 0
+
+
+class CompactComments(BaseModel):
+    authors: dict[int, User]
+    comments: list[CommentRow]
+
+
+class CommentVerdict(BaseModel):
+    comment_id: int
+    status: CommentStatus
 
 
 class Comment(CommentInfo):
     autoreply_at: int | None = None
+
+
+class ThreadComment(BaseModel):
+    comment_id: int
+    author_id: int | None = None
+    body: str
+    created_at: datetime
+    updated_at: datetime
+    replies: list['ThreadComment'] = []
+
+
+class PostThread(BaseModel):
+    post_id: int
+    author_id: int | None = None
+    title: str
+    body: str
+    created_at: datetime
+    updated_at: datetime
+    # every author of the post and comments once, keyed by user_id
+    authors: dict[int, User]
+    comments: list[ThreadComment]
+    # depth or size limit cut the tree
+    truncated: bool = False
+
+
+class SearchHit(BaseModel):
+    entity: Literal['post', 'comment']
+    id: int
+    post_id: int | None = None
+    title: str | None = None
+    snippet: str
+    rank: float
+
+
+class SearchResults(BaseModel):
+    hits: list[SearchHit]
+    next_offset: int | None = None
+
+
+BATCH_MAX_ITEMS = 1000
+
+T = TypeVar('T')
+
+
+class BatchItem(BaseModel, Generic[T]):
+    # per item outcome, status follows the HTTP code the single item endpoint would answer
+    id: int | None = None
+    status: int
+    entity: T | None = None
+    detail: str | None = None
+
+
+class Change(BaseModel):
+    seq: int
+    entity: Literal['post', 'comment']
+    id: int
+    op: Literal['insert', 'update', 'status', 'delete']
+    status: CommentStatus | None = None
+
+
+class ChangeFeed(BaseModel):
+    changes: list[Change]
+    next: int
+
+
+class MaintenanceRun(BaseModel):
+    run_id: int
+    started_at: datetime
+    # seconds
+    duration: float
+    pages_before: int
+    pages_after: int
+    pages_reclaimed: int
+    # None outside WAL mode
+    wal_frames_checkpointed: int | None = None
+    # the one-off rebuild switching an older database to incremental vacuum
+    full_vacuum: bool = False
+
+
+class BackupStatus(BaseModel):
+    state: Literal['running', 'done', 'failed']
+    started_at: datetime
+    finished_at: datetime | None = None
+    # database being copied
+    current: str | None = None
+    pages_done: int
+    pages_total: int
+    bytes_copied: int
+    bytes_per_second: float | None = None
+    # finished copies, compressed ones end in .gz
+    files: list[str] = []
+    error: str | None = None
@@ -1,8 +1,9 @@
 import os
 from functools import cache
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import Field
+from pydantic import Field, model_validator
 
 
 class Settings(BaseSettings):
@@ -10,6 +11,71 @@ class Settings(BaseSettings):
     secret_key: str
     db_path: str | os.PathLike
     sql_init: str | os.PathLike
+    moderation_safe_phrases: set[str] = {
+        'thanks', 'thank you', 'thx', 'ty', '+1', 'great post', 'nice post', 'agreed', 'awesome', 'cool', 'lol',
+    }
+    moderation_trusted_authors: set[int] = set()
+    moderation_blocklist: str | os.PathLike | None = None
+    classifier_window_tokens: int = Field(default=256, gt=0)
+    classifier_window_overlap: int = Field(default=32, ge=0)
+    classifier_max_windows: int = Field(default=8, ge=1)
+    classifier_batch_size: int = Field(default=16, ge=1)
+    change_log_retention_days: int = Field(default=30, ge=1)
+    response_cache_bytes: int = Field(default=32 * 1024 * 1024, ge=0)
+    response_cache_ttl: float = Field(default=60, gt=0)
+    entity_cache_size: int = Field(default=10_000, ge=1)
+    entity_cache_ttl: float = Field(default=60, gt=0)
+    compression_min_bytes: int = Field(default=1024, ge=0)
+    compression_thread_bytes: int = Field(default=64 * 1024, ge=0)
+    archive_db_path: str | os.PathLike | None = None
+    archive_rejected: bool = True
+    archive_after_days: int | None = Field(default=None, ge=1)
+    archive_batch_size: int = Field(default=500, ge=1)
+    # memory keeps users, posts and comments in process, they are gone on restart
+    storage_backend: Literal['sqlite', 'sharded', 'memory'] = 'sqlite'
+    # posts and comments go to these files, users and everything else stay in db_path
+    shard_paths: list[str] = []
+    shard_buckets: int = Field(default=1024, ge=1)
+    # UTC hour of the daily vacuum, ANALYZE and checkpoint run, the quietest one; None turns it off
+    maintenance_hour: int | None = Field(default=4, ge=0, le=23)
+    # rows ANALYZE samples per index
+    maintenance_analysis_limit: int = Field(default=1000, ge=0)
+    # online copies of the databases, taken from the admin endpoint or every backup_interval_hours
+    backup_dir: str | os.PathLike | None = None
+    backup_interval_hours: float | None = Field(default=None, gt=0)
+    # pages per backup step and the pause after it, writers get the database in between
+    backup_step_pages: int = Field(default=256, ge=1)
+    backup_step_sleep: float = Field(default=0.05, ge=0)
+    backup_compress: bool = False
+    # copies kept per database
+    backup_keep: int = Field(default=7, ge=1)
+    # in-memory copy of the database serving post lists, posts and their comments
+    replica_enabled: bool = False
+    replica_max_lag: float = Field(default=1.0, gt=0)
+
+    @model_validator(mode='after')
+    def check_classifier_windows(self) -> 'Settings':
+        if self.classifier_window_overlap >= self.classifier_window_tokens:
+            raise ValueError('classifier_window_overlap must be less than classifier_window_tokens')
+        return self
+
+    @model_validator(mode='after')
+    def check_shards(self) -> 'Settings':
+        if self.storage_backend == 'sharded' and not self.shard_paths:
+            raise ValueError('shard_paths must list the shard files of the sharded backend')
+        return self
+
+    @model_validator(mode='after')
+    def check_backups(self) -> 'Settings':
+        if self.backup_interval_hours is not None and self.backup_dir is None:
+            raise ValueError('backup_interval_hours needs backup_dir')
+        return self
+
+    @model_validator(mode='after')
+    def check_replica(self) -> 'Settings':
+        if self.replica_enabled and self.storage_backend != 'sqlite':
+            raise ValueError('replica_enabled needs the sqlite storage backend')
+        return self
 
 
 @cache
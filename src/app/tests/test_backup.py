@@ -0,0 +1,109 @@
+import gzip
+import sqlite3
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ..backup import BackupRunning, Backups, backups
+from ..db import initialize_db, sqlite_cm
+from ..exceptions import NotConfiguredError
+from ..main import app
+from ..settings import Settings
+from .conftest import init_script, test_user_data
+
+client = TestClient(app)
+
+
+def filled_db(tmp_path, posts: int = 300):
+    path = tmp_path / 'main.sqlite'
+    initialize_db(Settings(google_key='', secret_key='', db_path=str(path), sql_init=init_script))
+    with sqlite_cm(path) as db:
+        db.execute("INSERT INTO users(email, hash) VALUES ('backup@user.db', '');")
+        db.executemany(
+            "INSERT INTO posts(author_id, title, body) VALUES (1, 'Title', ?);",
+            (('x' * 1000, ) for _ in range(posts))
+        )
+        db.commit()
+    return path
+
+
+def test_backup_copies_in_steps(tmp_path):
+    path = filled_db(tmp_path)
+    store = Backups(tmp_path / 'backups', step_pages=8, step_sleep=0, compress=False, keep=2)
+    job = store.run(store.begin([path]))
+    assert job.state == 'done' and job.error is None
+    assert job.pages_done == job.pages_total > 8 and job.status().bytes_per_second > 0
+    copy, = job.files
+    assert copy.endswith('.sqlite') and not list((tmp_path / 'backups').glob('*.part'))
+    conn = sqlite3.connect(copy)
+    assert conn.execute("SELECT count(*) FROM posts;").fetchone() == (300, )
+    conn.close()
+
+    # older copies beyond keep are removed
+    for stamp in ('20000101T000000Z', '20000102T000000Z'):
+        (tmp_path / 'backups' / f'main-{stamp}.sqlite').touch()
+    store._prune('main')
+    assert sorted(p.name for p in (tmp_path / 'backups').iterdir()) == ['main-20000102T000000Z.sqlite', *[
+        p.split('/')[-1] for p in job.files
+    ]]
+
+
+def test_backup_compressed_with_writers(tmp_path):
+    path = filled_db(tmp_path)
+    store = Backups(tmp_path / 'backups', step_pages=1, step_sleep=0.001, compress=True, keep=1)
+    job = store.begin([path])
+    with pytest.raises(BackupRunning):
+        store.begin([path])
+
+    done = threading.Event()
+
+    def write():
+        # writes between steps restart the copy, it still has to finish
+        with sqlite_cm(path) as db:
+            while not done.is_set():
+                db.execute("INSERT INTO posts(author_id, title, body) VALUES (1, 'During', 'Backup');")
+                db.commit()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        store.run(job)
+    finally:
+        done.set()
+        writer.join()
+    assert job.state == 'done'
+    copy, = job.files
+    assert copy.endswith('.sqlite.gz')
+    restored = tmp_path / 'restored.sqlite'
+    restored.write_bytes(gzip.decompress(open(copy, 'rb').read()))
+    conn = sqlite3.connect(restored)
+    assert conn.execute("PRAGMA integrity_check;").fetchone() == ('ok', )
+    assert conn.execute("SELECT count(*) FROM posts;").fetchone()[0] >= 300
+    conn.close()
+
+
+def test_backup_not_configured(tmp_path):
+    with pytest.raises(NotConfiguredError):
+        Backups(None, step_pages=8, step_sleep=0, compress=False, keep=1).begin([tmp_path / 'main.sqlite'])
+    store = Backups(tmp_path / 'backups', step_pages=8, step_sleep=0, compress=False, keep=1)
+    job = store.run(store.begin([tmp_path / 'missing' / 'main.sqlite']))
+    assert job.state == 'failed' and job.error
+
+
+def test_backup_endpoints(tmp_path):
+    token = client.post("/auth/token", data=test_user_data).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/admin/backups/", headers=headers).status_code == 404
+    backups.configure(tmp_path, step_pages=64, step_sleep=0, compress=False, keep=1)
+    try:
+        response = client.post("/admin/backups/", headers=headers)
+        assert response.status_code == 202 and response.json()["state"] == "running"
+        # background tasks run before the test client returns
+        status = client.get("/admin/backups/", headers=headers).json()
+        assert status["state"] == "done" and len(status["files"]) == 1
+        assert status["pages_done"] == status["pages_total"] > 0
+    finally:
+        backups.configure(None, step_pages=256, step_sleep=0.05, compress=False, keep=7)
+        backups.job = None
+    assert client.get("/admin/backups/").status_code == 401
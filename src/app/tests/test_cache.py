@@ -0,0 +1,132 @@
+import time
+from operator import attrgetter
+from threading import Thread, Barrier
+
+import pytest
+
+from ..cache import ResponseCache
+from ..repositories.caching import CachingRepository, EntityCache
+from ..schemas import User
+
+
+def test_hit_and_version_mismatch():
+    cache = ResponseCache(max_bytes=1024, ttl=60)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return b'body %d' % len(loads)
+
+    assert cache.get_or_load('key', 'v1', loader) == b'body 1'
+    assert cache.get_or_load('key', 'v1', loader) == b'body 1'
+    assert cache.get_or_load('key', 'v2', loader) == b'body 2'
+    cache.invalidate('key')
+    assert cache.get_or_load('key', 'v2', loader) == b'body 3'
+
+
+def test_variants_are_invalidated_with_their_key():
+    cache = ResponseCache(max_bytes=1024, ttl=60)
+    assert cache.get_or_load('key', 'v1', lambda: b'full') == b'full'
+    assert cache.get_or_load('key', 'v1', lambda: b'compact', variant='compact') == b'compact'
+    assert cache.get_or_load('key', 'v1', lambda: b'reloaded') == b'full'
+    cache.invalidate('key')
+    assert cache.get_or_load('key', 'v1', lambda: b'reloaded', variant='compact') == b'reloaded'
+    assert cache.get_or_load('key', 'v1', lambda: b'reloaded') == b'reloaded'
+
+
+def test_size_bound_evicts_least_recently_used():
+    cache = ResponseCache(max_bytes=10, ttl=60)
+    cache.get_or_load('a', 1, lambda: b'12345')
+    cache.get_or_load('b', 1, lambda: b'12345')
+    cache.get_or_load('a', 1, lambda: b'xxxxx')
+    cache.get_or_load('c', 1, lambda: b'12345')
+    assert cache.get_or_load('a', 1, lambda: b'reloaded') == b'12345'
+    assert cache.get_or_load('b', 1, lambda: b'reloaded') == b'reloaded'
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = ResponseCache(max_bytes=1024, ttl=60)
+    barrier = Barrier(5)
+    loads = []
+    results = []
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.2)
+        return b'body'
+
+    def reader():
+        barrier.wait()
+        results.append(cache.get_or_load('key', 'v1', loader))
+
+    threads = [Thread(target=reader) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [b'body'] * 5
+    assert len(loads) == 1
+
+
+def test_invalidation_during_load_is_not_cached():
+    cache = ResponseCache(max_bytes=1024, ttl=60)
+
+    def loader():
+        cache.invalidate('key')
+        return b'stale'
+
+    assert cache.get_or_load('key', 'v1', loader) == b'stale'
+    assert cache.get_or_load('key', 'v1', lambda: b'fresh') == b'fresh'
+
+
+def test_loader_error_is_not_cached():
+    cache = ResponseCache(max_bytes=1024, ttl=60)
+
+    def loader():
+        raise LookupError()
+
+    with pytest.raises(LookupError):
+        cache.get_or_load('key', 'v1', loader)
+    assert cache.get_or_load('key', 'v1', lambda: b'body') == b'body'
+
+
+class CountingUserRepository:
+    def __init__(self):
+        self.users = {1: User(user_id=1, email='cached@user.db')}
+        self.gets = 0
+
+    def get(self, user_id):
+        self.gets += 1
+        return self.users[user_id]
+
+    def save(self, user):
+        self.users[user.user_id] = user
+        return user
+
+    def delete(self, user_id):
+        return self.users.pop(user_id)
+
+    def other(self):
+        return 'passed through'
+
+
+def test_caching_repository():
+    repo = CountingUserRepository()
+    dependent = EntityCache(maxsize=10, ttl=60)
+    dependent.put(1, User(user_id=2, email='post@author.db'))
+    cached = CachingRepository(repo, EntityCache(maxsize=10, ttl=60), attrgetter('user_id'), (dependent,))
+
+    assert cached.get(1).email == 'cached@user.db'
+    cached.get(1).email = 'mutated@user.db'
+    assert cached.get(1).email == 'cached@user.db'
+    assert repo.gets == 1
+
+    cached.save(User(user_id=1, email='saved@user.db', autoreply_timeout=5))
+    assert cached.get(1).email == 'saved@user.db'
+    assert repo.gets == 1
+    assert dependent.get(1) is None
+
+    cached.delete(1)
+    with pytest.raises(KeyError):
+        cached.get(1)
+    assert cached.other() == 'passed through'
@@ -0,0 +1,59 @@
+import gzip
+
+from fastapi.testclient import TestClient
+
+from ..cache import response_cache, POST
+from ..compression import negotiate
+from ..main import app
+from .conftest import test_user_data
+
+
+client = TestClient(app)
+
+codecs = {'zstd': None, 'br': None, 'gzip': None}
+
+
+def test_negotiate():
+    assert negotiate('gzip, deflate', codecs) == 'gzip'
+    assert negotiate('gzip, br, zstd', codecs) == 'zstd'
+    assert negotiate('gzip;q=1.0, br;q=0.5', codecs) == 'gzip'
+    assert negotiate('zstd;q=0, *', codecs) == 'br'
+    assert negotiate('br, zstd', {'gzip': None}) is None
+    assert negotiate('identity', codecs) is None
+    assert negotiate('', codecs) is None
+    assert negotiate('*;q=0', codecs) is None
+
+
+def test_compressed_post_is_cached_per_encoding():
+    token = client.post("/auth/token", data=test_user_data).json()["access_token"]
+    post = client.post(
+        "/posts/",
+        json={"title": "Long post", "body": "Long and repetitive body. " * 200},
+        headers={"Authorization": f"Bearer {token}", "Prefer": "return=representation"},
+    ).json()
+
+    response = client.get(f"/posts/{post['post_id']}/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert int(response.headers["Content-Length"]) < len(post["body"])
+    assert response.json()["body"] == post["body"]
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/')
+    cached = response_cache.peek((POST, post["post_id"]), etag.removeprefix('W/'), (None, 'gzip'))
+    assert cached is not None and gzip.decompress(cached) == response.content
+
+    response = client.get(
+        f"/posts/{post['post_id']}/",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+
+    response = client.get(f"/posts/{post['post_id']}/", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.json()["body"] == post["body"]
+
+
+def test_small_bodies_are_not_compressed():
+    response = client.get("/comments/9999", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
@@ -0,0 +1,82 @@
+import io
+import sqlite3
+
+import pytest
+
+from ..dataset import export_dataset, import_dataset, open_stream
+from ..db import initialize_db, sqlite_cm
+from ..settings import Settings
+from .conftest import init_script
+
+SCHEMA = "SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') ORDER BY name;"
+
+
+def fresh_db(path) -> str:
+    initialize_db(Settings(google_key='', secret_key='', db_path=str(path), sql_init=init_script))
+    return str(path)
+
+
+def rows(path, query: str) -> list[tuple]:
+    with sqlite_cm(path) as db:
+        return db.execute(query).fetchall()
+
+
+def test_export_import_round_trip(tmp_path):
+    source = fresh_db(tmp_path / 'source.sqlite')
+    with sqlite_cm(source) as db:
+        db.executemany("INSERT INTO users(email, hash) VALUES (?, 'hash');", (('one@user.db', ), ('two@user.db', )))
+        db.executemany(
+            "INSERT INTO posts(author_id, title, body) VALUES (?, ?, 'Searchable body');",
+            ((1, 'First'), (2, 'Second'), (1, 'Third'))
+        )
+        # gaps in the ids have to survive the trip
+        db.execute("DELETE FROM posts WHERE rowid = 2;")
+        db.execute("INSERT INTO comments(author_id, post_id, body, status) VALUES (2, 1, 'Approved comment', 1);")
+        db.execute("INSERT INTO comments(author_id, post_id, body, reply_to) VALUES (1, 1, 'Reply', 1);")
+        db.execute("INSERT INTO comments(author_id, post_id, body, status) VALUES (1, 3, 'Rejected', 2);")
+        db.commit()
+
+    snapshot = tmp_path / 'snapshot.ndjson.gz'
+    with open_stream(str(snapshot), 'w') as out:
+        assert export_dataset(source, out) == {'user': 2, 'post': 2, 'comment': 3}
+    target = fresh_db(tmp_path / 'target.sqlite')
+    with open_stream(str(snapshot), 'r') as lines:
+        assert import_dataset(target, lines) == {'user': 2, 'post': 2, 'comment': 3}
+
+    for query in (
+        "SELECT rowid, * FROM users;",
+        "SELECT rowid, * FROM posts;",
+        "SELECT rowid, * FROM comments;",
+        SCHEMA,
+    ):
+        assert rows(source, query) == rows(target, query)
+    assert rows(target, "SELECT rowid FROM posts_fts WHERE posts_fts MATCH 'searchable';") == [(1, ), (3, )]
+    assert rows(target, "SELECT rowid FROM comments_fts WHERE comments_fts MATCH 'comment';") == [(1, )]
+    # the restored triggers keep working
+    with sqlite_cm(target) as db:
+        db.execute("INSERT INTO comments(author_id, post_id, body, reply_to, status) VALUES (2, 3, 'New', 3, 1);")
+        db.commit()
+    assert rows(target, "SELECT reply_count FROM comments WHERE rowid = 3;") == [(1, )]
+    assert rows(target, "SELECT approved_comment_count FROM posts WHERE rowid = 3;") == [(1, )]
+
+
+def test_import_rejects(tmp_path):
+    target = fresh_db(tmp_path / 'target.sqlite')
+    with pytest.raises(ValueError, match='Line 2'):
+        import_dataset(target, io.StringIO(
+            '{"type":"user","user_id":1,"email":"a@user.db","hash":"h","autoreply_timeout":null}\n'
+            '{"type":"post","post_id":1}\n'
+        ))
+    # the load stopped, the schema is back in place
+    assert rows(target, SCHEMA) == rows(fresh_db(tmp_path / 'fresh.sqlite'), SCHEMA)
+    with sqlite_cm(target) as db:
+        db.execute("INSERT INTO users(email, hash) VALUES ('b@user.db', 'h');")
+        db.commit()
+    with pytest.raises(ValueError, match='without users'):
+        import_dataset(target, [])
+    duplicates = tmp_path / 'duplicates.sqlite'
+    with pytest.raises(sqlite3.IntegrityError):
+        import_dataset(fresh_db(duplicates), [
+            '{"type":"user","user_id":1,"email":"a@user.db","hash":"h","autoreply_timeout":null}',
+            '{"type":"user","user_id":2,"email":"a@user.db","hash":"h","autoreply_timeout":null}',
+        ])
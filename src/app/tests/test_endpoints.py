@@ -1,10 +1,19 @@
+import time
 import pytest
 import jwt
 from datetime import datetime
+from functools import partial
+from threading import Timer
 
 from fastapi.testclient import TestClient
 
+from ..archive import comment_archive
+from ..comment_classifier import comment_modifier
+from ..db import prepare_db, sqlite_cm
 from ..main import app
+from ..moderation import moderation_stats
+from ..repositories import SqliteArchiveRepository, SqliteChangeRepository
+from ..schemas import CommentStatus
 from .conftest import test_user_data, test_settings
 
 
@@ -519,3 +528,632 @@ def test_edit_comment_with_replies():
     )
     assert response.status_code == 418
     assert response.json() == {"detail": "Comment is already replied"}
+
+
+# Test editing a comment of another user
+def test_edit_other_user_comment():
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+
+    response = client.patch(
+        "/comments/4/",
+        json={"body": "Editing another user's comment"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 403
+    assert client.get("/comments/4").json()["body"] == 'Body of comment 4 from some other author.'
+
+    response = client.patch(
+        "/comments/9999/",
+        json={"body": "Editing a missing comment"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 404
+
+
+# Test returning written entities inline instead of redirecting
+def test_prefer_return_representation():
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Prefer": "respond-async, return=representation"}
+
+    response = client.post(
+        "/posts/",
+        json={"title": "Inline post", "body": "Returned without a redirect"},
+        headers=headers,
+        follow_redirects=False,
+    )
+    assert response.status_code == 201
+    assert response.headers["Preference-Applied"] == "return=representation"
+    post = response.json()
+    assert response.headers["Location"] == f"/posts/{post['post_id']}/"
+    assert post["title"] == "Inline post"
+    assert post["author"]["email"] == test_user_data["username"]
+    assert client.get(response.headers["Location"]).json() == post
+
+    response = client.post(
+        f"/comments/by_post/{post['post_id']}",
+        json={"body": "Inline comment"},
+        headers=headers,
+        follow_redirects=False,
+    )
+    assert response.status_code == 201
+    comment = response.json()
+    assert response.headers["Location"] == f"/comments/{comment['comment_id']}"
+    assert comment["post_id"] == post["post_id"]
+
+    response = client.patch(
+        f"/comments/{comment['comment_id']}/",
+        json={"body": "Edited inline comment"},
+        headers=headers,
+        follow_redirects=False,
+    )
+    assert response.status_code == 200
+    assert response.json()["body"] == "Edited inline comment"
+
+    response = client.patch(
+        f"/comments/{comment['comment_id']}/",
+        json={"body": "Edited again"},
+        headers={"Authorization": f"Bearer {token}"},
+        follow_redirects=False,
+    )
+    assert response.status_code == 303
+    assert "Preference-Applied" not in response.headers
+
+
+# Test reading a post with its approved comment tree
+def test_post_thread(plain_sql_connection):
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Prefer": "return=representation"}
+
+    post = client.post("/posts/", json={"title": "Thread", "body": "Post with a thread"}, headers=headers).json()
+    first = client.post(f"/comments/by_post/{post['post_id']}", json={"body": "First"}, headers=headers).json()
+    second = client.post(f"/comments/by_post/{post['post_id']}", json={"body": "Second"}, headers=headers).json()
+    reply = client.post(f"/comments/{first['comment_id']}/reply", json={"body": "Reply"}, headers=headers).json()
+    hidden = client.post(f"/comments/by_post/{post['post_id']}", json={"body": "Hidden"}, headers=headers).json()
+    plain_sql_connection.execute(
+        "UPDATE comments SET status = ? WHERE rowid IN (?, ?, ?);",
+        (CommentStatus.APPROVED, first['comment_id'], second['comment_id'], reply['comment_id'])
+    )
+    plain_sql_connection.execute(
+        "UPDATE comments SET status = ? WHERE rowid = ?;",
+        (CommentStatus.REJECTED, hidden['comment_id'])
+    )
+    plain_sql_connection.connection.commit()
+
+    response = client.get(f"/posts/{post['post_id']}/thread")
+    assert response.status_code == 200
+    thread = response.json()
+    assert thread["title"] == "Thread"
+    assert list(thread["authors"]) == [str(post["author_id"])]
+    assert [c["comment_id"] for c in thread["comments"]] == [first["comment_id"], second["comment_id"]]
+    assert [r["body"] for r in thread["comments"][0]["replies"]] == ["Reply"]
+    assert thread["truncated"] is False
+
+    thread = client.get(f"/posts/{post['post_id']}/thread", params={"depth": 0}).json()
+    assert thread["comments"][0]["replies"] == []
+    assert thread["truncated"] is True
+
+    thread = client.get(f"/posts/{post['post_id']}/thread", params={"limit": 1}).json()
+    assert [c["body"] for c in thread["comments"]] == ["First"]
+    assert thread["truncated"] is True
+
+    assert client.get("/posts/9999/thread").status_code == 404
+    assert client.get(f"/posts/{post['post_id']}/thread", params={"depth": 100}).status_code == 422
+
+
+# Test batch reads and writes
+def test_batch_endpoints():
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/posts/batch", params={"ids": [2, 9999, 1]})
+    assert response.status_code == 200
+    items = response.json()
+    assert [(item["id"], item["status"]) for item in items] == [(2, 200), (9999, 404), (1, 200)]
+    assert items[0]["entity"]["post_id"] == 2
+    assert items[1]["entity"] is None
+    assert client.get("/posts/batch", params={"ids": list(range(1001))}).status_code == 422
+
+    response = client.post(
+        "/posts/batch",
+        json=[{"title": f"Batch post {i}", "body": "Created in bulk"} for i in range(3)],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    posts = [item["entity"] for item in response.json()]
+    assert [post["title"] for post in posts] == ["Batch post 0", "Batch post 1", "Batch post 2"]
+    assert len({post["post_id"] for post in posts}) == 3
+
+    response = client.post(
+        "/comments/batch",
+        json=[
+            {"post_id": posts[0]["post_id"], "body": "Bulk comment 1"},
+            {"post_id": 9999, "body": "Bulk comment to nowhere"},
+            {"post_id": posts[1]["post_id"], "body": "Bulk comment 2"},
+        ],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    items = response.json()
+    assert [item["status"] for item in items] == [201, 404, 201]
+    assert items[0]["entity"]["post_id"] == posts[0]["post_id"]
+    assert items[2]["entity"]["body"] == "Bulk comment 2"
+    assert items[1]["entity"] is None
+
+    comment_ids = [items[0]["id"], 9999, items[2]["id"]]
+    items = client.get("/comments/batch", params={"ids": comment_ids}).json()
+    assert [item["status"] for item in items] == [200, 404, 200]
+    assert items[2]["entity"]["body"] == "Bulk comment 2"
+
+
+# Test compact list responses with a shared authors map
+def test_compact_lists():
+    full = client.get("/comments/by_author/1").json()
+    compact = client.get("/comments/by_author/1", params={"compact": True}).json()
+    assert list(compact["authors"]) == ["1"]
+    assert compact["authors"]["1"] == full[0]["author"]
+    assert len(compact["comments"]) == len(full)
+    assert "author" not in compact["comments"][0]
+    assert compact["comments"][0]["author_id"] == 1
+
+    response = client.get("/comments/by_post/2")
+    compact_response = client.get("/comments/by_post/2", params={"compact": True})
+    assert compact_response.headers["ETag"] != response.headers["ETag"]
+    assert [c["comment_id"] for c in compact_response.json()["comments"]] == [c["comment_id"] for c in response.json()]
+    assert client.get("/comments/by_post/2").json() == response.json()
+    response = client.get(
+        "/comments/by_post/2",
+        params={"compact": True},
+        headers={"If-None-Match": compact_response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+    posts = client.get("/posts/", params={"compact": True}).json()
+    assert {str(post["author_id"]) for post in posts["posts"]} == set(posts["authors"])
+
+
+# Test sparse fieldsets on list endpoints
+def test_sparse_fields():
+    posts = client.get("/posts/", params={"fields": "title,created_at"}).json()
+    assert posts and set(posts[0]) == {"post_id", "title", "created_at"}
+
+    full = client.get("/comments/by_author/1").json()
+    comments = client.get("/comments/by_author/1", params={"fields": "body, author"}).json()
+    assert set(comments[0]) == {"comment_id", "body", "author"}
+    assert comments[0]["author"] == full[0]["author"]
+    assert [c["body"] for c in comments] == [c["body"] for c in full]
+
+    response = client.get("/comments/by_post/2", params={"fields": "status"})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != client.get("/comments/by_post/2").headers["ETag"]
+    assert all(set(c) == {"comment_id", "status"} for c in response.json())
+
+    response = client.get("/posts/", params={"fields": "title,hash"})
+    assert response.status_code == 422
+    assert "hash" in response.json()["detail"]
+    assert client.get("/posts/", params={"fields": "title", "compact": True}).status_code == 400
+
+
+# Test full-text search over posts and approved comments
+def test_search(plain_sql_connection):
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Prefer": "return=representation"}
+
+    post = client.post(
+        "/posts/",
+        json={"title": "Xylophone tuning", "body": "How to tune a xylophone at home"},
+        headers=headers,
+    ).json()
+    approved = client.post(
+        f"/comments/by_post/{post['post_id']}", json={"body": "My xylophone sounds great"}, headers=headers,
+    ).json()
+    hidden = client.post(
+        f"/comments/by_post/{post['post_id']}", json={"body": "Hidden xylophone remark"}, headers=headers,
+    ).json()
+    comment_modifier(approved["comment_id"], True, test_settings.db_path)
+
+    results = client.get("/search/", params={"q": "xylophone"}).json()
+    assert {(hit["entity"], hit["id"]) for hit in results["hits"]} == {
+        ("post", post["post_id"]),
+        ("comment", approved["comment_id"]),
+    }
+    assert "next_offset" not in results
+    comment_hit = next(hit for hit in results["hits"] if hit["entity"] == "comment")
+    assert comment_hit["post_id"] == post["post_id"]
+    assert "<mark>xylophone</mark>" in comment_hit["snippet"]
+
+    results = client.get("/search/", params={"q": "xyloph*", "scope": "posts"}).json()
+    assert [hit["title"] for hit in results["hits"]] == ["Xylophone tuning"]
+
+    page = client.get("/search/", params={"q": "xylophone", "limit": 1}).json()
+    assert len(page["hits"]) == 1 and page["next_offset"] == 1
+
+    comment_modifier(approved["comment_id"], False, test_settings.db_path)
+    comment_modifier(hidden["comment_id"], True, test_settings.db_path)
+    results = client.get("/search/", params={"q": "xylophone", "scope": "comments"}).json()
+    assert [hit["id"] for hit in results["hits"]] == [hidden["comment_id"]]
+
+    assert client.get("/search/", params={"q": 'title: "OR NEAR('}).status_code == 200
+    assert client.get("/search/", params={"q": "  * "}).status_code == 422
+
+
+# Test counters kept by triggers
+def test_reply_and_approved_comment_counters():
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Prefer": "return=representation"}
+
+    post = client.post("/posts/", json={"title": "Counted", "body": "Post with counters"}, headers=headers).json()
+    assert post["approved_comment_count"] == 0
+    first = client.post(f"/comments/by_post/{post['post_id']}", json={"body": "First"}, headers=headers).json()
+    second = client.post(f"/comments/by_post/{post['post_id']}", json={"body": "Second"}, headers=headers).json()
+    assert first["reply_count"] == 0
+
+    comment_modifier(first["comment_id"], True, test_settings.db_path)
+    comment_modifier(second["comment_id"], True, test_settings.db_path)
+    comment_modifier(second["comment_id"], False, test_settings.db_path)
+    counted = client.get(f"/posts/{post['post_id']}").json()
+    assert counted["approved_comment_count"] == 1
+    # counters do not count as edits
+    assert counted["updated_at"] == post["updated_at"]
+
+    client.post(f"/comments/{first['comment_id']}/reply", json={"body": "Reply"}, headers=headers)
+    replied = client.get(f"/comments/{first['comment_id']}").json()
+    assert replied["reply_count"] == 1
+    response = client.patch(f"/comments/{first['comment_id']}/", json={"body": "Edited"}, headers=headers)
+    assert response.status_code == 418
+
+    fields = client.get("/posts/", params={"fields": "approved_comment_count"}).json()
+    assert {"post_id": post["post_id"], "approved_comment_count": 1} in fields
+
+
+# Test epoch timestamps, their text compatibility and date range statistics
+def test_epoch_timestamps(plain_sql_connection):
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+
+    plain_sql_connection.execute(
+        "INSERT INTO comments(author_id, post_id, body, created_at, updated_at) "
+        "VALUES (1, 3, 'Comment from a text writer', '2001-02-03 04:05:06', 981173106);"
+    )
+    plain_sql_connection.connection.commit()
+    row = plain_sql_connection.execute(
+        "SELECT rowid, created_at, updated_at FROM comments WHERE body = 'Comment from a text writer';"
+    ).fetchone()
+    comment_id = row[0]
+    assert row[1:] == (981173106, 981173106)
+    assert plain_sql_connection.execute(
+        "SELECT created_at FROM comments_iso WHERE comment_id = ?;", (comment_id, )
+    ).fetchone() == ('2001-02-03 04:05:06', )
+
+    comment = client.get(f"/comments/{comment_id}").json()
+    assert datetime.fromisoformat(comment["created_at"]) == datetime.fromisoformat("2001-02-03T04:05:06+00:00")
+
+    response = client.get(
+        "/admin/comments-daily-breakdown/",
+        params={"date_from": "2001-02-03", "date_to": "2001-02-03"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.json() == [{"date": "2001-02-03", "not_reviewed": 1}]
+    response = client.get(
+        "/admin/comments-daily-breakdown/",
+        params={"date_from": "2001-02-04", "date_to": "2001-02-10"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.json() == []
+
+
+# Test moving comments to the archive database and back
+def test_comment_archive(plain_sql_connection, tmp_path):
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Prefer": "return=representation"}
+
+    post = client.post("/posts/", json={"title": "Archived", "body": "Post with archived comments"}, headers=headers).json()
+    rejected, old, _ = (
+        client.post(f"/comments/by_post/{post['post_id']}", json={"body": body}, headers=headers).json()
+        for body in ("Rejected comment", "Old comment", "Newest comment")
+    )
+    comment_modifier(rejected["comment_id"], False, test_settings.db_path)
+    comment_modifier(old["comment_id"], True, test_settings.db_path)
+    plain_sql_connection.execute("UPDATE comments SET created_at = 1000 WHERE rowid = ?;", (old["comment_id"], ))
+    plain_sql_connection.connection.commit()
+
+    archive_repo = SqliteArchiveRepository(db=prepare_db(test_settings))
+    assert archive_repo.archive_comments(None, True, 100) == []
+    comment_archive.configure(tmp_path / "archive.sqlite", True, None, 100)
+    try:
+        moved = archive_repo.archive_comments(None, True, 100)
+        assert rejected["comment_id"] in moved
+        assert archive_repo.archive_comments(2000, False, 100) == [old["comment_id"]]
+        assert plain_sql_connection.execute(
+            "SELECT count(*) FROM comments WHERE rowid IN (?, ?);", (rejected["comment_id"], old["comment_id"])
+        ).fetchone() == (0, )
+        assert client.get(f"/posts/{post['post_id']}").json()["approved_comment_count"] == 0
+
+        # single reads fall back to the archive
+        response = client.get(f"/comments/{old['comment_id']}")
+        assert response.status_code == 200
+        assert response.json()["body"] == "Old comment"
+        assert client.get(f"/comments/{old['comment_id']}", headers={"If-None-Match": response.headers["etag"]}) \
+            .status_code == 304
+        assert client.get(f"/comments/by_post/{post['post_id']}").json() == []
+
+        response = client.post(f"/admin/comments/{old['comment_id']}/restore", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["comment_id"] == old["comment_id"]
+        assert client.get(f"/posts/{post['post_id']}").json()["approved_comment_count"] == 1
+        assert [c["comment_id"] for c in client.get(f"/comments/by_post/{post['post_id']}").json()] \
+            == [old["comment_id"]]
+        assert client.post(f"/admin/comments/{old['comment_id']}/restore", headers=headers).status_code == 404
+        assert sorted(archive_repo.restore_comments(moved)) == sorted(moved)
+    finally:
+        comment_archive.configure(None, True, None, 500)
+    assert client.get(f"/comments/{rejected['comment_id']}").json()["status"] == CommentStatus.REJECTED
+
+
+# Test commenting on a missing post
+def test_add_comment_to_missing_post():
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+
+    response = client.post(
+        "/comments/by_post/9999",
+        json={"body": "Nowhere to go"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 404
+    response = client.post(
+        "/comments/9999/reply",
+        json={"body": "Nowhere to go"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 404
+
+
+# Test that the autoreply deadline follows the post author's timeout
+def test_comment_autoreply_deadline(plain_sql_connection):
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    plain_sql_connection.execute("UPDATE users SET autoreply_timeout = 30 WHERE rowid = 2;")
+    plain_sql_connection.connection.commit()
+
+    response = client.post(
+        "/comments/by_post/4",
+        json={"body": "Comment waiting for an autoreply"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    comment_id = response.json()["comment_id"]
+    autoreply_at, = plain_sql_connection.execute(
+        "SELECT autoreply_at FROM comments WHERE rowid = ?;",
+        (comment_id, )
+    ).fetchone()
+    assert abs(autoreply_at - (time.time() + 30 * 60)) < 5
+
+
+# Test waiting for a moderation verdict of a fresh comment
+def test_comment_verdict_long_poll():
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+
+    comment_response = client.post(
+        "/comments/by_post/1",
+        json={"body": "Comment waiting for a verdict."},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    comment_id = comment_response.json()["comment_id"]
+
+    response = client.get(f"/comments/{comment_id}/verdict")
+    assert response.status_code == 200
+    assert response.json() == {"comment_id": comment_id, "status": CommentStatus.NOT_REVIEWED}
+
+    Timer(0.2, comment_modifier, args=(comment_id, True, test_settings.db_path)).start()
+    response = client.get(f"/comments/{comment_id}/verdict", params={"wait": 5})
+    assert response.status_code == 200
+    assert response.json() == {"comment_id": comment_id, "status": CommentStatus.APPROVED}
+
+
+def test_comment_verdict_nonexistent_comment():
+    response = client.get("/comments/9999/verdict", params={"wait": 1})
+    assert response.status_code == 404
+
+
+def test_moderation_stats_endpoint():
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+
+    moderation_stats.record("blocklist", True, 0.001)
+    response = client.get(
+        "/admin/moderation-stats/",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    blocklist = response.json()["blocklist"]
+    assert blocklist["calls"] >= 1 and blocklist["hits"] >= 1
+    assert blocklist["avg_ms"] >= 0
+
+
+def test_moderation_stats_unauthorized():
+    response = client.get("/admin/moderation-stats/")
+    assert response.status_code == 401
+
+
+def test_stream_comments_to_nonexistent_post():
+    response = client.get("/comments/by_post/9999/stream")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Not found"}
+
+
+# Test following the change feed with a cursor
+def test_change_feed():
+    response = client.get("/changes/", params={"since": 0, "limit": 4})
+    assert response.status_code == 200
+    feed = response.json()
+    assert [(c["entity"], c["id"], c["op"]) for c in feed["changes"]] == [
+        ("post", 1, "insert"), ("post", 2, "insert"), ("post", 3, "insert"), ("post", 4, "insert"),
+    ]
+    assert "status" not in feed["changes"][0]
+
+    response = client.get("/changes/", params={"since": 1_000_000})
+    assert response.json() == {"changes": [], "next": 1_000_000}
+    cursor = client.get("/changes/", params={"since": 0, "limit": 1000}).json()["next"]
+
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    post_id = client.post(
+        "/posts/",
+        json={"title": "Change feed post", "body": "Change feed body"},
+        headers={"Authorization": f"Bearer {token}"}
+    ).json()["post_id"]
+    client.patch(
+        f"/posts/{post_id}/",
+        json={"title": "Change feed post", "body": "Edited change feed body"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    comment_id = client.post(
+        f"/comments/by_post/{post_id}",
+        json={"body": "Change feed comment"},
+        headers={"Authorization": f"Bearer {token}"}
+    ).json()["comment_id"]
+    comment_modifier(comment_id, False, test_settings.db_path)
+
+    response = client.get("/changes/", params={"since": cursor})
+    assert response.status_code == 200
+    feed = response.json()
+    assert [(c["entity"], c["id"], c["op"], c.get("status")) for c in feed["changes"]] == [
+        ("post", post_id, "insert", None),
+        ("post", post_id, "update", None),
+        ("comment", comment_id, "insert", CommentStatus.NOT_REVIEWED),
+        ("comment", comment_id, "status", CommentStatus.REJECTED),
+    ]
+    assert feed["next"] == feed["changes"][-1]["seq"]
+
+
+def test_change_feed_expired_cursor():
+    change_repo = SqliteChangeRepository(db=partial(sqlite_cm, db_path=test_settings.db_path))
+    latest = client.get("/changes/", params={"since": 0, "limit": 1000}).json()["next"]
+    assert change_repo.prune(older_than=int(time.time()) + 1) > 0
+
+    response = client.get("/changes/", params={"since": 0})
+    assert response.status_code == 410
+    response = client.get("/changes/", params={"since": latest})
+    assert response.status_code == 200
+    assert response.json() == {"changes": [], "next": latest}
+
+
+# Test conditional GET of a single post
+def test_get_post_conditional():
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    post_id = client.post(
+        "/posts/",
+        json={"title": "Conditional post", "body": "Conditional body"},
+        headers={"Authorization": f"Bearer {token}"}
+    ).json()["post_id"]
+
+    response = client.get(f"/posts/{post_id}/")
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+    assert etag.startswith('"')
+
+    response = client.get(f"/posts/{post_id}/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = client.get(f"/posts/{post_id}/", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    client.patch(
+        f"/posts/{post_id}/",
+        json={"title": "Conditional post", "body": "Edited within the same second"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    response = client.get(f"/posts/{post_id}/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["body"] == "Edited within the same second"
+
+
+def test_get_nonexistent_post_conditional():
+    response = client.get("/posts/9999/", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("url", ["/posts/", "/comments/by_post/1", "/comments/1"])
+def test_conditional_get_collections_and_comments(url):
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get(url, headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+    response = client.get(url, headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+# Test cached post comments are refreshed after moderation
+def test_comments_to_post_cache_invalidated_by_moderation():
+    response = client.post(
+        "/auth/token",
+        data=test_user_data
+    )
+    token = response.json()["access_token"]
+    comment_id = client.post(
+        "/comments/by_post/3",
+        json={"body": "Cached list comment"},
+        headers={"Authorization": f"Bearer {token}"}
+    ).json()["comment_id"]
+
+    before = client.get("/comments/by_post/3").json()
+    assert comment_id not in [c["comment_id"] for c in before]
+    comment_modifier(comment_id, True, test_settings.db_path)
+    after = client.get("/comments/by_post/3").json()
+    assert comment_id in [c["comment_id"] for c in after]
@@ -0,0 +1,85 @@
+import asyncio
+import json
+from functools import partial
+from threading import Thread
+
+import pytest
+
+from ..comment_classifier import comment_modifier
+from ..db import sqlite_cm
+from ..hub import CommentHub, comment_hub, format_event
+from ..repositories import SqliteCommentRepository
+from ..routes.comments import comment_events, publish_approved_comment
+from .conftest import db_path
+
+
+def test_format_event():
+    assert format_event('comment', '{"a": 1}', 5) == 'id: 5\nevent: comment\ndata: {"a": 1}\n\n'
+    assert format_event('evicted', 'one\ntwo') == 'event: evicted\ndata: one\ndata: two\n\n'
+
+
+def test_publish_from_another_thread():
+    async def scenario():
+        hub = CommentHub(buffer_size=4)
+        subscription = hub.subscribe(1)
+        other = hub.subscribe(2)
+        publisher = Thread(target=hub.publish, args=(1, 'message'))
+        publisher.start()
+        publisher.join()
+        assert await asyncio.wait_for(subscription.queue.get(), 1) == 'message'
+        assert other.queue.empty()
+        hub.unsubscribe(subscription)
+        hub.unsubscribe(other)
+        assert not hub.has_subscribers(1)
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_is_evicted():
+    async def scenario():
+        hub = CommentHub(buffer_size=2)
+        subscription = hub.subscribe(1)
+        for i in range(3):
+            hub.publish(1, f'message {i}')
+        await asyncio.sleep(0)
+        assert subscription.evicted
+        assert not hub.has_subscribers(1)
+        received = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+        assert received == ['message 0', 'message 1', None]
+
+    asyncio.run(scenario())
+
+
+def test_comment_events_stream():
+    async def scenario():
+        hub = comment_hub
+        subscription = hub.subscribe(1)
+        events = comment_events(subscription, heartbeat=0.05)
+        assert await anext(events) == ': keep-alive\n\n'
+        hub.publish(1, format_event('comment', '{}', 3))
+        assert await anext(events) == 'id: 3\nevent: comment\ndata: {}\n\n'
+        subscription.queue.put_nowait(None)
+        assert (await anext(events)).startswith('event: evicted')
+        with pytest.raises(StopAsyncIteration):
+            await anext(events)
+        assert not hub.has_subscribers(1)
+
+    asyncio.run(scenario())
+
+
+def test_approved_comment_reaches_the_feed():
+    comment_repo = SqliteCommentRepository(db=partial(sqlite_cm, db_path=db_path))
+    on_approved = partial(publish_approved_comment, comment_repo=comment_repo)
+
+    async def scenario():
+        subscription = comment_hub.subscribe(1)
+        try:
+            await asyncio.to_thread(comment_modifier, 1, True, db_path, on_approved)
+            message = await asyncio.wait_for(subscription.queue.get(), 1)
+        finally:
+            comment_hub.unsubscribe(subscription)
+        lines = message.splitlines()
+        assert lines[:2] == ['id: 1', 'event: comment']
+        assert json.loads(lines[2][len('data: '):])['comment_id'] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+import sqlite3
+from datetime import datetime, timezone
+from functools import partial
+
+from fastapi.testclient import TestClient
+
+from ..db import initialize_db, sqlite_cm
+from ..main import app
+from ..maintenance import seconds_until
+from ..repositories import SqliteMaintenanceRepository
+from ..settings import Settings
+from .conftest import db_path, init_script, test_user_data
+
+client = TestClient(app)
+
+
+def test_seconds_until():
+    now = datetime(2024, 5, 1, 3, 30, tzinfo=timezone.utc)
+    assert seconds_until(4, now) == 30 * 60
+    assert seconds_until(3, now) == 23 * 60 * 60 + 30 * 60
+    assert seconds_until(3, now.replace(minute=0)) == 24 * 60 * 60
+
+
+def test_maintenance_run(tmp_path):
+    path = tmp_path / 'legacy.sqlite'
+    # a table created before init.sql leaves auto_vacuum off, as in databases from older releases
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE legacy(value);")
+    conn.close()
+    initialize_db(Settings(google_key='', secret_key='', db_path=str(path), sql_init=init_script))
+    repo = SqliteMaintenanceRepository(db=partial(sqlite_cm, db_path=path))
+
+    first = repo.run(analysis_limit=100)
+    assert first.full_vacuum and first.wal_frames_checkpointed is None
+    with sqlite_cm(path) as db:
+        assert db.execute("PRAGMA auto_vacuum;").fetchone() == (2, )
+        db.execute("INSERT INTO users(email, hash) VALUES ('maintenance@user.db', '');")
+        db.executemany(
+            "INSERT INTO posts(author_id, title, body) VALUES (1, 'Title', ?);",
+            (('x' * 2000, ) for _ in range(200))
+        )
+        db.commit()
+        db.execute("DELETE FROM posts;")
+        db.commit()
+        assert db.execute("PRAGMA freelist_count;").fetchone()[0] > 0
+
+    second = repo.run(analysis_limit=100)
+    assert not second.full_vacuum
+    assert second.pages_reclaimed == second.pages_before - second.pages_after > 0
+    with sqlite_cm(path) as db:
+        assert db.execute("PRAGMA freelist_count;").fetchone() == (0, )
+        assert db.execute("SELECT count(*) FROM sqlite_stat1;").fetchone()[0] > 0
+    assert [run.run_id for run in repo.recent(10)] == [second.run_id, first.run_id]
+
+
+def test_maintenance_runs_endpoint():
+    SqliteMaintenanceRepository(db=partial(sqlite_cm, db_path=db_path)).run(analysis_limit=100)
+    token = client.post("/auth/token", data=test_user_data).json()["access_token"]
+    response = client.get("/admin/maintenance/", params={"limit": 1}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    runs = response.json()
+    assert len(runs) == 1 and runs[0]["duration"] >= 0
+    assert client.get("/admin/maintenance/").status_code == 401
@@ -0,0 +1,131 @@
+from fastapi.testclient import TestClient
+
+from ..cache import response_cache, POST, POST_COMMENTS
+from ..comment_classifier import comment_modifier
+from ..db import initialize_db, sqlite_cm
+from ..main import app
+from ..repositories import (
+    MemoryAuthRepository,
+    MemoryCommentRepository,
+    MemoryPostRepository,
+    MemoryUserRepository,
+    SqliteAuthRepository,
+    SqliteCommentRepository,
+    SqlitePostRepository,
+    SqliteUserRepository,
+)
+from ..repositories.exceptions import AlreadyExists, Conflict, NoEntry, NotOwner
+from ..repositories.memory.store import MemoryStore, memory_store
+from ..schemas import CommentStatus, Post
+from ..settings import Settings, get_settings
+from .conftest import init_script, test_settings
+
+
+def run_scenario(auth, users, posts, comments, set_status) -> dict:
+    auth.register_user('first@user.db', 'hash')
+    auth.register_user('second@user.db', 'hash')
+    try:
+        auth.register_user('first@user.db', 'hash')
+    except AlreadyExists:
+        pass
+    user_id, _ = auth.get_user_credentials('first@user.db')
+    author = users.save(users.get(user_id).model_copy(update={'autoreply_timeout': 5}))
+    first = posts.save(Post(author=author, author_id=author.user_id, title='First', body='Body'))
+    bulk = posts.add_many(2, [('Second', 'Body'), ('Third', 'Body')])
+    edited = posts.edit(first.post_id, 1, 'First edited', 'Body')
+    outcomes = []
+    for call in (lambda: posts.edit(first.post_id, 2, 'Theft', ''), lambda: posts.get(10 ** 6)):
+        try:
+            call()
+        except (NotOwner, NoEntry) as err:
+            outcomes.append(type(err).__name__)
+
+    comment = comments.add_to_post(first.post_id, 2, 'Comment')
+    reply = comments.add_reply(comment.comment_id, 1, 'Reply')
+    added = comments.add_many(2, [(bulk[0].post_id, 'Bulk'), (10 ** 6, 'Missing')])
+    for call in (
+            lambda: comments.add_reply(reply.comment_id, 1, 'Nested'),
+            lambda: comments.edit_body(comment.comment_id, 2, 'Late edit'),
+            lambda: comments.edit_body(comment.comment_id, 1, 'Not mine'),
+            lambda: comments.add_to_post(10 ** 6, 1, 'Nowhere'),
+    ):
+        try:
+            call()
+        except (Conflict, NotOwner, NoEntry) as err:
+            outcomes.append(type(err).__name__)
+    for comment_id in (comment.comment_id, reply.comment_id, added[0].comment_id):
+        set_status(comment_id, CommentStatus.APPROVED)
+    set_status(added[0].comment_id, CommentStatus.REJECTED)
+    # due autoreplies wait for their deadline
+    due_before = comments.get_comments_to_reply()
+    comments.post_autoreply(comment.comment_id, 'Automatic', first.post_id, 1)
+
+    thread = posts.get_thread(first.post_id, max_depth=0, max_comments=10)
+    return {
+        'outcomes': outcomes,
+        'authors': [post.author.email for post in posts.get_many([p.post_id for p in bulk])],
+        'titles': [post.title for post in posts.all()],
+        'fields': posts.all_fields(('post_id', 'approved_comment_count', 'author')),
+        'by_author': [post.post_id for post in posts.get_by_author(2)],
+        'edited': (edited.title, edited.author.email),
+        'added': [c is not None and c.post_id for c in added],
+        'post_comments': [(c.comment_id, c.reply_count) for c in comments.get_by_post(first.post_id)],
+        'comment_fields': comments.get_by_author_fields(2, ('comment_id', 'status', 'reply_to')),
+        'counts': posts.get(first.post_id).approved_comment_count,
+        'replied': (comments.has_replies(comment.comment_id), comments.has_replies(reply.comment_id)),
+        'due_before': due_before,
+        'comment': comments.get(comment.comment_id).model_dump(exclude={'created_at', 'updated_at'}),
+        'thread': (thread.truncated, [c.comment_id for c in thread.comments], sorted(thread.authors)),
+        'stats': [(status, count) for _, status, count in comments.get_stats_by_date('2000-01-01', '2100-01-01')],
+    }
+
+
+def test_memory_backend_matches_sqlite(tmp_path):
+    settings = Settings(google_key='', secret_key='', db_path=str(tmp_path / 'main.sqlite'), sql_init=init_script)
+    initialize_db(settings)
+
+    def db(**kwargs):
+        return sqlite_cm(settings.db_path, **kwargs)
+
+    def sqlite_status(comment_id, status):
+        with db() as conn:
+            conn.execute("UPDATE comments SET status = ? WHERE rowid = ?;", (int(status), comment_id))
+            conn.commit()
+
+    expected = run_scenario(
+        SqliteAuthRepository(db), SqliteUserRepository(db), SqlitePostRepository(db), SqliteCommentRepository(db),
+        sqlite_status,
+    )
+    store = MemoryStore()
+    result = run_scenario(
+        MemoryAuthRepository(store), MemoryUserRepository(store), MemoryPostRepository(store),
+        MemoryCommentRepository(store), store.set_comment_status,
+    )
+    assert result == expected
+    assert expected['outcomes'] == ['NotOwner', 'NoEntry', 'Conflict', 'Conflict', 'NotOwner', 'NoEntry']
+
+
+def test_memory_backend_endpoints():
+    memory_settings = test_settings.model_copy(update={'storage_backend': 'memory'})
+    app.dependency_overrides[get_settings] = lambda: memory_settings
+    memory_store.clear()
+    try:
+        client = TestClient(app)
+        credentials = {'username': 'memory@user.db', 'password': '12345678Aa!'}
+        registration = {'email': credentials['username'], 'password': credentials['password']}
+        assert client.post('/auth/register', json=registration).status_code == 200
+        token = client.post('/auth/token', data=credentials).json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        post = client.post('/posts/', json={'title': 'In memory', 'body': 'Body'}, headers=headers).json()
+        comment = client.post(f"/comments/by_post/{post['post_id']}", json={'body': 'Hello'}, headers=headers).json()
+        comment_modifier(comment['comment_id'], True, '', set_status=memory_store.set_comment_status)
+        response = client.get(f"/comments/by_post/{post['post_id']}")
+        assert [c['body'] for c in response.json()] == ['Hello']
+        response = client.get(f"/posts/{post['post_id']}/")
+        assert response.json()['approved_comment_count'] == 1
+        with sqlite_cm(test_settings.db_path) as db:
+            assert db.execute("SELECT 1 FROM users WHERE email = ?;", (credentials['username'], )).fetchone() is None
+    finally:
+        app.dependency_overrides[get_settings] = lambda: test_settings
+        response_cache.invalidate(*((key, post_id) for key in (POST, POST_COMMENTS) for post_id in memory_store.posts))
+        memory_store.clear()
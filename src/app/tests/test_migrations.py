@@ -0,0 +1,54 @@
+import sqlite3
+
+from ..db import initialize_db, MIGRATIONS
+from ..settings import Settings
+from .conftest import init_script
+
+
+def test_existing_database_is_migrated_once(tmp_path):
+    db_path = tmp_path / 'old.sqlite'
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        "CREATE TABLE posts(author_id INTEGER, title TEXT, body TEXT, "
+        "   created_at TEXT NOT NULL DEFAULT current_timestamp, "
+        "   updated_at TEXT NOT NULL DEFAULT current_timestamp); "
+        "CREATE TABLE comments(author_id INTEGER, reply_to INTEGER, post_id INTEGER, body TEXT NOT NULL, "
+        "   status INTEGER NOT NULL DEFAULT 0, "
+        "   created_at TEXT NOT NULL DEFAULT current_timestamp, "
+        "   updated_at TEXT NOT NULL DEFAULT current_timestamp, autoreply_at INTEGER); "
+        "INSERT INTO posts(author_id, title, body, created_at) "
+        "VALUES (1, 'Old post', 'Written before search', '2024-03-01 12:00:00'); "
+        "INSERT INTO comments(author_id, post_id, body, status) "
+        "VALUES (1, 1, 'Old approved comment', 1), (1, 1, 'Old pending comment', 0); "
+        "INSERT INTO comments(author_id, reply_to, post_id, body) VALUES (1, 1, 1, 'Old reply');"
+    )
+    conn.close()
+    settings = Settings(google_key='', secret_key='', db_path=db_path, sql_init=init_script)
+
+    initialize_db(settings)
+    initialize_db(settings)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version;").fetchone() == (len(MIGRATIONS), )
+    assert conn.execute("SELECT rowid FROM posts_fts WHERE posts_fts MATCH 'search';").fetchall() == [(1, )]
+    assert conn.execute("SELECT rowid FROM comments_fts WHERE comments_fts MATCH 'old';").fetchall() == [(1, )]
+    assert conn.execute("SELECT approved_comment_count FROM posts;").fetchall() == [(1, )]
+    assert conn.execute("SELECT reply_count FROM comments ORDER BY rowid;").fetchall() == [(1, ), (0, ), (0, )]
+    assert conn.execute("SELECT created_at, typeof(updated_at) FROM posts;").fetchall() == [(1709294400, 'integer')]
+    assert conn.execute("SELECT created_at FROM posts_iso;").fetchall() == [('2024-03-01 12:00:00', )]
+    # the rebuilt tables got their indexes and triggers back
+    names = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'posts';")}
+    assert {'posts_created_index', 'posts_updated_at', 'posts_fts_insert', 'posts_insert_log'} <= names
+    conn.execute("INSERT INTO comments(author_id, post_id, body, status) VALUES (1, 1, 'New approved', 1);")
+    assert conn.execute("SELECT approved_comment_count FROM posts;").fetchall() == [(2, )]
+    conn.close()
+
+
+def test_fresh_database_skips_migrations(tmp_path):
+    settings = Settings(google_key='', secret_key='', db_path=tmp_path / 'new.sqlite', sql_init=init_script)
+    initialize_db(settings)
+    initialize_db(settings)
+
+    conn = sqlite3.connect(settings.db_path)
+    assert conn.execute("PRAGMA user_version;").fetchone() == (len(MIGRATIONS), )
+    conn.close()
@@ -0,0 +1,189 @@
+import pytest
+
+from pydantic import ValidationError
+
+from queue import SimpleQueue
+
+from ..comment_classifier import (
+    classify_undecided,
+    next_tasks,
+    split_windows,
+    WindowedClassifier,
+    REENCODE_HEADROOM,
+)
+from ..moderation import (
+    AuthorAllowlistStage,
+    BlocklistStage,
+    ModerationPipeline,
+    ModerationStats,
+    ModerationTask,
+    RepeatStage,
+    ShortTextStage,
+    post_author_lookup,
+)
+from ..settings import Settings
+from .conftest import db_path
+
+
+def make_pipeline() -> ModerationPipeline:
+    return ModerationPipeline(
+        stages=[
+            BlocklistStage(['darn', 'heck']),
+            ShortTextStage(['thanks', '+1', 'great post']),
+            RepeatStage(),
+            AuthorAllowlistStage({42}, lambda post_id: 7),
+        ],
+        stats=ModerationStats(),
+    )
+
+
+def test_prefilter_decisions():
+    pipeline = make_pipeline()
+    assert pipeline.prefilter(ModerationTask(1, 'Long text from a trusted author', 42, 1)) is True
+    assert pipeline.prefilter(ModerationTask(2, 'Long text from the post author', 7, 1)) is True
+    assert pipeline.prefilter(ModerationTask(3, 'thanks!', 1, 1)) is True
+    assert pipeline.prefilter(ModerationTask(4, 'Great  post!!', 1, 1)) is True
+    assert pipeline.prefilter(ModerationTask(5, '!!!', 1, 1)) is True
+    assert pipeline.prefilter(ModerationTask(6, 'What the HECK', 1, 1)) is False
+    assert pipeline.prefilter(ModerationTask(7, 'This needs the model to decide', 1, 1)) is None
+
+
+@pytest.mark.parametrize('text', ['you idiot', 'kill yourself', 'die, loser!', 'thanks, idiot'])
+def test_short_insults_reach_the_model(text):
+    assert make_pipeline().prefilter(ModerationTask(1, text, 1, 1)) is None
+
+
+def test_blocklist_applies_to_allowed_authors():
+    pipeline = make_pipeline()
+    assert pipeline.prefilter(ModerationTask(1, 'heck of a post', 42, 1)) is False
+    assert pipeline.prefilter(ModerationTask(2, 'heck of a post', 7, 1)) is False
+
+
+def test_autoreplies_skip_author_allowlist():
+    pipeline = make_pipeline()
+    task = ModerationTask(1, 'Generated reply to the comment', 7, 1, 7, autoreply=True)
+    assert pipeline.prefilter(task) is None
+    assert pipeline.prefilter(task._replace(autoreply=False)) is True
+
+
+def test_repeat_stage_reuses_model_verdict():
+    pipeline = make_pipeline()
+    task = ModerationTask(1, 'This needs the model to decide', 1, 1)
+    assert pipeline.prefilter(task) is None
+    pipeline.learn(task, False, 0.5)
+    assert pipeline.prefilter(task._replace(comment_id=2, text='this  needs the model to DECIDE')) is False
+    stats = pipeline.stats.snapshot()
+    assert stats['repeat']['calls'] == 2
+    assert stats['repeat']['hits'] == 1
+    assert isinstance(stats['repeat']['avg_ms'], float) and stats['repeat']['avg_ms'] >= 0
+    assert stats['model'] == {'calls': 1, 'hits': 1, 'avg_ms': 500.0}
+
+
+def test_moderation_stats():
+    stats = ModerationStats()
+    assert stats.snapshot() == {}
+    stats.record('blocklist', False, 0.002)
+    stats.record('blocklist', True, 0.004)
+    assert stats.snapshot() == {'blocklist': {'calls': 2, 'hits': 1, 'avg_ms': 3.0}}
+
+
+def test_next_tasks_flattens_groups():
+    q = SimpleQueue()
+    q.put(ModerationTask(1, 'single', 1, 1))
+    q.put([ModerationTask(2, 'bulk', 1, 1), ModerationTask(3, 'bulk', 1, 1)])
+    q.put(ModerationTask(4, 'single', 1, 1))
+    assert [task.comment_id for task in next_tasks(q, 2)] == [1, 2, 3]
+    assert [task.comment_id for task in next_tasks(q, 2)] == [4]
+
+
+def test_post_author_lookup():
+    assert post_author_lookup(4, db_path) == 2
+    assert post_author_lookup(9999, db_path) is None
+
+
+def test_split_windows():
+    tokens = list(range(11))
+    assert split_windows(tokens, 16, 2, 4) == [tokens]
+    assert split_windows(tokens, 4, 1, 8) == [[0, 1, 2, 3], [3, 4, 5, 6], [6, 7, 8, 9], [7, 8, 9, 10]]
+    capped = split_windows(list(range(100)), 10, 0, 3)
+    assert [w[0] for w in capped] == [0, 40, 90]
+
+
+class FakeTokenizer:
+    model_max_length = 512
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def __call__(self, text, add_special_tokens=True):
+        return {'input_ids': text.split()}
+
+    def decode(self, token_ids):
+        return ' '.join(token_ids)
+
+
+class FakeDetector:
+    tokenizer = FakeTokenizer()
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts, **kwargs):
+        self.calls.append(texts)
+        if any('boom' in text for text in texts):
+            raise RuntimeError('model failure')
+        return [
+            [
+                {'label': 'OFFENSIVE', 'score': 0.9 if 'bad' in text else 0.1},
+                {'label': 'NEITHER', 'score': 0.1 if 'bad' in text else 0.9},
+            ]
+            for text in texts
+        ]
+
+
+def test_windowed_classifier_batches_and_uses_max_score():
+    detector = FakeDetector()
+    classifier = WindowedClassifier(detector, window_tokens=3, overlap=1, max_windows=10, batch_size=8)
+    results = classifier([
+        'a fine and long comment with bad ending',
+        'short and fine',
+    ])
+    assert results == [False, True]
+    assert len(detector.calls) == 1
+    assert len(detector.calls[0]) == 5
+
+
+def test_windows_fit_model_limit():
+    detector = FakeDetector()
+    classifier = WindowedClassifier(detector, window_tokens=1024, overlap=32, max_windows=10, batch_size=8)
+    assert classifier.window_tokens == 512 - 2 - REENCODE_HEADROOM
+    with pytest.raises(ValueError):
+        WindowedClassifier(detector, window_tokens=1024, overlap=600, max_windows=10, batch_size=8)
+
+
+def test_failed_batch_falls_back_to_single_comments():
+    detector = FakeDetector()
+    classifier = WindowedClassifier(detector, window_tokens=3, overlap=1, max_windows=10, batch_size=8)
+    tasks = [
+        ModerationTask(1, 'a bad comment', 1, 1),
+        ModerationTask(2, 'boom', 1, 1),
+        ModerationTask(3, 'fine', 1, 1),
+    ]
+    assert classify_undecided(classifier, tasks) == [False, None, True]
+
+
+@pytest.mark.parametrize(
+    ('window_tokens', 'overlap', 'max_windows'),
+    ((64, 64, 8), (64, 100, 8), (64, 8, 0), (0, 0, 8)),
+)
+def test_invalid_window_settings(window_tokens, overlap, max_windows):
+    with pytest.raises(ValidationError):
+        Settings(
+            google_key='',
+            secret_key='',
+            db_path='',
+            sql_init='',
+            classifier_window_tokens=window_tokens,
+            classifier_window_overlap=overlap,
+            classifier_max_windows=max_windows,
+        )
@@ -0,0 +1,79 @@
+import time
+
+from ..db import initialize_db, sqlite_cm
+from ..replica import Replica
+from ..repositories.factories import COMMENT_READS, COMMENT_WRITES, POST_READS, POST_WRITES
+from ..repositories.replica import ReplicaRepository
+from ..repositories.sqlite.comment import SqliteCommentRepository
+from ..repositories.sqlite.post import SqlitePostRepository
+from ..schemas import Post, User
+from ..settings import Settings
+from .conftest import init_script
+
+
+def test_replica_follows_primary(tmp_path):
+    settings = Settings(google_key='', secret_key='', db_path=str(tmp_path / 'main.sqlite'), sql_init=init_script)
+    initialize_db(settings)
+    with sqlite_cm(settings.db_path) as db:
+        db.execute("INSERT INTO users(email, hash) VALUES ('replica@user.db', '');")
+        db.commit()
+    replica = Replica(settings.db_path, max_lag=60)
+    replica.seed()
+
+    def primary_db(**kwargs):
+        return sqlite_cm(settings.db_path, **kwargs)
+
+    posts = ReplicaRepository(
+        SqlitePostRepository(primary_db), SqlitePostRepository(replica.connect), replica, POST_READS, POST_WRITES
+    )
+    comments = ReplicaRepository(
+        SqliteCommentRepository(primary_db), SqliteCommentRepository(replica.connect), replica,
+        COMMENT_READS, COMMENT_WRITES,
+    )
+    author = User(user_id=1, email='replica@user.db')
+    post = posts.save(Post(author=author, author_id=1, title='Replicated', body='Body'))
+    # writes through the repository are read back at once
+    assert [p.post_id for p in posts.all()] == [post.post_id]
+    with replica.connect() as db:
+        assert db.execute("SELECT title FROM posts;").fetchall() == [('Replicated', )]
+
+    comment = comments.add_to_post(post.post_id, 1, 'Replicated comment')
+    assert comments.get_by_post(post.post_id) == []
+    # moderation writes to the primary directly, the replica catches up on its own
+    with sqlite_cm(settings.db_path) as db:
+        db.execute("UPDATE comments SET status = 1 WHERE rowid = ?;", (comment.comment_id, ))
+        db.execute("UPDATE users SET email = 'renamed@user.db' WHERE rowid = 1;")
+        db.commit()
+    assert comments.get_by_post(post.post_id) == []
+    assert replica.catch_up() == 2
+    assert [c.comment_id for c in comments.get_by_post(post.post_id)] == [comment.comment_id]
+    replicated = posts.get(post.post_id)
+    assert replicated.approved_comment_count == 1 and replicated.author.email == 'renamed@user.db'
+    assert posts.all_version() == posts.primary.all_version()
+    assert comments.get_by_post_version(post.post_id) == comments.primary.get_by_post_version(post.post_id)
+
+    # reads past max_lag wait for the replay
+    replica.max_lag = 0.01
+    with sqlite_cm(settings.db_path) as db:
+        db.execute("DELETE FROM comments WHERE rowid = ?;", (comment.comment_id, ))
+        db.commit()
+    time.sleep(0.02)
+    assert comments.get_by_post(post.post_id) == []
+    assert posts.get(post.post_id).approved_comment_count == 0
+
+    # pruned entries the replica never saw make it start over from a fresh copy
+    with sqlite_cm(settings.db_path) as db:
+        db.execute("INSERT INTO posts(author_id, title, body) VALUES (1, 'Unseen', '');")
+        db.execute("DELETE FROM changes;")
+        db.execute("UPDATE posts SET title = 'Seen' WHERE title = 'Unseen';")
+        db.commit()
+    replica.catch_up()
+    assert sorted(p.title for p in posts.all()) == ['Replicated', 'Seen']
+
+    # entries the replica does not have yet come from the primary
+    replica.max_lag = 60
+    with sqlite_cm(settings.db_path) as db:
+        db.execute("INSERT INTO posts(author_id, title, body) VALUES (1, 'Fresh', '');")
+        fresh_id = db.execute("SELECT last_insert_rowid();").fetchone()[0]
+        db.commit()
+    assert posts.get(fresh_id).title == 'Fresh'
@@ -0,0 +1,94 @@
+import sqlite3
+
+from ..db import initialize_db, sqlite_cm
+from ..reshard import plan_moves, reshard
+from ..repositories.sharded import ShardedCommentRepository, ShardedPostRepository
+from ..repositories.shards import Shards
+from ..schemas import Post, User
+from ..settings import Settings
+from .conftest import init_script
+
+BUCKETS = 8
+
+
+def sharded_settings(tmp_path, shard_names) -> Settings:
+    return Settings(
+        google_key='',
+        secret_key='',
+        db_path=str(tmp_path / 'main.sqlite'),
+        sql_init=init_script,
+        storage_backend='sharded',
+        shard_paths=[str(tmp_path / name) for name in shard_names],
+        shard_buckets=BUCKETS,
+    )
+
+
+def repositories(settings: Settings) -> tuple[Shards, ShardedPostRepository, ShardedCommentRepository]:
+    layout = Shards()
+    layout.configure(settings.db_path, settings.shard_paths, settings.shard_buckets)
+    return layout, ShardedPostRepository(layout), ShardedCommentRepository(layout)
+
+
+def test_plan_moves():
+    owners = {bucket: 'a' if bucket % 2 else 'b' for bucket in range(8)}
+    moves = plan_moves(owners, ['a', 'b', 'c'])
+    assert len(moves) == 2 and set(moves.values()) == {'c'}
+    assert plan_moves(owners, ['a', 'b']) == {}
+    assert set(plan_moves(owners, ['a']).values()) == {'a'}
+
+
+def test_sharded_repositories_and_reshard(tmp_path):
+    settings = sharded_settings(tmp_path, ['one.sqlite', 'two.sqlite'])
+    initialize_db(settings)
+    with sqlite_cm(settings.db_path) as db:
+        db.execute("INSERT INTO users(email, hash) VALUES ('shard@user.db', '');")
+        db.commit()
+    layout, posts, comments = repositories(settings)
+    author = User(user_id=1, email='shard@user.db')
+
+    created = [posts.save(Post(author=author, author_id=1, title=f'Post {n}', body='Body')) for n in range(6)]
+    created += posts.add_many(1, [('Bulk post', 'Body')])
+    ids = [post.post_id for post in created]
+    assert len(set(ids)) == len(ids)
+    for post_id in ids:
+        with sqlite_cm(layout.path_of(post_id)) as db:
+            assert db.execute("SELECT 1 FROM posts WHERE rowid = ?;", (post_id, )).fetchone()
+    assert {post.post_id for post in posts.all()} == set(ids)
+    assert len(posts.get_by_author(1)) == len(ids)
+    assert [post['post_id'] for post in posts.all_fields(('post_id', ))] == [post.post_id for post in posts.all()]
+
+    comment = comments.add_to_post(ids[0], 1, 'Sharded comment')
+    reply = comments.add_reply(comment.comment_id, 1, 'Sharded reply')
+    bulk = comments.add_many(1, [(ids[1], 'Bulk comment'), (10 ** 6, 'Missing post'), (ids[2], 'Another')])
+    assert bulk[1] is None and [c.post_id for c in (bulk[0], bulk[2])] == [ids[1], ids[2]]
+    assert comment.comment_id % BUCKETS == reply.comment_id % BUCKETS == ids[0] % BUCKETS
+    with sqlite_cm(layout.route(comment.comment_id, settings.db_path)) as db:
+        db.execute("UPDATE comments SET status = 1 WHERE rowid IN (?, ?);", (comment.comment_id, reply.comment_id))
+        db.commit()
+    assert comments.get(comment.comment_id).reply_count == 1
+    comments.post_autoreply(bulk[0].comment_id, 'Automatic reply', ids[1], 1)
+    assert comments.get(bulk[0].comment_id).reply_count == 1
+    assert [c.comment_id for c in comments.get_by_post(ids[0])] == [comment.comment_id, reply.comment_id]
+    assert len(comments.get_by_author(1)) == 5
+    stats = comments.get_stats_by_date('2000-01-01', '2100-01-01')
+    assert sorted(status for _, status, _ in stats) == [0, 1] and sum(count for *_, count in stats) == 5
+
+    counters = {post.post_id: post.approved_comment_count for post in posts.all()}
+    replies = {c.comment_id: c.reply_count for c in comments.get_by_author(1)}
+    settings = sharded_settings(tmp_path, ['one.sqlite', 'two.sqlite', 'three.sqlite'])
+    assert reshard(settings) == 2
+    layout, posts, comments = repositories(settings)
+    assert sorted(layout.owners.values()).count(str(tmp_path / 'three.sqlite')) == 2
+    listed = posts.all()
+    assert sorted(post.post_id for post in listed) == sorted(ids)
+    assert all(newer.created_at >= older.created_at for newer, older in zip(listed, listed[1:]))
+    assert {post.post_id: post.approved_comment_count for post in listed} == counters
+    assert {c.comment_id: c.reply_count for c in comments.get_by_author(1)} == replies
+    assert comments.get(reply.comment_id).body == 'Sharded reply'
+    # every row sits only in the shard owning its bucket
+    for path in layout.paths:
+        owned = {bucket for bucket, owner in layout.owners.items() if owner == path}
+        conn = sqlite3.connect(path)
+        assert all(rowid % BUCKETS in owned for rowid, in conn.execute("SELECT rowid FROM posts;"))
+        assert all(rowid % BUCKETS in owned for rowid, in conn.execute("SELECT rowid FROM comments;"))
+        conn.close()
@@ -4,6 +4,7 @@ from typing import (
     Callable,
     TypeAlias,
     Any,
+    NamedTuple,
 )
 
 
@@ -13,4 +14,10 @@ from typing import (
 SQLiteExecutable: TypeAlias = sqlite3.Cursor | sqlite3.Connection
 RowFactoryType: TypeAlias = Callable[[SQLiteExecutable], tuple[Any, ...]]
 SQLiteContextManager: TypeAlias = Generator[sqlite3.Connection, None, None]
-CommentsAutoreplyData: TypeAlias = list[tuple[int, str, int, int]]
\ No newline at end of file
+CommentsAutoreplyData: TypeAlias = list[tuple[int, str, int, int]]
+
+
+class ResourceVersion(NamedTuple):
+    # epoch seconds
+    last_modified: int | None
+    fingerprint: tuple[Any, ...]
@@ -0,0 +1,40 @@
+import asyncio
+from collections import defaultdict
+from threading import Lock
+
+from .schemas import CommentStatus
+
+
+def _set_verdict(future: asyncio.Future, status: CommentStatus) -> None:
+    if not future.done():
+        future.set_result(status)
+
+
+class VerdictWaiters:
+    def __init__(self):
+        self._lock = Lock()
+        self._waiters: defaultdict[int, set[asyncio.Future]] = defaultdict(set)
+
+    def register(self, comment_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._waiters[comment_id].add(future)
+        return future
+
+    def discard(self, comment_id: int, future: asyncio.Future) -> None:
+        with self._lock:
+            waiters = self._waiters.get(comment_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[comment_id]
+
+    def resolve(self, comment_id: int, status: CommentStatus) -> None:
+        # called from the classifier thread, futures belong to the event loop
+        with self._lock:
+            waiters = self._waiters.pop(comment_id, ())
+        for future in waiters:
+            future.get_loop().call_soon_threadsafe(_set_verdict, future, status)
+
+
+comment_verdicts = VerdictWaiters()
@@ -1,3 +1,7 @@
+-- free pages go back to the file system in steps, takes effect on new databases only;
+-- maintenance switches older ones over
+PRAGMA auto_vacuum = INCREMENTAL;
+
 -- users table
 CREATE TABLE IF NOT EXISTS users (
     email TEXT NOT NULL,
@@ -12,18 +16,39 @@ CREATE TABLE IF NOT EXISTS posts (
     author_id INTEGER REFERENCES users(rowid) ON DELETE SET NULL,
     title TEXT,
     body TEXT,
-    created_at TEXT NOT NULL DEFAULT current_timestamp,
-    updated_at TEXT NOT NULL DEFAULT current_timestamp
+    created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+    updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+    approved_comment_count INTEGER NOT NULL DEFAULT 0
 );
-CREATE TRIGGER IF NOT EXISTS posts_updated_at
-AFTER UPDATE ON posts
-WHEN old.updated_at <> current_timestamp
+
+CREATE INDEX IF NOT EXISTS posts_created_index
+ON posts(created_at);
+
+-- counters are not edits, recreated so existing databases drop the version firing on any column
+DROP TRIGGER IF EXISTS posts_updated_at;
+CREATE TRIGGER posts_updated_at
+AFTER UPDATE OF author_id, title, body ON posts
+WHEN old.updated_at <> CAST(strftime('%s', 'now') AS INTEGER)
 BEGIN
     UPDATE posts
-    SET updated_at = current_timestamp
+    SET updated_at = CAST(strftime('%s', 'now') AS INTEGER)
     WHERE rowid = old.rowid;
 END;
 
+-- writers still sending ISO text get epoch seconds stored
+CREATE TRIGGER IF NOT EXISTS posts_text_timestamps
+AFTER INSERT ON posts
+WHEN typeof(new.created_at) = 'text' OR typeof(new.updated_at) = 'text'
+BEGIN
+    UPDATE posts
+    SET
+        created_at = CASE typeof(new.created_at)
+            WHEN 'text' THEN CAST(strftime('%s', new.created_at) AS INTEGER) ELSE new.created_at END,
+        updated_at = CASE typeof(new.updated_at)
+            WHEN 'text' THEN CAST(strftime('%s', new.updated_at) AS INTEGER) ELSE new.updated_at END
+    WHERE rowid = new.rowid;
+END;
+
 -- comments table
 CREATE TABLE IF NOT EXISTS comments(
     author_id INTEGER REFERENCES users(rowid) ON DELETE SET NULL,
@@ -31,19 +56,281 @@ CREATE TABLE IF NOT EXISTS comments(
     post_id INTEGER REFERENCES posts(rowid) ON DELETE SET NULL,
     body TEXT NOT NULL,
     status INTEGER NOT NULL DEFAULT 0,
-    created_at TEXT NOT NULL DEFAULT current_timestamp,
-    updated_at TEXT NOT NULL DEFAULT current_timestamp,
-    autoreply_at INTEGER
+    created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+    updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+    autoreply_at INTEGER,
+    reply_count INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE INDEX IF NOT EXISTS autoreply_index
 ON comments(autoreply_at);
 
-CREATE TRIGGER IF NOT EXISTS comments_updated_at
-AFTER UPDATE ON comments
-WHEN old.updated_at <> current_timestamp
+CREATE INDEX IF NOT EXISTS comments_post_index
+ON comments(post_id, status);
+
+CREATE INDEX IF NOT EXISTS comments_reply_index
+ON comments(reply_to);
+
+CREATE INDEX IF NOT EXISTS comments_created_index
+ON comments(created_at);
+
+DROP TRIGGER IF EXISTS comments_updated_at;
+CREATE TRIGGER comments_updated_at
+AFTER UPDATE OF author_id, reply_to, post_id, body, status, autoreply_at ON comments
+WHEN old.updated_at <> CAST(strftime('%s', 'now') AS INTEGER)
 BEGIN
     UPDATE comments
-    SET updated_at = current_timestamp
+    SET updated_at = CAST(strftime('%s', 'now') AS INTEGER)
     WHERE rowid = old.rowid;
 END;
+
+-- writers still sending ISO text get epoch seconds stored
+CREATE TRIGGER IF NOT EXISTS comments_text_timestamps
+AFTER INSERT ON comments
+WHEN typeof(new.created_at) = 'text' OR typeof(new.updated_at) = 'text'
+BEGIN
+    UPDATE comments
+    SET
+        created_at = CASE typeof(new.created_at)
+            WHEN 'text' THEN CAST(strftime('%s', new.created_at) AS INTEGER) ELSE new.created_at END,
+        updated_at = CASE typeof(new.updated_at)
+            WHEN 'text' THEN CAST(strftime('%s', new.updated_at) AS INTEGER) ELSE new.updated_at END
+    WHERE rowid = new.rowid;
+END;
+
+-- reply_count counts every reply, approved_comment_count only approved comments
+CREATE TRIGGER IF NOT EXISTS comments_insert_counters
+AFTER INSERT ON comments
+WHEN new.reply_to IS NOT NULL OR new.status = 1
+BEGIN
+    UPDATE comments
+    SET reply_count = reply_count + 1
+    WHERE rowid = new.reply_to;
+    UPDATE posts
+    SET approved_comment_count = approved_comment_count + 1
+    WHERE rowid = new.post_id AND new.status = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_update_counters
+AFTER UPDATE OF reply_to, post_id, status ON comments
+WHEN old.reply_to IS NOT new.reply_to
+    OR old.post_id IS NOT new.post_id
+    OR old.status IS NOT new.status
+BEGIN
+    UPDATE comments
+    SET reply_count = reply_count - 1
+    WHERE rowid = old.reply_to AND old.reply_to IS NOT new.reply_to;
+    UPDATE comments
+    SET reply_count = reply_count + 1
+    WHERE rowid = new.reply_to AND old.reply_to IS NOT new.reply_to;
+    UPDATE posts
+    SET approved_comment_count = approved_comment_count - 1
+    WHERE rowid = old.post_id AND old.status = 1;
+    UPDATE posts
+    SET approved_comment_count = approved_comment_count + 1
+    WHERE rowid = new.post_id AND new.status = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_delete_counters
+AFTER DELETE ON comments
+WHEN old.reply_to IS NOT NULL OR old.status = 1
+BEGIN
+    UPDATE comments
+    SET reply_count = reply_count - 1
+    WHERE rowid = old.reply_to;
+    UPDATE posts
+    SET approved_comment_count = approved_comment_count - 1
+    WHERE rowid = old.post_id AND old.status = 1;
+END;
+
+-- timestamps are epoch seconds, these keep the old TEXT shape for ad hoc readers
+CREATE VIEW IF NOT EXISTS posts_iso AS
+SELECT
+    rowid AS post_id,
+    author_id,
+    title,
+    body,
+    datetime(created_at, 'unixepoch') AS created_at,
+    datetime(updated_at, 'unixepoch') AS updated_at,
+    approved_comment_count
+FROM posts;
+
+CREATE VIEW IF NOT EXISTS comments_iso AS
+SELECT
+    rowid AS comment_id,
+    author_id,
+    reply_to,
+    post_id,
+    body,
+    status,
+    datetime(created_at, 'unixepoch') AS created_at,
+    datetime(updated_at, 'unixepoch') AS updated_at,
+    autoreply_at,
+    reply_count
+FROM comments;
+
+-- change log for incremental sync
+CREATE TABLE IF NOT EXISTS changes(
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    op TEXT NOT NULL,
+    status INTEGER,
+    changed_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+);
+
+CREATE INDEX IF NOT EXISTS changes_changed_at_index
+ON changes(changed_at);
+
+CREATE INDEX IF NOT EXISTS changes_entity_index
+ON changes(entity, entity_id);
+
+CREATE TRIGGER IF NOT EXISTS posts_insert_log
+AFTER INSERT ON posts
+BEGIN
+    INSERT INTO changes(entity, entity_id, op)
+    VALUES ('post', new.rowid, 'insert');
+END;
+
+-- updated_at bookkeeping does not touch these columns, so it is not logged
+CREATE TRIGGER IF NOT EXISTS posts_update_log
+AFTER UPDATE OF author_id, title, body ON posts
+WHEN old.author_id IS NOT new.author_id
+    OR old.title IS NOT new.title
+    OR old.body IS NOT new.body
+BEGIN
+    INSERT INTO changes(entity, entity_id, op)
+    VALUES ('post', new.rowid, 'update');
+END;
+
+CREATE TRIGGER IF NOT EXISTS posts_delete_log
+AFTER DELETE ON posts
+BEGIN
+    INSERT INTO changes(entity, entity_id, op)
+    VALUES ('post', old.rowid, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_insert_log
+AFTER INSERT ON comments
+BEGIN
+    INSERT INTO changes(entity, entity_id, op, status)
+    VALUES ('comment', new.rowid, 'insert', new.status);
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_update_log
+AFTER UPDATE OF body, reply_to, post_id ON comments
+WHEN old.body IS NOT new.body
+    OR old.reply_to IS NOT new.reply_to
+    OR old.post_id IS NOT new.post_id
+BEGIN
+    INSERT INTO changes(entity, entity_id, op, status)
+    VALUES ('comment', new.rowid, 'update', new.status);
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_status_log
+AFTER UPDATE OF status ON comments
+WHEN old.status IS NOT new.status
+BEGIN
+    INSERT INTO changes(entity, entity_id, op, status)
+    VALUES ('comment', new.rowid, 'status', new.status);
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_delete_log
+AFTER DELETE ON comments
+BEGIN
+    INSERT INTO changes(entity, entity_id, op, status)
+    VALUES ('comment', old.rowid, 'delete', old.status);
+END;
+
+-- users are logged for the in-memory replica only, the change feed leaves them out
+CREATE TRIGGER IF NOT EXISTS users_insert_log
+AFTER INSERT ON users
+BEGIN
+    INSERT INTO changes(entity, entity_id, op)
+    VALUES ('user', new.rowid, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_update_log
+AFTER UPDATE ON users
+BEGIN
+    INSERT INTO changes(entity, entity_id, op)
+    VALUES ('user', new.rowid, 'update');
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_delete_log
+AFTER DELETE ON users
+BEGIN
+    INSERT INTO changes(entity, entity_id, op)
+    VALUES ('user', old.rowid, 'delete');
+END;
+
+-- full-text search, external content tables read the text back from posts and comments
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts
+USING fts5(title, body, content='posts', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2');
+
+CREATE TRIGGER IF NOT EXISTS posts_fts_insert
+AFTER INSERT ON posts
+BEGIN
+    INSERT INTO posts_fts(rowid, title, body)
+    VALUES (new.rowid, new.title, new.body);
+END;
+
+CREATE TRIGGER IF NOT EXISTS posts_fts_update
+AFTER UPDATE OF title, body ON posts
+BEGIN
+    INSERT INTO posts_fts(posts_fts, rowid, title, body)
+    VALUES ('delete', old.rowid, old.title, old.body);
+    INSERT INTO posts_fts(rowid, title, body)
+    VALUES (new.rowid, new.title, new.body);
+END;
+
+CREATE TRIGGER IF NOT EXISTS posts_fts_delete
+AFTER DELETE ON posts
+BEGIN
+    INSERT INTO posts_fts(posts_fts, rowid, title, body)
+    VALUES ('delete', old.rowid, old.title, old.body);
+END;
+
+-- only approved comments are indexed, the status set by moderation moves them in and out;
+-- the table keeps its own copy of the text since it mirrors only part of comments
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts
+USING fts5(body, tokenize='unicode61 remove_diacritics 2');
+
+CREATE TRIGGER IF NOT EXISTS comments_fts_insert
+AFTER INSERT ON comments
+WHEN new.status = 1
+BEGIN
+    INSERT INTO comments_fts(rowid, body)
+    VALUES (new.rowid, new.body);
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_fts_update
+AFTER UPDATE OF body, status ON comments
+WHEN old.status = 1 OR new.status = 1
+BEGIN
+    DELETE FROM comments_fts
+    WHERE rowid = old.rowid;
+    INSERT INTO comments_fts(rowid, body)
+    SELECT new.rowid, new.body
+    WHERE new.status = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_fts_delete
+AFTER DELETE ON comments
+WHEN old.status = 1
+BEGIN
+    DELETE FROM comments_fts
+    WHERE rowid = old.rowid;
+END;
+
+-- one row per maintenance run, durations in seconds
+CREATE TABLE IF NOT EXISTS maintenance_runs(
+    run_id INTEGER PRIMARY KEY,
+    started_at INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    pages_before INTEGER NOT NULL,
+    pages_after INTEGER NOT NULL,
+    pages_reclaimed INTEGER NOT NULL,
+    wal_frames_checkpointed INTEGER,
+    full_vacuum INTEGER NOT NULL DEFAULT 0
+);